@@ -0,0 +1,141 @@
+"""
+Processamento em lote de imagens: OCR em um pool de processos e análises com o
+Gemini em um pool de threads de tamanho limitado. Cada resultado é gravado em
+results/<nome>-result.json assim que fica pronto.
+"""
+import os
+import json
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from image_processor import init_ocr_engine
+from frames import ocr_image_frames
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp')
+
+BATCH_OCR_WORKERS = int(os.getenv('BATCH_OCR_WORKERS', '0')) or os.cpu_count() or 1
+# Número máximo de imagens com chamadas ao Gemini em andamento ao mesmo tempo
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+
+
+def list_images(directory):
+    """Lista as imagens de um diretório (não recursivo), em ordem alfabética"""
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(directory, name))
+    )
+
+
+def result_path(output_dir, name):
+    """Mesmo padrão de nome usado por save_result.sh"""
+    return os.path.join(output_dir, f"{os.path.splitext(os.path.basename(name))[0]}-result.json")
+
+
+def _init_ocr_worker():
+    # Cada processo faz OCR de uma imagem por vez: basta uma engine carregada
+    init_ocr_engine(pool_size=1)
+
+
+def run_batch(items, analyze, lookup_cached=None, output_dir=None,
+              ocr_workers=BATCH_OCR_WORKERS, concurrency=BATCH_CONCURRENCY, on_result=None):
+    """
+    Analisa um conjunto de imagens.
+
+    Args:
+        items: lista de (nome, origem), onde origem são os bytes da imagem ou o caminho do arquivo
+        analyze: função (bytes, resultado do OCR) -> (dicionário de resposta, status HTTP)
+        lookup_cached: função opcional bytes -> resposta em cache ou None; imagens em cache
+            não passam pelo OCR nem pelo Gemini
+        output_dir: diretório onde gravar cada resultado (None = não grava)
+        ocr_workers: processos de OCR
+        concurrency: imagens em análise no Gemini ao mesmo tempo
+        on_result: callback chamado como (nome, resposta, status, progresso) a cada imagem concluída
+
+    Returns:
+        tuple: (resumo, {nome: resposta})
+    """
+    start = time.perf_counter()
+    total = len(items)
+    summary = {'total': total, 'succeeded': 0, 'failed': 0, 'cached': 0, 'failures': []}
+    results = {}
+    lock = threading.Lock()
+    # Limita imagens em memória/em andamento, mantendo os dois pools ocupados
+    max_in_flight = (ocr_workers + concurrency) * 2
+    slots = threading.BoundedSemaphore(max_in_flight)
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    def record(name, response_data, status_code):
+        if output_dir:
+            with open(result_path(output_dir, name), 'w', encoding='utf-8') as f:
+                json.dump(response_data, f, indent=4, sort_keys=True)
+        with lock:
+            results[name] = response_data
+            if status_code == 200:
+                summary['succeeded'] += 1
+                if response_data.get('cache') == 'hit':
+                    summary['cached'] += 1
+            else:
+                summary['failed'] += 1
+                summary['failures'].append({
+                    'image': name,
+                    'status_code': status_code,
+                    'error': response_data.get('error') or response_data.get('errors')
+                })
+            done = summary['succeeded'] + summary['failed']
+        if on_result:
+            on_result(name, response_data, status_code, {'done': done, 'total': total})
+
+    def analyze_step(name, image_data, ocr_future):
+        try:
+            response_data, status_code = analyze(image_data, ocr_future.result())
+        except Exception as e:
+            response_data, status_code = {'error': str(e)}, 500
+        try:
+            record(name, response_data, status_code)
+        finally:
+            slots.release()
+
+    ocr_pool = ProcessPoolExecutor(max_workers=ocr_workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_ocr_worker)
+    gemini_pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        for name, source in items:
+            slots.acquire()
+            try:
+                if isinstance(source, bytes):
+                    image_data = source
+                else:
+                    with open(source, 'rb') as f:
+                        image_data = f.read()
+
+                cached = lookup_cached(image_data) if lookup_cached else None
+                if cached is not None:
+                    record(name, cached, 200)
+                    slots.release()
+                    continue
+
+                ocr_future = ocr_pool.submit(ocr_image_frames, image_data)
+                ocr_future.add_done_callback(
+                    lambda future, name=name, image_data=image_data: gemini_pool.submit(analyze_step, name, image_data, future)
+                )
+            except Exception as e:
+                record(name, {'error': str(e)}, 500)
+                slots.release()
+
+        # Espera todas as imagens terminarem
+        for _ in range(max_in_flight):
+            slots.acquire()
+    finally:
+        ocr_pool.shutdown()
+        gemini_pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    summary['elapsed_seconds'] = round(elapsed, 2)
+    summary['images_per_second'] = round(total / elapsed, 3) if elapsed > 0 else None
+    return summary, results
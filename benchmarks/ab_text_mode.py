@@ -0,0 +1,98 @@
+"""
+Teste A/B da análise de texto: modo 'two_step' (limpeza + análise, duas chamadas)
+contra 'fused' (uma chamada). Mede a latência do ramo de texto e verifica se a
+resposta do modo fused continua compatível com o formato atual.
+
+Usa a API configurada no .env; para rodar sem chave, aponte GEMINI_BASE_URL para
+benchmarks/gemini_stub.py ou use --stub.
+
+Uso:
+    python3 benchmarks/ab_text_mode.py [--rounds 3] [--stub]
+"""
+import os
+import argparse
+
+from common import DATA_DIR, load_corpus, percentile
+
+
+def text_branch_ms(timings):
+    return sum(timings.get(stage, 0) for stage in ('ocr', 'cleanup', 'text_analysis'))
+
+
+def schema_problems(response_data, reference):
+    """Lista diferenças de formato em relação à resposta de referência (two_step)"""
+    problems = []
+    missing = set(reference) - set(response_data)
+    if missing:
+        problems.append(f"campos ausentes: {sorted(missing)}")
+    if not isinstance(response_data.get('comprehensible_text'), str) or not response_data['comprehensible_text']:
+        problems.append("comprehensible_text vazio")
+    analysis = response_data.get('text_analysis')
+    if not isinstance(analysis, dict):
+        problems.append("text_analysis não é um objeto")
+        return problems
+    if 'analise_geral' not in analysis:
+        problems.append("text_analysis sem analise_geral")
+    if 'comprehensible_text' in analysis:
+        problems.append("comprehensible_text dentro de text_analysis")
+    for key, value in analysis.items():
+        if not (key.startswith('frase_') or key == 'analise_geral'):
+            problems.append(f"chave inesperada em text_analysis: {key}")
+        elif not isinstance(value, dict) or not isinstance(value.get('probabilidade_de_ser_meme'), (int, float)):
+            problems.append(f"{key} sem probabilidade_de_ser_meme numérica")
+    if response_data.get('averages', {}).get('text_average') is None:
+        problems.append("text_average ausente")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='A/B dos modos de análise de texto')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--stub', action='store_true', help='usa o stub local do Gemini')
+    parser.add_argument('--data', default=DATA_DIR)
+    args = parser.parse_args()
+
+    if args.stub:
+        from gemini_stub import start_stub_server
+        _, base_url = start_stub_server(latency=0.3, jitter=0.05)
+        os.environ['GEMINI_BASE_URL'] = base_url
+        os.environ.setdefault('GOOG_API_KEY', 'stub')
+
+    from server import analysis_options, run_image_analysis
+    from image_processor import ocr_image
+
+    corpus = load_corpus(args.data)
+    latencies = {'two_step': [], 'fused': []}
+    calls = {'two_step': 0, 'fused': 0}
+    incompatible = 0
+    for name, data, _ in corpus:
+        # O OCR é o mesmo nos dois modos: calculado uma vez para isolar a diferença do Gemini
+        ocr_result = ocr_image(data)
+        for _ in range(args.rounds):
+            responses = {}
+            for mode in ('two_step', 'fused'):
+                # Sem a avaliação local do texto, para comparar os modos com as mesmas chamadas
+                options = analysis_options({'text_mode': mode, 'text_gate': 'false'})
+                response_data, status_code = run_image_analysis(data, options, use_cache=False, ocr_result=ocr_result)
+                responses[mode] = response_data
+                latencies[mode].append(text_branch_ms(response_data['timings']))
+                calls[mode] += 2 if mode == 'two_step' else 1
+            problems = schema_problems(responses['fused'], responses['two_step'])
+            if problems:
+                incompatible += 1
+                print(f"{name}: incompatível -> {problems}")
+            print(f"{name}: two_step={text_branch_ms(responses['two_step']['timings']):.0f}ms "
+                  f"(média {responses['two_step']['averages']['text_average']})  "
+                  f"fused={text_branch_ms(responses['fused']['timings']):.0f}ms "
+                  f"(média {responses['fused']['averages']['text_average']})")
+
+    print()
+    for mode in ('two_step', 'fused'):
+        print(f"{mode:9s} ramo de texto p50={percentile(latencies[mode], 50):.0f}ms "
+              f"p95={percentile(latencies[mode], 95):.0f}ms  chamadas de texto ao Gemini={calls[mode]}")
+    total = len(latencies['fused'])
+    print(f"Respostas fused compatíveis com o formato atual: {total - incompatible}/{total}")
+
+
+if __name__ == '__main__':
+    main()
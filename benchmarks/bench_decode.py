@@ -0,0 +1,164 @@
+"""
+Compara o uso de memória e CPU da preparação da imagem por requisição: o fluxo
+antigo (PIL decodifica para o OCR, OpenCV decodifica de novo em cores para o
+pré-processamento e mais uma vez em cinza para o hash perceptual) e a DecodedImage
+compartilhada (uma decodificação em cinza reaproveitada por todas as etapas).
+
+O Tesseract não é executado: mede-se apenas a entrada entregue ao OCR. Cada
+medição roda em um processo novo, para que o pico de RSS seja o da própria medição.
+Para cada imagem também é mostrada a diferença entre as saídas dos dois fluxos
+(cinza decodificado x BGR->cinza, e a imagem pré-processada enviada ao Gemini).
+
+Uso:
+    python3 benchmarks/bench_decode.py [--scales 1,3,6] [--repeat 3]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import shutil
+import tempfile
+import subprocess
+import tracemalloc
+
+os.environ.setdefault('GOOG_API_KEY', 'benchmark')
+
+import cv2
+import numpy as np
+
+from common import DATA_DIR, load_corpus
+
+
+def legacy_path(data):
+    import io
+    from PIL import Image
+    from phash_index import compute_phash
+
+    # OCR: imagem completa decodificada pelo PIL
+    ocr_input = Image.open(io.BytesIO(data))
+    ocr_input.load()
+
+    # Pré-processamento como antes: decodificação BGR e buffers intermediários (incluindo float64)
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    equalized = cv2.equalizeHist(gray)
+    normalized = cv2.normalize(equalized, np.zeros(equalized.shape), 0, 255, cv2.NORM_MINMAX)
+    processed = cv2.filter2D(normalized, -1, np.ones((3, 3), np.float32) / 9)
+
+    image_hash = compute_phash(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE))
+    return ocr_input, processed, image_hash
+
+
+def shared_path(data):
+    from image_processor import DecodedImage
+    from server import preprocess_image_array, compute_image_hash
+
+    image = DecodedImage(data)
+    ocr_input = image.pil_gray
+    processed, _ = preprocess_image_array(image)
+    image_hash = compute_image_hash(image)
+    return ocr_input, processed, image_hash
+
+
+def output_difference(data):
+    """Maior diferença (níveis de cinza) e fração de pixels diferentes entre os dois fluxos"""
+    from image_processor import DecodedImage
+
+    decoded = cv2.cvtColor(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2GRAY)
+    _, legacy, _ = legacy_path(data)
+    _, shared, _ = shared_path(data)
+    differences = {}
+    for stage, old, new in (('cinza', decoded, DecodedImage(data).gray), ('pré-proc.', legacy, shared)):
+        diff = np.abs(np.rint(old).astype(np.int16) - new.astype(np.int16))
+        differences[stage] = (int(diff.max()), float((diff > 0).mean()))
+    return differences
+
+
+def measure(mode, path, repeat):
+    """Executado no processo filho: imprime as medições em JSON"""
+    from pipeline import peak_rss_mb
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    func = legacy_path if mode == 'legacy' else shared_path
+    # Importa os módulos antes de medir, para que o RSS inicial já os inclua
+    import phash_index, server  # noqa: F401
+
+    rss_start = peak_rss_mb()
+    wall, cpu = [], []
+    for _ in range(repeat):
+        t, c = time.perf_counter(), time.process_time()
+        result = func(data)
+        wall.append(time.perf_counter() - t)
+        cpu.append(time.process_time() - c)
+        del result
+    rss_growth = peak_rss_mb() - rss_start
+
+    tracemalloc.start()
+    result = func(data)
+    allocated_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+
+    print(json.dumps({
+        'wall_ms': min(wall) * 1000,
+        'cpu_ms': min(cpu) * 1000,
+        'allocated_peak_mb': allocated_peak / (1024 * 1024),
+        'rss_growth_mb': rss_growth,
+    }))
+
+
+def run_child(mode, path, repeat):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, path, '--repeat', str(repeat)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da decodificação compartilhada da imagem')
+    parser.add_argument('--scales', default='1,3,6')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data', default=DATA_DIR)
+    parser.add_argument('--child', nargs=2, metavar=('MODO', 'ARQUIVO'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(*args.child, args.repeat)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='bench_decode_')
+
+    print(f"{'imagem':32s} {'modo':>7s} {'tempo':>9s} {'CPU':>9s} {'alocado':>10s} {'RSS':>9s}")
+    for scale in [float(s) for s in args.scales.split(',')]:
+        for name, data, image in load_corpus(args.data):
+            # Versões ampliadas simulam fotos e screenshots grandes; gravadas antes para não pesar no RSS do filho
+            path = os.path.join(args.data, name)
+            if scale != 1:
+                img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+                path = os.path.join(workdir, f"x{scale:g}-{name}")
+                cv2.imwrite(path, img)
+            width, height = image.size
+            label = f"{name} {round(width * scale)}x{round(height * scale)}"
+            measurements = {}
+            for mode in ('legacy', 'shared'):
+                measurements[mode] = run_child(mode, path, args.repeat)
+                m = measurements[mode]
+                print(f"{label:32s} {mode:>7s} {m['wall_ms']:7.1f}ms {m['cpu_ms']:7.1f}ms "
+                      f"{m['allocated_peak_mb']:8.1f}MB {m['rss_growth_mb']:7.1f}MB")
+            legacy, shared = measurements['legacy'], measurements['shared']
+            if legacy['allocated_peak_mb']:
+                print(f"{'':32s} {'':>7s} alocação de pico {1 - shared['allocated_peak_mb'] / legacy['allocated_peak_mb']:.0%} menor")
+            if scale == 1:
+                differences = output_difference(data)
+                print(f"{'':32s} {'':>7s} diferença das saídas: " + ', '.join(
+                    f"{stage} até {maximum} níveis em {fraction:.0%} dos pixels"
+                    for stage, (maximum, fraction) in differences.items()))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Compara o tratamento de imagens animadas em GIFs sintéticos com cenas e legendas
+conhecidas:
+
+- primeiro quadro: o comportamento anterior (cv2/PIL leem só o primeiro quadro)
+- todos os quadros: decodificar a animação inteira em uma lista antes de escolher
+- quadros-chave: frames.select_keyframes (um quadro de cada vez, deduplicação por
+  pHash e diferença de miniaturas)
+
+Para cada tamanho de animação: tempo de decodificação/seleção, pico de memória
+alocada (tracemalloc), quadros-chave encontrados x cenas reais e, com --ocr (requer o
+Tesseract), a fração das palavras das legendas recuperada pelo OCR.
+
+Uso:
+    python3 benchmarks/bench_frames.py [--frames 30,120,300] [--scenes 4] [--ocr]
+"""
+import io
+import time
+import argparse
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from common import text_scores
+from frames import select_keyframes, ocr_keyframes, FRAME_SCAN_LIMIT
+
+
+CAPTIONS = ['QUANDO VOCE ACORDA', 'E LEMBRA QUE HOJE', 'E SEGUNDA FEIRA', 'MAS ERA FERIADO',
+            'NINGUEM AVISOU', 'O CHEFE LIGOU']
+
+
+def make_animation(frame_count, scenes, size=(480, 360), seed=0):
+    """
+    GIF com scenes cenas de fundo diferente, cada uma com a sua legenda, e um pequeno
+    movimento entre os quadros da mesma cena.
+
+    Returns:
+        tuple: (bytes do GIF, legendas das cenas)
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    backgrounds = []
+    for _ in range(scenes):
+        noise = (rng.random((height // 12, width // 12, 3)) * 255).astype(np.uint8)
+        backgrounds.append(cv2.resize(noise, size, interpolation=cv2.INTER_CUBIC))
+    captions = [CAPTIONS[scene % len(CAPTIONS)] for scene in range(scenes)]
+    frames = []
+    for index in range(frame_count):
+        scene = index * scenes // frame_count
+        frame = np.roll(backgrounds[scene], index % 4, axis=1)
+        cv2.rectangle(frame, (0, height - 56), (width, height), (255, 255, 255), -1)
+        cv2.putText(frame, captions[scene], (12, height - 18), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+        frames.append(Image.fromarray(np.ascontiguousarray(frame[:, :, ::-1])))
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format='GIF', save_all=True, append_images=frames[1:], duration=60, loop=0)
+    return buffer.getvalue(), captions
+
+
+def first_frame(data):
+    image = Image.open(io.BytesIO(data))
+    return [np.asarray(image.convert('L'))]
+
+
+def all_frames(data):
+    image = Image.open(io.BytesIO(data))
+    frames = []
+    for index in range(image.n_frames):
+        image.seek(index)
+        frames.append(np.asarray(image.convert('L')))
+    return frames
+
+
+def measure(func, data):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(data)
+    elapsed = (time.perf_counter() - start) * 1000
+    peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def ocr_recall(frames, captions):
+    from image_processor import ocr_image
+    text = '\n'.join(ocr_image(frame)['text'] for frame in frames)
+    return text_scores(text, ' '.join(captions))['recall']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quadros-chave de imagens animadas')
+    parser.add_argument('--frames', default='30,120,300', help='quadros por animação')
+    parser.add_argument('--scenes', type=int, default=4, help='cenas (legendas diferentes) por animação')
+    parser.add_argument('--ocr', action='store_true', help='mede a recuperação das legendas pelo OCR')
+    args = parser.parse_args()
+
+    print(f"FRAME_SCAN_LIMIT={FRAME_SCAN_LIMIT}; {args.scenes} cenas por animação\n")
+    print(f"{'quadros':>7s} {'estratégia':16s} {'ms':>8s} {'pico MB':>8s} {'quadros usados':>15s}"
+          f"{' recall OCR' if args.ocr else ''}")
+    for frame_count in [int(value) for value in args.frames.split(',')]:
+        data, captions = make_animation(frame_count, args.scenes)
+        for label, func in (('primeiro quadro', first_frame), ('todos os quadros', all_frames)):
+            frames, elapsed, peak = measure(func, data)
+            recall = f" {ocr_recall(frames, captions):10.2f}" if args.ocr and len(frames) == 1 else ''
+            print(f"{frame_count:7d} {label:16s} {elapsed:8.1f} {peak:8.1f} {len(frames):15d}{recall}")
+            del frames
+        selection, elapsed, peak = measure(select_keyframes, data)
+        recall = ''
+        if args.ocr:
+            merged = ocr_keyframes(selection)
+            recall = f" {text_scores(merged['text'], ' '.join(captions))['recall']:10.2f}"
+        used = f"{len(selection.keyframes)} de {selection.scanned}"
+        print(f"{frame_count:7d} {'quadros-chave':16s} {elapsed:8.1f} {peak:8.1f} {used:>15s}{recall}"
+              f"{'  (truncado)' if selection.truncated else ''}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
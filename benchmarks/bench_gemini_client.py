@@ -0,0 +1,62 @@
+"""
+Exercita o GeminiClient contra o stub local: latência, retentativas, reutilização
+de conexões e circuit breaker com diferentes taxas de erro.
+
+Uso:
+    python3 benchmarks/bench_gemini_client.py [--calls 200] [--concurrency 8]
+"""
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from common import percentile
+from gemini_stub import start_stub_server
+from gemini_client import GeminiClient, CircuitOpenError
+
+
+def run_calls(client, calls, concurrency):
+    latencies = []
+    outcomes = {'ok': 0, 'error_status': 0, 'exception': 0, 'circuit_open': 0}
+
+    def call(_):
+        t = time.perf_counter()
+        try:
+            response = client.generate_content([{"text": "Analise o seguinte texto"}])
+            outcome = 'ok' if response.status_code == 200 else 'error_status'
+        except CircuitOpenError:
+            outcome = 'circuit_open'
+        except Exception:
+            outcome = 'exception'
+        return outcome, (time.perf_counter() - t) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for outcome, latency in pool.map(call, range(calls)):
+            outcomes[outcome] += 1
+            latencies.append(latency)
+    return outcomes, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do cliente Gemini contra o stub')
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    for error_rate in (0.0, 0.1, 0.3, 1.0):
+        server, base_url = start_stub_server(latency=args.latency, jitter=args.latency / 5,
+                                             error_rate=error_rate, retry_after=0)
+        client = GeminiClient('stub', base_url=base_url, backoff_base=0.01, backoff_max=0.1,
+                              pool_size=args.concurrency, recovery_timeout=60)
+        t = time.perf_counter()
+        outcomes, latencies = run_calls(client, args.calls, args.concurrency)
+        elapsed = time.perf_counter() - t
+        stub = server.state.snapshot()
+        server.shutdown()
+        print(f"erro={error_rate:4.0%}  {outcomes}  p50={percentile(latencies, 50):7.1f}ms "
+              f"p99={percentile(latencies, 99):7.1f}ms  {args.calls / elapsed:6.1f} chamadas/s  "
+              f"upstream={stub['requests']} req em {stub['connections']} conexões  cliente={client.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Mede o custo da instrumentação (metrics.py) em requisições reais ao /analyze-image,
+com o stub local do Gemini:
+- o tempo gasto dentro das operações das métricas é somado e comparado ao tempo
+  total das requisições, em análises completas (cache ignorado) e em respostas do
+  cache (o caso mais curto, em que o custo relativo é maior). A medição envolve
+  cada operação em um temporizador, que tem custo próprio: é um limite superior
+- A/B das respostas do cache com as métricas ativas e desativadas (mediana das rodadas)
+- tempo de geração do /metrics
+
+Uso:
+    python3 benchmarks/bench_metrics.py [--requests 20] [--rounds 10] [--latency 0.05]
+"""
+import io
+import os
+import time
+import argparse
+
+from common import DATA_DIR, load_corpus, percentile
+
+
+def instrument(classes, methods):
+    """Envolve os métodos das métricas para acumular o tempo gasto neles"""
+    spent = {'seconds': 0.0, 'calls': 0}
+    for cls in classes:
+        for name in methods:
+            if name not in vars(cls):
+                continue
+            original = vars(cls)[name]
+
+            def timed(*args, _original=original, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return _original(*args, **kwargs)
+                finally:
+                    spent['seconds'] += time.perf_counter() - start
+                    spent['calls'] += 1
+
+            setattr(cls, name, timed)
+    return spent
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Custo da instrumentação de métricas')
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=10, help='rodadas do A/B (cada uma com --requests requisições)')
+    parser.add_argument('--latency', type=float, default=0.05, help='latência do stub do Gemini (s)')
+    parser.add_argument('--data', default=DATA_DIR)
+    args = parser.parse_args()
+
+    from gemini_stub import start_stub_server
+    _, base_url = start_stub_server(latency=args.latency, jitter=0.0)
+    os.environ['GEMINI_BASE_URL'] = base_url
+    os.environ.setdefault('GOOG_API_KEY', 'stub')
+
+    import metrics
+    from server import app
+
+    client = app.test_client()
+    name, data, _ = load_corpus(args.data)[0]
+
+    def send(form=None):
+        return client.post('/analyze-image', data={'image': (io.BytesIO(data), name), **(form or {})})
+
+    send()
+    # A/B antes de instrumentar as métricas, alternando as rodadas para diluir variações da máquina
+    rounds = {True: [], False: []}
+    for _ in range(args.rounds):
+        for enabled in (True, False):
+            metrics.registry.enabled = enabled
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                send()
+            rounds[enabled].append((time.perf_counter() - start) / args.requests * 1000)
+    metrics.registry.enabled = True
+    with_metrics, without_metrics = percentile(rounds[True], 50), percentile(rounds[False], 50)
+
+    # Gauge.dec chama Gauge.inc: só inc é medido, para não contar duas vezes
+    spent = instrument((metrics.Counter, metrics.Gauge, metrics.Histogram), ('inc', 'set', 'observe'))
+
+    print(f"{name}, {args.requests} requisições por cenário, stub com {args.latency * 1000:.0f}ms\n")
+    print(f"{'cenário':10s} {'req p50':>9s} {'operações':>10s} {'métricas/req':>13s} {'custo':>8s}")
+    for label, form in (('completa', {'no_cache': 'true'}), ('cache', {})):
+        spent['seconds'] = 0.0
+        spent['calls'] = 0
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = send(form)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                print(f"Falha: {response.status_code} {response.get_json()}")
+                return
+        per_request = spent['seconds'] / args.requests
+        print(f"{label:10s} {percentile(latencies, 50) * 1000:7.2f}ms {spent['calls'] / args.requests:10.1f} "
+              f"{per_request * 1e6:11.1f}µs {per_request / (sum(latencies) / args.requests):8.3%}")
+
+    print(f"\nA/B (cache): {with_metrics:.3f}ms com métricas, {without_metrics:.3f}ms sem "
+          f"({(with_metrics - without_metrics) / without_metrics:+.2%})")
+
+    render_times = []
+    for _ in range(20):
+        start = time.perf_counter()
+        body = metrics.registry.render()
+        render_times.append((time.perf_counter() - start) * 1000)
+    print(f"/metrics: {len(body.splitlines())} linhas, geração p50 {percentile(render_times, 50):.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark do índice de quase-duplicatas: latência de busca com milhões de entradas e
+recall em versões perturbadas (redimensionadas, recomprimidas, com borda, recortadas)
+das imagens de data/.
+
+Uso:
+    python3 benchmarks/bench_near_duplicates.py [--entries 2000000] [--max-distance 6]
+"""
+import time
+import random
+import argparse
+
+import cv2
+import numpy as np
+
+from common import DATA_DIR, load_corpus, percentile
+from phash_index import NearDuplicateIndex, compute_phash, compute_dhash, hamming_distance
+
+
+def perturbations(img):
+    """Gera variações típicas de reposts a partir de uma imagem BGR"""
+    h, w = img.shape[:2]
+    yield 'resize_50', cv2.resize(img, (w // 2, h // 2), interpolation=cv2.INTER_AREA)
+    yield 'resize_150', cv2.resize(img, (w * 3 // 2, h * 3 // 2), interpolation=cv2.INTER_LINEAR)
+    for quality in (30, 60):
+        encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+        yield f'jpeg_q{quality}', cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    border = max(2, min(h, w) // 40)
+    yield 'border', cv2.copyMakeBorder(img, border, border, border, border, cv2.BORDER_CONSTANT, value=(255, 255, 255))
+    crop = max(1, min(h, w) // 50)
+    yield 'crop_2pct', img[crop:h - crop, crop:w - crop]
+    yield 'brightness', cv2.convertScaleAbs(img, alpha=1.0, beta=25)
+
+
+def to_gray(img):
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do índice de quase-duplicatas')
+    parser.add_argument('--entries', type=int, default=2_000_000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--max-distance', type=int, default=6)
+    parser.add_argument('--data', default=DATA_DIR)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.data)
+    originals = []
+    for name, data, _ in corpus:
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        originals.append((name, img))
+
+    # Recall e distâncias nas perturbações sintéticas
+    print(f"Recall (distância <= {args.max_distance}):")
+    for hash_name, hash_func in (('phash', compute_phash), ('dhash', compute_dhash)):
+        found = total = 0
+        worst = 0
+        for name, img in originals:
+            reference = hash_func(to_gray(img))
+            for kind, variant in perturbations(img):
+                distance = hamming_distance(reference, hash_func(to_gray(variant)))
+                worst = max(worst, distance)
+                total += 1
+                found += distance <= args.max_distance
+        if total:
+            print(f"  {hash_name}: {found}/{total} ({found / total:.1%}), maior distância={worst}")
+
+    # Latência com um índice grande (hashes aleatórios + imagens reais)
+    rng = random.Random(42)
+    index = NearDuplicateIndex(max_distance=args.max_distance)
+    t = time.perf_counter()
+    for i in range(args.entries):
+        index.add(rng.getrandbits(64), i)
+    real_hashes = []
+    for name, img in originals:
+        h = compute_phash(to_gray(img))
+        index.add(h, name)
+        real_hashes.append(h)
+    print(f"\nÍndice com {len(index)} entradas construído em {time.perf_counter() - t:.1f}s")
+
+    queries = []
+    for i in range(args.queries):
+        if real_hashes and i % 2 == 0:
+            # consulta próxima de uma imagem real (alguns bits trocados)
+            h = real_hashes[i % len(real_hashes)]
+            for bit in rng.sample(range(64), rng.randint(0, args.max_distance)):
+                h ^= 1 << bit
+            queries.append(h)
+        else:
+            queries.append(rng.getrandbits(64))
+
+    latencies = []
+    for h in queries:
+        t = time.perf_counter()
+        index.lookup(h)
+        latencies.append((time.perf_counter() - t) * 1000)
+    print(f"Busca: p50={percentile(latencies, 50):.3f}ms  p99={percentile(latencies, 99):.3f}ms  "
+          f"máx={max(latencies):.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
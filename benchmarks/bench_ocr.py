@@ -0,0 +1,63 @@
+"""
+Micro-benchmark dos backends de OCR (pytesseract x tesserocr) nas imagens de data/.
+
+Uso:
+    python3 benchmarks/bench_ocr.py [--iterations 5] [--workers N]
+"""
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from common import DATA_DIR, load_corpus, percentile
+from image_processor import create_ocr_engine, ocr_image
+
+
+def bench_backend(backend, images, iterations, workers):
+    start = time.perf_counter()
+    try:
+        engine = create_ocr_engine(backend)
+        load_time = time.perf_counter() - start
+        # Aquecimento
+        ocr_image(images[0][1], engine=engine)
+    except Exception as e:
+        print(f"{backend:12s} indisponível: {e}")
+        return
+
+    latencies = []
+    for _ in range(iterations):
+        for _, image in images:
+            t = time.perf_counter()
+            ocr_image(image, engine=engine)
+            latencies.append((time.perf_counter() - t) * 1000)
+
+    jobs = [image for _ in range(iterations) for _, image in images]
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda image: ocr_image(image, engine=engine), jobs))
+    throughput = len(jobs) / (time.perf_counter() - t)
+
+    print(f"{backend:12s} carga={load_time * 1000:8.1f}ms  "
+          f"p50={percentile(latencies, 50):8.1f}ms  p95={percentile(latencies, 95):8.1f}ms  "
+          f"throughput={throughput:6.2f} img/s ({workers} threads)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dos backends de OCR')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--data', default=DATA_DIR)
+    args = parser.parse_args()
+
+    images = [(name, image) for name, _, image in load_corpus(args.data)]
+    if not images:
+        print(f"Nenhuma imagem encontrada em {args.data}")
+        return
+
+    print(f"{len(images)} imagens x {args.iterations} iterações")
+    for backend in ('pytesseract', 'tesserocr'):
+        bench_backend(backend, images, args.iterations, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Benchmark do fluxo completo da análise (run_image_analysis: OCR, avaliação do
+texto, pré-processamento e as chamadas ao Gemini) sem chave de API, com as
+respostas do Gemini reproduzidas das fixtures gravadas (veja gemini_fixtures.py).
+
+1. Gravação, uma vez, com a chave de API (uma chamada real por etapa de cada imagem):
+    GOOG_API_KEY=... python3 benchmarks/bench_pipeline.py --record
+2. Reprodução, sem chave e sem rede:
+    python3 benchmarks/bench_pipeline.py [--latency recorded] [--synthetic 40] [--levels 1,4,16]
+
+Chamadas sem fixture (imagens sintéticas, prompts ou pré-processamento alterados
+desde a gravação) recebem as respostas do stub (gemini_stub.py) após
+--fallback-latency segundos; com --strict elas falham.
+
+Relatório:
+- por imagem de data/: tempo total, pico de memória alocada e comparação com
+  results/<nome>-result.json (similaridade do texto extraído e diferença das médias)
+- por etapa: p50/p95 do tempo em todas as execuções
+- por nível de concorrência, com data/ e o corpus sintético (--synthetic imagens
+  derivadas de data/, com legenda, escala e compressão aleatórias): vazão,
+  latência p50/p95 e pico de RSS do processo
+"""
+import os
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from common import ROOT_DIR, DATA_DIR, load_corpus, percentile, text_scores
+from gemini_stub import canned_reply
+
+
+CAPTION_WORDS = ['quando', 'você', 'percebe', 'que', 'amanhã', 'é', 'segunda', 'feira', 'ninguém',
+                 'eu', 'meu', 'chefe', 'explicando', 'o', 'código', 'de', 'novo', 'sexta']
+
+
+def synthetic_corpus(corpus, count, seed=0):
+    """
+    Variações das imagens de data/: escala, recorte, faixa de legenda (texto para o
+    OCR) e compressão aleatórias. Cada imagem é única, sem fixture gravada.
+    """
+    rng = random.Random(seed)
+    images = []
+    for index in range(count):
+        name, data, _ = corpus[index % len(corpus)]
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        scale = rng.uniform(0.6, 1.4)
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        height, width = image.shape[:2]
+        top, left = rng.randint(0, height // 10), rng.randint(0, width // 10)
+        image = image[top:height - rng.randint(0, height // 10), left:width - rng.randint(0, width // 10)]
+        height, width = image.shape[:2]
+        band = max(24, height // 8)
+        caption = ' '.join(rng.choice(CAPTION_WORDS) for _ in range(rng.randint(2, 6))).upper()
+        font_scale = band / 40
+        image = cv2.copyMakeBorder(image, band, 0, 0, 0, cv2.BORDER_CONSTANT, value=(255, 255, 255))
+        cv2.putText(image, caption, (8, int(band * 0.75)), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0),
+                    max(1, int(font_scale * 2)), cv2.LINE_AA)
+        if rng.random() < 0.7:
+            _, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, rng.randint(60, 95)])
+            extension = 'jpg'
+        else:
+            _, encoded = cv2.imencode('.png', image)
+            extension = 'png'
+        images.append((f"synthetic-{index:03d}-{os.path.splitext(name)[0]}.{extension}", encoded.tobytes()))
+    return images
+
+
+def load_stored_result(results_dir, name):
+    path = os.path.join(results_dir, f"{os.path.splitext(name)[0]}-result.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def average_diff(response_data, stored, key):
+    new, old = response_data['averages'].get(key), stored.get('averages', {}).get(key)
+    return f"{new - old:+6.1f}" if new is not None and old is not None else '     -'
+
+
+def accuracy_pass(server, corpus, options, results_dir, stage_timings):
+    """Cada imagem de data/ uma vez, com medição de memória, comparada ao resultado gravado"""
+    print(f"{'imagem':28s} {'total ms':>9s} {'aloc. MB':>9s} {'texto':>6s} "
+          f"{'Δtexto':>6s} {'Δimagem':>7s} {'Δfinal':>6s}")
+    for name, data, _ in corpus:
+        try:
+            response_data, status_code = server.run_image_analysis(data, options, use_cache=False, profile=True)
+        except Exception as e:
+            print(f"{name:28s} falhou: {e}")
+            continue
+        collect_timings(response_data, stage_timings)
+        stored = load_stored_result(results_dir, name)
+        comparison = '      sem resultado gravado'
+        if stored is not None:
+            similarity = text_scores(response_data['extracted_text'] or '', stored.get('extracted_text') or '')
+            comparison = (f"{similarity['similarity']:6.2f} {average_diff(response_data, stored, 'text_average')} "
+                          f"{average_diff(response_data, stored, 'image_average'):>7s} "
+                          f"{average_diff(response_data, stored, 'final_average')}")
+        print(f"{name:28s} {response_data['timings']['total']:9.1f} "
+              f"{response_data['resources']['allocated_peak_mb']:9.1f} {comparison}"
+              f"{'' if status_code == 200 else f'  (HTTP {status_code})'}")
+
+
+def collect_timings(response_data, stage_timings):
+    for stage, ms in response_data.get('timings', {}).items():
+        stage_timings.setdefault(stage, []).append(ms)
+
+
+def throughput(server, images, options, level, stage_timings):
+    from pipeline import peak_rss_mb
+
+    def analyze(item):
+        start = time.perf_counter()
+        try:
+            response_data, status_code = server.run_image_analysis(item[1], options, use_cache=False)
+        except Exception:
+            return None, time.perf_counter() - start
+        collect_timings(response_data, stage_timings)
+        return status_code, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=level) as pool:
+        results = list(pool.map(analyze, images))
+    elapsed = time.perf_counter() - start
+    latencies = [latency * 1000 for _, latency in results]
+    failures = sum(1 for status_code, _ in results if status_code != 200)
+    print(f"{level:11d} {len(images) / elapsed:8.2f} {percentile(latencies, 50):9.0f} "
+          f"{percentile(latencies, 95):9.0f} {failures:6d} {peak_rss_mb() or 0:11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do fluxo completo com respostas do Gemini gravadas')
+    parser.add_argument('--data', default=DATA_DIR)
+    parser.add_argument('--results', default=os.path.join(ROOT_DIR, 'results'),
+                        help='resultados gravados para comparação (<nome>-result.json)')
+    parser.add_argument('--fixtures', default=os.path.join(ROOT_DIR, 'fixtures', 'gemini'))
+    parser.add_argument('--record', action='store_true',
+                        help='chama a API (requer GOOG_API_KEY) e grava as respostas das imagens de --data')
+    parser.add_argument('--latency', default='recorded', help="latência simulada: 'recorded' ou segundos")
+    parser.add_argument('--fallback-latency', type=float, default=0.8,
+                        help='latência das respostas do stub para chamadas sem fixture')
+    parser.add_argument('--strict', action='store_true', help='chamadas sem fixture falham')
+    parser.add_argument('--synthetic', type=int, default=20, help='imagens sintéticas no teste de vazão')
+    parser.add_argument('--levels', default='1,4,16', help='níveis de concorrência')
+    parser.add_argument('--text-mode', default=None, help='two_step ou fused (padrão: TEXT_ANALYSIS_MODE)')
+    args = parser.parse_args()
+
+    # Lidos na importação do servidor e do cliente do Gemini
+    os.environ['GEMINI_FIXTURES'] = 'record' if args.record else 'replay'
+    os.environ['GEMINI_FIXTURES_DIR'] = args.fixtures
+    os.environ['GEMINI_REPLAY_LATENCY'] = args.latency
+    import server
+
+    store = server.gemini_client.fixtures
+    if not args.record and not args.strict:
+        store.fallback = canned_reply
+        store.fallback_latency = args.fallback_latency
+    options = server.analysis_options({'text_mode': args.text_mode} if args.text_mode else {})
+
+    corpus = load_corpus(args.data)
+    stage_timings = {}
+    print(f"Fixtures: {args.fixtures} ({'gravação' if args.record else 'reprodução'}, "
+          f"latência {args.latency}); modo do texto: {options['text_mode']}\n")
+    accuracy_pass(server, corpus, options, args.results, stage_timings)
+    print(f"\n{store.stats()}")
+    if args.record:
+        return
+
+    images = [(name, data) for name, data, _ in corpus] + synthetic_corpus(corpus, args.synthetic)
+    print(f"\nVazão com {len(images)} imagens ({len(corpus)} de data/, {args.synthetic} sintéticas):")
+    print(f"{'concorrência':>11s} {'img/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'falhas':>6s} {'pico RSS MB':>11s}")
+    for level in [int(level) for level in args.levels.split(',')]:
+        throughput(server, images, options, level, stage_timings)
+
+    print(f"\n{'etapa':16s} {'n':>5s} {'p50 ms':>9s} {'p95 ms':>9s}")
+    order = [*server.PIPELINE_STAGE_ORDER, 'decode', 'parse', 'total']
+    for stage in sorted(stage_timings, key=lambda stage: order.index(stage) if stage in order else len(order)):
+        values = stage_timings[stage]
+        print(f"{stage:16s} {len(values):5d} {percentile(values, 50):9.1f} {percentile(values, 95):9.1f}")
+    print(f"\n{store.stats()}")
+
+
+if __name__ == '__main__':
+    main()
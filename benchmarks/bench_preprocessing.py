@@ -0,0 +1,78 @@
+"""
+Compara os presets de pré-processamento do OCR (preprocessing.PRESETS) nas imagens
+de data/: tempo de cada etapa, tempo do OCR e qualidade do texto extraído.
+
+A referência de cada imagem é o 'comprehensible_text' do resultado salvo em
+results/<nome>-result.json (texto limpo pelo Gemini), ou um arquivo JSON
+{"imagem.png": "texto esperado"} passado em --references. Métricas:
+    similaridade  -> difflib.SequenceMatcher entre o texto do OCR e a referência
+    recall        -> fração das palavras da referência encontradas pelo OCR
+    ruído         -> fração das palavras do OCR que não estão na referência
+
+Uso:
+    python3 benchmarks/bench_preprocessing.py [--presets none,clahe,ocr_binary] [--iterations 3]
+"""
+import os
+import time
+import argparse
+
+from common import DATA_DIR, ROOT_DIR, load_corpus, load_references, percentile, text_scores
+from image_processor import DecodedImage, create_ocr_engine, ocr_image
+from preprocessing import PRESETS, PreprocessingPipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dos presets de pré-processamento do OCR')
+    parser.add_argument('--presets', default=','.join(PRESETS))
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--data', default=DATA_DIR)
+    parser.add_argument('--results', default=os.path.join(ROOT_DIR, 'results'))
+    parser.add_argument('--references', help='JSON {imagem: texto esperado}')
+    parser.add_argument('--backend', default='auto')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.data)
+    references = load_references(args.data, args.results, args.references)
+    engine = create_ocr_engine(args.backend)
+    try:
+        ocr_image(DecodedImage(corpus[0][1]), engine=engine, preprocessing=PreprocessingPipeline(), regions='off')
+    except Exception as e:
+        print(f"OCR indisponível: {e}")
+        return
+
+    print(f"{len(corpus)} imagens, {len(references)} com referência, {args.iterations} iterações\n")
+    print(f"{'preset':16s} {'pré p50':>9s} {'OCR p50':>9s} {'total p50':>10s} "
+          f"{'similaridade':>13s} {'recall':>7s} {'ruído':>7s}  etapas (ms, média)")
+    for preset in args.presets.split(','):
+        pipeline = PreprocessingPipeline.from_spec(preset)
+        preprocess_times, ocr_times, total_times = [], [], []
+        stage_totals = {}
+        scores = []
+        for name, data, _ in corpus:
+            image = DecodedImage(data)
+            image.gray
+            for iteration in range(args.iterations):
+                t = time.perf_counter()
+                result = ocr_image(image, engine=engine, preprocessing=pipeline, regions='off')
+                total = (time.perf_counter() - t) * 1000
+                stages = result.get('preprocessing', {}).get('stages', {})
+                preprocess_ms = sum(stages.values())
+                for stage, ms in stages.items():
+                    stage_totals[stage] = stage_totals.get(stage, 0.0) + ms
+                preprocess_times.append(preprocess_ms)
+                ocr_times.append(total - preprocess_ms)
+                total_times.append(total)
+            if name in references:
+                scores.append(text_scores(result['text'], references[name]))
+
+        runs = len(corpus) * args.iterations
+        mean = {key: sum(s[key] for s in scores) / len(scores) for key in ('similarity', 'recall', 'noise')} if scores else None
+        quality = (f"{mean['similarity']:13.3f} {mean['recall']:7.1%} {mean['noise']:7.1%}" if mean
+                   else f"{'-':>13s} {'-':>7s} {'-':>7s}")
+        stage_summary = ', '.join(f"{stage}={ms / runs:.1f}" for stage, ms in stage_totals.items()) or '-'
+        print(f"{preset:16s} {percentile(preprocess_times, 50):7.1f}ms {percentile(ocr_times, 50):7.1f}ms "
+              f"{percentile(total_times, 50):8.1f}ms {quality}  {stage_summary}")
+
+
+if __name__ == '__main__':
+    main()
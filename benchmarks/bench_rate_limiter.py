@@ -0,0 +1,115 @@
+"""
+Testa o limite de RPM/TPM e a junção de chamadas idênticas do GeminiClient contra
+o stub local com cota (gemini_stub.py --rpm/--tpm).
+
+1. Cota: vários processos, cada um com várias threads, fazem chamadas distintas
+   ao mesmo tempo, sem e com o limite compartilhado pelo arquivo de estado. Sem o
+   limite, o stub recusa parte das chamadas (429) e algumas falham mesmo após as
+   novas tentativas; com ele, as chamadas esperam a vez e a cota não é excedida.
+   Para o teste ser rápido, a janela da cota é de --window segundos em vez de 60.
+   A reserva de tokens usa GEMINI_OUTPUT_TOKENS_ESTIMATE para a resposta; as do
+   stub são curtas, então teste o TPM com um valor baixo (ex: 30).
+2. Junção: várias threads enviam a mesma chamada ao mesmo tempo (ex: a mesma
+   imagem enviada por vários usuários); com a junção, o stub recebe uma requisição.
+
+Uso:
+    python3 benchmarks/bench_rate_limiter.py [--processes 4] [--threads 8] [--calls 15]
+        [--rpm 40] [--tpm 0] [--window 5]
+"""
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from common import percentile
+from gemini_stub import start_stub_server
+
+
+def worker(base_url, index, threads, calls, limit, state_path):
+    from gemini_client import GeminiClient
+    from rate_limiter import RateLimiter, RateLimitTimeoutError
+
+    client = GeminiClient('stub', base_url=base_url, backoff_base=0.2, backoff_max=2, max_retries=3,
+                          failure_threshold=10 ** 6, rate_limit_file='')
+    if limit:
+        client.rate_limiter = RateLimiter(limit['rpm'], limit['tpm'], state_path, max_wait=120,
+                                          period=limit['window'])
+
+    def call(number):
+        start = time.perf_counter()
+        try:
+            response = client.generate_content([{"text": f"Analise o texto {index}-{number}"}], call='bench')
+            outcome = 'ok' if response.status_code == 200 else str(response.status_code)
+        except RateLimitTimeoutError:
+            outcome = 'timeout'
+        return outcome, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(call, range(calls)))
+
+
+def quota_scenario(args, limited):
+    server, base_url = start_stub_server(latency=0.05, jitter=0.01, rpm=args.rpm, tpm=args.tpm,
+                                         window=args.window)
+    state_path = os.path.join(tempfile.mkdtemp(), 'gemini-rate.state')
+    limit = {'rpm': args.rpm, 'tpm': args.tpm, 'window': args.window} if limited else None
+    start = time.perf_counter()
+    with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+        results = pool.starmap(worker, [(base_url, index, args.threads, args.calls, limit, state_path)
+                                        for index in range(args.processes)])
+    elapsed = time.perf_counter() - start
+    stub = server.state.snapshot()
+    server.shutdown()
+
+    outcomes = {}
+    latencies = []
+    for outcome, latency in (item for result in results for item in result):
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        latencies.append(latency * 1000)
+    label = 'com limite' if limited else 'sem limite'
+    print(f"{label:11s} {outcomes}  {outcomes.get('ok', 0) / elapsed:5.1f} ok/s "
+          f"p50={percentile(latencies, 50):7.0f}ms "
+          f"p99={percentile(latencies, 99):7.0f}ms  stub: {stub['requests']} req, "
+          f"{stub['quota_rejections']} recusadas pela cota")
+
+
+def coalesce_scenario(args):
+    from gemini_client import GeminiClient
+
+    for coalesce in (False, True):
+        server, base_url = start_stub_server(latency=0.3, jitter=0.0)
+        client = GeminiClient('stub', base_url=base_url, coalesce=coalesce, rate_limit_file='')
+        parts = [{"inline_data": {"mime_type": "image/jpeg", "data": "A" * 200000}}, {"text": "Analise a imagem"}]
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            statuses = list(pool.map(lambda _: client.generate_content(parts, call='bench').status_code,
+                                     range(args.threads)))
+        stub = server.state.snapshot()
+        server.shutdown()
+        label = 'com junção' if coalesce else 'sem junção'
+        print(f"{label:11s} {args.threads} chamadas idênticas -> {stub['requests']} requisições ao stub, "
+              f"{statuses.count(200)} respostas 200, coalesced={client.stats()['coalesced']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Limite de RPM/TPM e junção de chamadas contra o stub com cota')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--calls', type=int, default=15, help='chamadas por processo')
+    parser.add_argument('--rpm', type=int, default=40, help='requisições por janela')
+    parser.add_argument('--tpm', type=int, default=0, help='tokens por janela')
+    parser.add_argument('--window', type=float, default=5.0, help='janela da cota em segundos')
+    args = parser.parse_args()
+
+    print(f"Cota: {args.rpm} req e {args.tpm or '-'} tokens a cada {args.window:g}s "
+          f"({args.rpm / args.window:.1f} req/s); "
+          f"{args.processes} processos x {args.threads} threads, {args.processes * args.calls} chamadas\n")
+    quota_scenario(args, limited=False)
+    quota_scenario(args, limited=True)
+    print()
+    coalesce_scenario(args)
+
+
+if __name__ == '__main__':
+    main()
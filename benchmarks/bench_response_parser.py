@@ -0,0 +1,196 @@
+"""
+Fuzz e benchmark da interpretação das respostas do Gemini: compara o extrator
+antigo (remoção dos blocos ``` por regex, busca gulosa \\{.*\\} e json.loads) com o
+response_parser.py (scanner de chaves balanceadas, correções e validação do formato).
+
+As respostas partem das análises gravadas em results/*.json (text_analysis e
+image_analysis, mais a variante do modo 'fused' com comprehensible_text) e das
+respostas do stub, e recebem mutações como as observadas no modelo: bloco ```json,
+texto antes/depois (com chaves), vírgulas sobrando, saída truncada, chaves e aspas
+dentro das strings, probabilidades como texto e dois objetos na mesma resposta.
+
+Para cada mutação:
+- recuperadas: respostas das quais sobrou pelo menos uma probabilidade válida
+- exatas: respostas cujo resultado é igual ao original (fora as truncadas)
+- us/resp: tempo médio de interpretação por resposta
+
+Uso:
+    python3 benchmarks/bench_response_parser.py [--results results] [--variants 20] [--repeat 50]
+"""
+import os
+import re
+import json
+import glob
+import time
+import random
+import argparse
+
+from common import ROOT_DIR
+from gemini_stub import TEXT_ANALYSIS, IMAGE_ANALYSIS
+from response_parser import extract_json, validate_analysis, average_probability, PROBABILITY_KEY
+
+
+def legacy_extract(text):
+    """Extrator anterior (server.extract_json_from_response)"""
+    text = re.sub(r'```json\s*', '', text)
+    text = re.sub(r'```\s*', '', text)
+    json_match = re.search(r'\{.*\}', text, re.DOTALL)
+    if json_match:
+        try:
+            return json.loads(json_match.group(0))
+        except json.JSONDecodeError:
+            pass
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+def legacy_average(obj):
+    """Média recursiva anterior (server.calculate_average_probability)"""
+    probabilities = []
+
+    def walk(value):
+        if isinstance(value, dict):
+            if isinstance(value.get(PROBABILITY_KEY), (int, float)):
+                probabilities.append(value[PROBABILITY_KEY])
+            for item in value.values():
+                walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+
+    walk(obj)
+    return sum(probabilities) / len(probabilities) if probabilities else None
+
+
+def legacy_parse(text, kind):
+    data = legacy_extract(text)
+    return data if isinstance(data, dict) and legacy_average(data) is not None else None
+
+
+def new_parse(text, kind):
+    data, _ = extract_json(text)
+    if data is None:
+        return None
+    data, _, usable = validate_analysis(data, kind)
+    return data if usable else None
+
+
+def load_seeds(results_dir):
+    """(tipo, análise) das respostas gravadas e do stub"""
+    seeds = [('text', TEXT_ANALYSIS), ('image', IMAGE_ANALYSIS)]
+    for path in sorted(glob.glob(os.path.join(results_dir, '*.json'))):
+        with open(path, encoding='utf-8') as f:
+            result = json.load(f)
+        if result.get('text_analysis'):
+            seeds.append(('text', result['text_analysis']))
+            seeds.append(('fused', {'comprehensible_text': result.get('comprehensible_text', ''),
+                                    **result['text_analysis']}))
+        if result.get('image_analysis'):
+            seeds.append(('image', result['image_analysis']))
+    return seeds
+
+
+def with_details(analysis, transform):
+    return {key: ({**entry, 'detalhamento': transform(entry['detalhamento'])}
+                  if isinstance(entry, dict) and isinstance(entry.get('detalhamento'), str) else entry)
+            for key, entry in analysis.items()}
+
+
+def dumps(analysis, rng):
+    return json.dumps(analysis, ensure_ascii=False, indent=rng.choice([None, 2, 4]))
+
+
+# Cada mutação recebe (análise, rng) e devolve (texto, análise esperada ou None se truncada)
+MUTATIONS = {
+    'limpo': lambda a, rng: (dumps(a, rng), a),
+    'bloco ```json': lambda a, rng: (f"```json\n{dumps(a, rng)}\n```", a),
+    'texto em volta': lambda a, rng: (f"Aqui está a análise:\n{dumps(a, rng)}\nEspero ter ajudado!", a),
+    'texto com chaves': lambda a, rng: (
+        f"Segue o JSON {{conforme pedido}}:\n{dumps(a, rng)}\nObs: use {{frase_N}} como chave.", a),
+    'vírgulas sobrando': lambda a, rng: (re.sub(r'(["\d])(\s*)([}\]])', r'\1,\2\3', dumps(a, rng)), a),
+    'chaves nas strings': lambda a, rng: (
+        dumps(*[with_details(a, lambda text: f"{text} {{ex: \"{{meme}}\"}} }}"), rng]),
+        with_details(a, lambda text: f"{text} {{ex: \"{{meme}}\"}} }}")),
+    'probabilidade texto': lambda a, rng: (
+        dumps({key: ({**entry, PROBABILITY_KEY: f"{entry[PROBABILITY_KEY]}%"} if isinstance(entry, dict) else entry)
+               for key, entry in a.items()}, rng), a),
+    'dois objetos': lambda a, rng: (f"{dumps(a, rng)}\n\nExemplo do formato: {{\"frase_1\": {{}}}}", a),
+    'quebra de linha': lambda a, rng: (
+        dumps(with_details(a, lambda text: f"{text}\n(continua)"), rng).replace('\\n', '\n'),
+        with_details(a, lambda text: f"{text}\n(continua)")),
+    'truncado': lambda a, rng: (lambda text: (text[:rng.randint(len(text) // 2, len(text) - 2)], None))(
+        dumps(a, rng)),
+}
+
+
+def build_cases(seeds, variants, seed):
+    rng = random.Random(seed)
+    cases = {name: [] for name in MUTATIONS}
+    for name, mutate in MUTATIONS.items():
+        for _ in range(variants):
+            kind, analysis = rng.choice(seeds)
+            text, expected = mutate(analysis, rng)
+            cases[name].append((kind, text, expected))
+    return cases
+
+
+def evaluate(parse, cases, repeat):
+    recovered = exact = comparable = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for kind, text, _ in cases:
+            parse(text, kind)
+    elapsed = time.perf_counter() - start
+    for kind, text, expected in cases:
+        data = parse(text, kind)
+        recovered += data is not None
+        if expected is not None:
+            comparable += 1
+            exact += data == expected
+    return recovered, exact, comparable, elapsed / (repeat * len(cases)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fuzz e benchmark da interpretação das respostas do Gemini')
+    parser.add_argument('--results', default=os.path.join(ROOT_DIR, 'results'),
+                        help='diretório com os resultados gravados (*.json)')
+    parser.add_argument('--variants', type=int, default=20, help='respostas por mutação')
+    parser.add_argument('--repeat', type=int, default=50, help='repetições na medição de tempo')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    seeds = load_seeds(args.results)
+    cases = build_cases(seeds, args.variants, args.seed)
+    print(f"{len(seeds)} análises de origem, {args.variants} respostas por mutação\n")
+    print(f"{'mutação':20s} {'antigo: recup.':>15s} {'exatas':>7s} {'us/resp':>8s}   "
+          f"{'novo: recup.':>13s} {'exatas':>7s} {'us/resp':>8s}")
+    totals = {'antigo': [0, 0, 0, 0.0], 'novo': [0, 0, 0, 0.0]}
+    for name, mutation_cases in cases.items():
+        row = []
+        for label, parse in (('antigo', legacy_parse), ('novo', new_parse)):
+            recovered, exact, comparable, micros = evaluate(parse, mutation_cases, args.repeat)
+            total = totals[label]
+            total[0] += recovered
+            total[1] += exact
+            total[2] += comparable
+            total[3] += micros / len(cases)
+            exact_text = f"{exact}/{comparable}" if comparable else '-'
+            row.append(f"{recovered:>9d}/{len(mutation_cases):<5d} {exact_text:>7s} {micros:8.1f}")
+        print(f"{name:20s} {row[0]}   {row[1]}")
+
+    count = sum(len(mutation_cases) for mutation_cases in cases.values())
+    print()
+    for label, (recovered, exact, comparable, micros) in totals.items():
+        print(f"{label:6s} recuperadas {recovered}/{count} ({recovered / count:.0%}), "
+              f"exatas {exact}/{comparable}, {micros:.1f} us/resposta em média")
+
+    # A média calculada sobre o resultado validado deve ser a mesma da média recursiva antiga
+    for _, analysis in seeds:
+        plain = {key: value for key, value in analysis.items() if key != 'comprehensible_text'}
+        assert average_probability(plain) == legacy_average(plain), plain
+
+
+if __name__ == '__main__':
+    main()
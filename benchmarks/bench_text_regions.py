@@ -0,0 +1,74 @@
+"""
+Compara o OCR da imagem inteira com o OCR apenas das regiões de texto detectadas
+(text_regions.py), nas imagens de data/ e em versões ampliadas que simulam
+imagens grandes: tempo total do OCR (detecção incluída) e qualidade do texto em
+relação à referência (veja bench_preprocessing.py).
+
+Uso:
+    python3 benchmarks/bench_text_regions.py [--methods gradient,mser] [--scales 1,2,3] [--iterations 3]
+"""
+import os
+import time
+import argparse
+
+import cv2
+
+from common import DATA_DIR, ROOT_DIR, load_corpus, load_references, percentile, text_scores
+from image_processor import DecodedImage, create_ocr_engine, ocr_image
+from preprocessing import PreprocessingPipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do OCR por regiões de texto')
+    parser.add_argument('--methods', default='gradient,mser')
+    parser.add_argument('--scales', default='1,2,3')
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--data', default=DATA_DIR)
+    parser.add_argument('--results', default=os.path.join(ROOT_DIR, 'results'))
+    parser.add_argument('--references', help='JSON {imagem: texto esperado}')
+    parser.add_argument('--backend', default='auto')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.data)
+    references = load_references(args.data, args.results, args.references)
+    engine = create_ocr_engine(args.backend)
+    no_preprocessing = PreprocessingPipeline()
+    try:
+        ocr_image(DecodedImage(corpus[0][1]), engine=engine, preprocessing=no_preprocessing, regions='off')
+    except Exception as e:
+        print(f"OCR indisponível: {e}")
+        return
+
+    modes = ['off'] + args.methods.split(',')
+    print(f"{'imagem':32s} {'modo':>9s} {'p50':>9s} {'regiões':>8s} {'cobertura':>10s} "
+          f"{'similaridade':>13s} {'recall':>7s} {'ruído':>7s}")
+    totals = {mode: [] for mode in modes}
+    for scale in [float(s) for s in args.scales.split(',')]:
+        for name, data, _ in corpus:
+            gray = DecodedImage(data).gray
+            if scale != 1:
+                gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            label = f"{name} {gray.shape[1]}x{gray.shape[0]}"
+            for mode in modes:
+                latencies = []
+                for _ in range(args.iterations):
+                    t = time.perf_counter()
+                    result = ocr_image(gray, engine=engine, preprocessing=no_preprocessing, regions=mode)
+                    latencies.append((time.perf_counter() - t) * 1000)
+                totals[mode].extend(latencies)
+                detection = result.get('region_detection')
+                regions = f"{detection['count']:8d}" if detection else f"{'-':>8s}"
+                coverage = (detection['fallback'] or f"{detection['coverage']:.0%}") if detection else '-'
+                quality = f"{'-':>13s} {'-':>7s} {'-':>7s}"
+                if name in references:
+                    scores = text_scores(result['text'], references[name])
+                    quality = f"{scores['similarity']:13.3f} {scores['recall']:7.1%} {scores['noise']:7.1%}"
+                print(f"{label:32s} {mode:>9s} {percentile(latencies, 50):7.1f}ms {regions} {coverage:>10s} {quality}")
+
+    print()
+    for mode in modes:
+        print(f"{mode:>9s}: p50={percentile(totals[mode], 50):8.1f}ms  p95={percentile(totals[mode], 95):8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
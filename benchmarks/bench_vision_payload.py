@@ -0,0 +1,83 @@
+"""
+Compara o payload enviado ao Gemini antes (JPEG na resolução original) e depois da
+otimização (redução + escolha de qualidade), em um corpus com as imagens de data/
+e versões ampliadas que simulam screenshots de celular.
+
+Uso:
+    python3 benchmarks/bench_vision_payload.py [--scales 1,2,3] [--uplink-mbps 10]
+"""
+import os
+import time
+import json
+import base64
+import argparse
+
+os.environ.setdefault('GOOG_API_KEY', 'benchmark')
+
+import cv2
+import numpy as np
+import requests
+
+from common import DATA_DIR, load_corpus
+from gemini_stub import start_stub_server
+from image_processor import optimize_image_payload
+from server import preprocess_image_array
+
+
+def request_body(data, mime_type):
+    return json.dumps({"contents": [{"parts": [
+        {"inline_data": {"mime_type": mime_type, "data": base64.b64encode(data).decode('utf-8')}},
+        {"text": "prompt"}
+    ]}]}).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do payload da análise visual')
+    parser.add_argument('--scales', default='1,2,3')
+    parser.add_argument('--uplink-mbps', type=float, default=10.0, help='banda de upload para estimar o tempo de envio')
+    parser.add_argument('--data', default=DATA_DIR)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency=0.0, jitter=0.0)
+    session = requests.Session()
+    url = f"{base_url}/models/stub:generateContent"
+
+    totals = {'legacy': [0, 0.0], 'optimized': [0, 0.0]}
+    print(f"{'imagem':28s} {'original':>10s} {'antes':>10s} {'depois':>10s} {'redução':>8s} "
+          f"{'envio antes':>12s} {'envio depois':>12s}")
+    for scale in [float(s) for s in args.scales.split(',')]:
+        for name, data, _ in load_corpus(args.data):
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if scale != 1:
+                img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+                data = cv2.imencode('.png', img)[1].tobytes()
+            processed, _ = preprocess_image_array(data)
+
+            legacy = cv2.imencode('.jpg', processed)[1].tobytes()
+            optimized, mime_type, report = optimize_image_payload(processed, original_bytes=len(data))
+
+            results = {}
+            for label, payload, mime in (('legacy', legacy, 'image/jpeg'), ('optimized', optimized, mime_type)):
+                body = request_body(payload, mime)
+                t = time.perf_counter()
+                session.post(url, data=body, headers={'Content-Type': 'application/json'})
+                loopback = time.perf_counter() - t
+                upload = len(body) * 8 / (args.uplink_mbps * 1_000_000)
+                results[label] = (len(body), loopback + upload)
+                totals[label][0] += len(body)
+                totals[label][1] += loopback + upload
+
+            reduction = 1 - results['optimized'][0] / results['legacy'][0]
+            label = f"{name} x{scale:g} {report['original_size'][0]}x{report['original_size'][1]}"
+            print(f"{label:28s} {len(data):10d} {results['legacy'][0]:10d} {results['optimized'][0]:10d} "
+                  f"{reduction:8.1%} {results['legacy'][1] * 1000:10.0f}ms {results['optimized'][1] * 1000:10.0f}ms")
+
+    server.shutdown()
+    if totals['legacy'][0]:
+        print(f"\nTotal do corpo das requisições: {totals['legacy'][0]} -> {totals['optimized'][0]} bytes "
+              f"({1 - totals['optimized'][0] / totals['legacy'][0]:.1%} menor); tempo de envio estimado a "
+              f"{args.uplink_mbps:g} Mbps: {totals['legacy'][1]:.2f}s -> {totals['optimized'][1]:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
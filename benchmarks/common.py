@@ -0,0 +1,83 @@
+"""
+Funções auxiliares compartilhadas pelos scripts de benchmark.
+"""
+import os
+import re
+import sys
+import glob
+import io
+import json
+import difflib
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DATA_DIR = os.path.join(ROOT_DIR, 'data')
+
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from PIL import Image
+
+
+def load_corpus(data_dir=DATA_DIR):
+    """
+    Carrega as imagens de um diretório, ignorando arquivos que o PIL não decodifica
+    (ex: data/meme-gato.png é AVIF com extensão .png).
+
+    Returns:
+        list: [(nome do arquivo, bytes, PIL Image)]
+    """
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(data_dir, '*'))):
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.load()
+        except Exception as e:
+            print(f"Ignorando {os.path.basename(path)}: {e}")
+            continue
+        corpus.append((os.path.basename(path), data, image))
+    return corpus
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def words(text):
+    return re.findall(r"[^\W_]+", text.lower())
+
+
+def load_references(data_dir, results_dir, references_path=None):
+    """
+    Texto esperado de cada imagem: arquivo JSON {imagem: texto} ou o 'comprehensible_text'
+    dos resultados salvos em results/<nome>-result.json
+    """
+    if references_path:
+        with open(references_path, encoding='utf-8') as f:
+            return json.load(f)
+    references = {}
+    for name in os.listdir(data_dir):
+        path = os.path.join(results_dir, f"{os.path.splitext(name)[0]}-result.json")
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                text = json.load(f).get('comprehensible_text')
+            if text:
+                references[name] = text
+    return references
+
+
+def text_scores(text, reference):
+    """Similaridade, recall e ruído das palavras do OCR em relação à referência"""
+    ocr_words, reference_words = words(text), words(reference)
+    found = set(ocr_words)
+    expected = set(reference_words)
+    return {
+        'similarity': difflib.SequenceMatcher(None, ' '.join(ocr_words), ' '.join(reference_words)).ratio(),
+        'recall': sum(1 for word in reference_words if word in found) / len(reference_words) if reference_words else 0.0,
+        'noise': sum(1 for word in ocr_words if word not in expected) / len(ocr_words) if ocr_words else 0.0,
+    }
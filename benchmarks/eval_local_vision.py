@@ -0,0 +1,151 @@
+"""
+Avaliação offline da pré-classificação visual local (meme_classifier.py): concordância
+com a análise visual do Gemini e fração das chamadas visuais que seriam evitadas em
+cada limiar.
+
+Referência de cada imagem (probabilidade visual do Gemini, 0-100):
+- --references arquivo.json {imagem: probabilidade}, ou
+- averages.image_average dos resultados salvos em results/<nome>-result.json, ou
+- com --gemini, uma chamada visual ao Gemini por imagem sem referência (requer
+  GOOG_API_KEY ou GEMINI_FIXTURES=replay)
+As variações sintéticas (--synthetic, as mesmas de bench_pipeline.py) herdam a
+referência da imagem original; as não-memes sintéticas (--negatives: fotos sem texto
+e páginas de documento) têm referência 0.
+
+Uso:
+    python3 benchmarks/eval_local_vision.py [--synthetic 40] [--negatives 20]
+        [--thresholds 80,85,90,92,95] [--gemini] [--verbose]
+"""
+import os
+import json
+import random
+import argparse
+
+import cv2
+import numpy as np
+
+from common import ROOT_DIR, DATA_DIR, load_corpus, percentile
+from bench_pipeline import synthetic_corpus, CAPTION_WORDS
+from meme_classifier import classify, LOCAL_VISION_THRESHOLD
+
+
+def load_image_references(corpus, results_dir, references_path=None):
+    """Probabilidade visual do Gemini de cada imagem de data/ com resultado salvo"""
+    if references_path:
+        with open(references_path, encoding='utf-8') as f:
+            return {name: float(value) for name, value in json.load(f).items()}
+    references = {}
+    for name, _, _ in corpus:
+        path = os.path.join(results_dir, f"{os.path.splitext(name)[0]}-result.json")
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                value = json.load(f).get('averages', {}).get('image_average')
+            if value is not None:
+                references[name] = float(value)
+    return references
+
+
+def gemini_reference(data):
+    """Probabilidade visual do Gemini (mesmo pré-processamento e prompt do servidor)"""
+    import server
+    from image_processor import DecodedImage
+    from response_parser import average_probability
+    payload = server.preprocess_image(DecodedImage(data))
+    response, parsed = server.run_vision(payload, {'decision': 'gemini'})
+    if response.status_code != 200 or parsed is None:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return average_probability(parsed.data)
+
+
+def make_negatives(count, seed=0):
+    """Imagens que não são memes: fotos sem texto e páginas de documento"""
+    rng = np.random.default_rng(seed)
+    words = random.Random(seed)
+    images = []
+    for index in range(count):
+        width, height = int(rng.integers(320, 800)), int(rng.integers(320, 800))
+        if index % 2 == 0:
+            noise = (rng.random((height // 16 + 1, width // 16 + 1, 3)) * 255).astype(np.uint8)
+            image = cv2.GaussianBlur(cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC), (0, 0), 3)
+            kind = 'foto'
+        else:
+            image = np.full((height, width, 3), 245, np.uint8)
+            for y in range(30, height - 10, 22):
+                line = ' '.join(words.choice(CAPTION_WORDS) for _ in range(words.randint(4, 9)))
+                cv2.putText(image, line, (16, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (30, 30, 30), 1, cv2.LINE_AA)
+            kind = 'documento'
+        _, encoded = cv2.imencode('.png', image)
+        images.append((f"negative-{index:03d}-{kind}.png", encoded.tobytes()))
+    return images
+
+
+def decode_gray(data):
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Avaliação da pré-classificação visual local')
+    parser.add_argument('--data', default=DATA_DIR)
+    parser.add_argument('--results', default=os.path.join(ROOT_DIR, 'results'))
+    parser.add_argument('--references', help='JSON {imagem: probabilidade visual do Gemini}')
+    parser.add_argument('--synthetic', type=int, default=40, help='variações sintéticas das imagens de data/')
+    parser.add_argument('--negatives', type=int, default=20, help='não-memes sintéticas (referência 0)')
+    parser.add_argument('--thresholds', default='80,85,90,92,95')
+    parser.add_argument('--gemini', action='store_true', help='consulta o Gemini nas imagens sem referência')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.data)
+    references = load_image_references(corpus, args.results, args.references)
+    samples = [(name, data, name) for name, data, _ in corpus]
+    # synthetic-000-meme-2012.png -> meme-2012.png
+    samples += [(name, data, corpus[index % len(corpus)][0])
+                for index, (name, data) in enumerate(synthetic_corpus(corpus, args.synthetic))] if corpus else []
+    negatives = make_negatives(args.negatives)
+    samples += [(name, data, name) for name, data in negatives]
+    references.update({name: 0.0 for name, _ in negatives})
+
+    if args.gemini:
+        for name, data, source in samples:
+            if source not in references:
+                try:
+                    references[source] = gemini_reference(data)
+                except Exception as e:
+                    print(f"{name}: chamada ao Gemini falhou ({e})")
+
+    rows = []
+    print(f"{'imagem':40s} {'local':>6s} {'gemini':>6s} {'ms':>6s}")
+    for name, data, source in samples:
+        result = classify(decode_gray(data))
+        reference = references.get(source)
+        rows.append((result['probability'], reference, result['ms']))
+        print(f"{name:40s} {result['probability']:6.1f} "
+              f"{reference if reference is not None else float('nan'):6.1f} {result['ms']:6.1f}")
+        if args.verbose and result['features']:
+            print(f"    {result['features']}")
+
+    if not rows:
+        print("Nenhuma amostra encontrada.")
+        return
+
+    compared = [(local, reference) for local, reference, _ in rows if reference is not None]
+    times = [ms for _, _, ms in rows]
+    print(f"\n{len(rows)} imagens ({len(compared)} com referência), {percentile(times, 50):.1f} ms p50, "
+          f"{percentile(times, 95):.1f} ms p95")
+    if compared:
+        agree = sum(1 for local, reference in compared if (local >= 50) == (reference >= 50))
+        print(f"Concordância com o Gemini (mesmo lado de 50): {agree}/{len(compared)} ({agree / len(compared):.1%}), "
+              f"diferença média {np.mean([abs(local - reference) for local, reference in compared]):.1f} pontos")
+
+    print(f"\n{'limiar':>6s} {'chamadas evitadas':>18s} {'concordância nas evitadas':>26s} {'diferença média':>16s}")
+    for threshold in [float(value) for value in args.thresholds.split(',')]:
+        skipped = [(local, reference) for local, reference, _ in rows if local >= threshold]
+        checked = [(local, reference) for local, reference in skipped if reference is not None]
+        agree = f"{sum(1 for _, reference in checked if reference >= 50)}/{len(checked)}" if checked else '-'
+        diff = f"{np.mean([abs(local - reference) for local, reference in checked]):.1f}" if checked else '-'
+        marker = '  (LOCAL_VISION_THRESHOLD)' if threshold == LOCAL_VISION_THRESHOLD else ''
+        print(f"{threshold:6.0f} {len(skipped):8d} ({len(skipped) / len(rows):6.1%}) {agree:>26s} {diff:>16s}{marker}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Avaliação offline da triagem local do texto do OCR (text_quality.py): quantas
+chamadas de texto ao Gemini seriam evitadas.
+
+Fontes:
+    python3 benchmarks/eval_text_gate.py                 # OCR nas imagens de data/
+    python3 benchmarks/eval_text_gate.py --data DIR      # OCR em outro diretório
+    python3 benchmarks/eval_text_gate.py --results results  # extracted_text de resultados salvos
+
+No fluxo two_step cada imagem faz 2 chamadas de texto (limpeza + análise):
+'skip' evita as 2 e 'local_cleanup' evita a de limpeza.
+"""
+import os
+import json
+import glob
+import argparse
+from collections import Counter
+
+from common import DATA_DIR, load_corpus
+from text_quality import evaluate_text_quality
+
+CALLS_SAVED = {'skip': 2, 'local_cleanup': 1, 'gemini_cleanup': 0}
+
+
+def samples_from_results(directory):
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(path, encoding='utf-8') as f:
+            result = json.load(f)
+        if 'extracted_text' in result:
+            yield os.path.basename(path), result['extracted_text'], result.get('comprehensible_text')
+
+
+def samples_from_images(directory):
+    from image_processor import ocr_image
+    for name, data, _ in load_corpus(directory):
+        try:
+            yield name, ocr_image(data), None
+        except Exception as e:
+            print(f"{name}: OCR falhou ({e})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Avaliação da triagem local do texto do OCR')
+    parser.add_argument('--data', default=DATA_DIR, help='diretório de imagens (executa o OCR)')
+    parser.add_argument('--results', help='diretório de resultados JSON salvos (usa extracted_text)')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    samples = samples_from_results(args.results) if args.results else samples_from_images(args.data)
+
+    decisions = Counter()
+    total = 0
+    for name, ocr, reference in samples:
+        gate = evaluate_text_quality(ocr)
+        decisions[gate['decision']] += 1
+        total += 1
+        print(f"{name}: {gate['decision']} (palavras={gate['words']}, linhas limpas={gate['clean_lines']}, "
+              f"ruído={gate['noise_lines']}, válidos={gate['valid_ratio']})")
+        if args.verbose:
+            print(f"    texto local: {gate['clean_text']!r}")
+            if reference is not None:
+                print(f"    limpeza do Gemini: {reference!r}")
+
+    if not total:
+        print("Nenhuma amostra encontrada.")
+        return
+
+    baseline = total * 2
+    saved = sum(CALLS_SAVED[decision] * count for decision, count in decisions.items())
+    print(f"\n{total} imagens: " + ', '.join(f"{decision}={count}" for decision, count in sorted(decisions.items())))
+    print(f"Chamadas de texto ao Gemini: {baseline} -> {baseline - saved} ({saved / baseline:.1%} a menos)")
+
+
+if __name__ == '__main__':
+    main()
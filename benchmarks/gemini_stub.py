@@ -0,0 +1,204 @@
+"""
+Servidor stub local da API generateContent do Gemini, com latência e taxa de erro
+simuladas. Permite testar o cliente e o servidor sem chave de API:
+
+    python3 benchmarks/gemini_stub.py --port 8089 --latency 0.8 --error-rate 0.1
+    GEMINI_BASE_URL=http://localhost:8089/v1beta GOOG_API_KEY=stub python3 server.py
+
+Com --rpm/--tpm o stub impõe uma cota como a do Gemini: requisições e tokens
+(~4 caracteres por token, 258 por imagem) em uma janela deslizante de --window
+segundos; acima dela responde 429 com Retry-After. As respostas trazem usageMetadata.
+Com --invalid-json-rate, parte das respostas de análise vem sem JSON utilizável
+(texto livre), como acontece às vezes com o modelo real.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEXT_ANALYSIS = {
+    "frase_1": {"probabilidade_de_ser_meme": 90, "detalhamento": "Resposta simulada pelo stub."},
+    "analise_geral": {"probabilidade_de_ser_meme": 95, "detalhamento": "Resposta simulada pelo stub."}
+}
+IMAGE_ANALYSIS = {
+    "elemento_visual_1": {"probabilidade_de_ser_meme": 85, "detalhamento": "Resposta simulada pelo stub."},
+    "analise_geral": {"probabilidade_de_ser_meme": 90, "detalhamento": "Resposta simulada pelo stub."}
+}
+
+
+def canned_reply(payload):
+    """Escolhe uma resposta plausível de acordo com o tipo de prompt recebido"""
+    parts = payload.get('contents', [{}])[0].get('parts', [])
+    texts = [part.get('text', '') for part in parts]
+    has_image = any('inline_data' in part for part in parts)
+    if has_image:
+        return json.dumps(IMAGE_ANALYSIS, ensure_ascii=False)
+    if texts and texts[0].startswith('Extraia e retorne apenas o texto'):
+        return "Texto limpo simulado pelo stub"
+    if texts and '"comprehensible_text"' in texts[0]:
+        return json.dumps({"comprehensible_text": "Texto limpo simulado pelo stub", **TEXT_ANALYSIS}, ensure_ascii=False)
+    return json.dumps(TEXT_ANALYSIS, ensure_ascii=False)
+
+
+# Resposta de análise sem JSON, devolvida na fração --invalid-json-rate das chamadas
+INVALID_JSON_REPLY = "Não foi possível analisar o conteúdo. {frase_1: provável meme"
+
+
+def count_tokens(payload):
+    tokens = 0
+    for content in payload.get('contents', []):
+        for part in content.get('parts', []):
+            tokens += len(part['text']) // 4 + 1 if 'text' in part else 258
+    return tokens
+
+
+class StubState:
+    def __init__(self, latency=0.5, jitter=0.1, error_rate=0.0, retry_after=1, rpm=0, tpm=0, window=60.0,
+                 invalid_json_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.invalid_json_rate = invalid_json_rate
+        self.retry_after = retry_after
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.quota_rejections = 0
+        self.invalid_replies = 0
+        self.max_concurrent = 0
+        self.concurrent = 0
+        self.connections = set()
+        # (instante, tokens) das requisições aceitas dentro da janela da cota
+        self.usage = deque()
+
+    def admit(self, tokens):
+        """Registra a requisição na cota; devolve os segundos até haver cota se ela estiver esgotada"""
+        with self.lock:
+            now = time.monotonic()
+            while self.usage and self.usage[0][0] <= now - self.window:
+                self.usage.popleft()
+            used = sum(used_tokens for _, used_tokens in self.usage)
+            if (self.rpm and len(self.usage) + 1 > self.rpm) or (self.tpm and used + tokens > self.tpm):
+                self.quota_rejections += 1
+                return self.usage[0][0] + self.window - now if self.usage else self.window
+            self.usage.append((now, tokens))
+            return None
+
+    def snapshot(self):
+        with self.lock:
+            return {'requests': self.requests, 'errors': self.errors, 'quota_rejections': self.quota_rejections,
+                    'invalid_replies': self.invalid_replies,
+                    'max_concurrent': self.max_concurrent, 'connections': len(self.connections)}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        state = self.server.state
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        with state.lock:
+            state.requests += 1
+            state.connections.add(self.client_address)
+
+        reply = canned_reply(payload)
+        if reply.startswith('{') and random.random() < state.invalid_json_rate:
+            reply = INVALID_JSON_REPLY
+            with state.lock:
+                state.invalid_replies += 1
+        prompt_tokens = count_tokens(payload)
+        output_tokens = len(reply) // 4 + 1
+        if state.rpm or state.tpm:
+            # A cota conta os tokens da resposta também
+            retry_after = state.admit(prompt_tokens + output_tokens)
+            if retry_after is not None:
+                self._send(429, {'error': {'code': 429, 'message': 'Quota exceeded (stub)', 'status': 'RESOURCE_EXHAUSTED'}},
+                           {'Retry-After': f"{max(retry_after, 0.01):.2f}"})
+                return
+
+        with state.lock:
+            state.concurrent += 1
+            state.max_concurrent = max(state.max_concurrent, state.concurrent)
+        try:
+            time.sleep(max(0.0, random.gauss(state.latency, state.jitter)))
+        finally:
+            with state.lock:
+                state.concurrent -= 1
+
+        if random.random() < state.error_rate:
+            with state.lock:
+                state.errors += 1
+            if random.random() < 0.5:
+                self._send(429, {'error': {'code': 429, 'message': 'Resource exhausted (stub)'}},
+                           {'Retry-After': str(state.retry_after)})
+            else:
+                self._send(503, {'error': {'code': 503, 'message': 'Service unavailable (stub)'}})
+            return
+
+        self._send(200, {
+            'candidates': [{'content': {'parts': [{'text': reply}], 'role': 'model'}}],
+            'usageMetadata': {'promptTokenCount': prompt_tokens, 'candidatesTokenCount': output_tokens,
+                              'totalTokenCount': prompt_tokens + output_tokens}
+        })
+
+
+def start_stub_server(port=0, **state_kwargs):
+    """
+    Inicia o stub em uma thread.
+
+    Returns:
+        tuple: (servidor, URL base para GEMINI_BASE_URL)
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(**state_kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub local da API do Gemini')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.5, help='latência média em segundos')
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fração de respostas 429/503')
+    parser.add_argument('--rpm', type=int, default=0, help='cota de requisições por janela (0 = sem cota)')
+    parser.add_argument('--tpm', type=int, default=0, help='cota de tokens por janela (0 = sem cota)')
+    parser.add_argument('--window', type=float, default=60.0, help='janela da cota em segundos')
+    parser.add_argument('--invalid-json-rate', type=float, default=0.0,
+                        help='fração de respostas de análise sem JSON utilizável')
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port, latency=args.latency, jitter=args.jitter,
+                                         error_rate=args.error_rate, rpm=args.rpm, tpm=args.tpm,
+                                         window=args.window, invalid_json_rate=args.invalid_json_rate)
+    print(f"Stub do Gemini em {base_url} (Ctrl+C para encerrar)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Teste de carga do /analyze-image com um stub local do Gemini.
+
+Inicia o stub e o servidor (modo de produção e/ou servidor de desenvolvimento do
+Flask) em subprocessos e envia requisições com concorrência crescente, reportando
+vazão e latências p50/p95/p99 em cada nível. O cache é ignorado (no_cache=true)
+para que toda requisição passe pelo OCR e pelas chamadas ao Gemini.
+
+Uso:
+    python3 benchmarks/load_test.py [--modes dev,production] [--levels 1,2,4,8,16,32]
+        [--workers 4] [--threads 8] [--latency 0.8] [--image data/meme-2012.png]
+    python3 benchmarks/load_test.py --url http://localhost:5000   # servidor já em execução
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import ROOT_DIR, percentile
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Servidor não respondeu em {url} após {timeout}s")
+
+
+def start_stub(latency):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT_DIR, 'benchmarks', 'gemini_stub.py'),
+         '--port', str(port), '--latency', str(latency), '--jitter', str(latency / 4)],
+        stdout=subprocess.DEVNULL
+    )
+    time.sleep(0.5)
+    return process, f"http://127.0.0.1:{port}/v1beta"
+
+
+def start_server(mode, stub_url, workers, threads):
+    port = free_port()
+    env = dict(os.environ, SERVER_PORT=str(port), SERVER_HOST='127.0.0.1', GEMINI_BASE_URL=stub_url,
+               GOOG_API_KEY=os.environ.get('GOOG_API_KEY', 'load-test'))
+    command = [sys.executable, os.path.join(ROOT_DIR, 'server.py')]
+    if mode == 'dev':
+        command.append('--dev')
+    else:
+        command += ['--workers', str(workers), '--threads', str(threads)]
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(url)
+    except RuntimeError:
+        process.terminate()
+        raise
+    return process, url
+
+
+def run_level(url, image_data, image_name, concurrency, total):
+    def send(_):
+        start = time.perf_counter()
+        try:
+            response = requests.post(
+                f"{url}/analyze-image",
+                files={'image': (image_name, image_data)},
+                data={'no_cache': 'true'},
+                timeout=300
+            )
+            status = response.status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for latency, status in results if status == 200]
+    errors = Counter(status for _, status in results if status != 200)
+    return {
+        'throughput': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'errors': dict(errors),
+    }
+
+
+def report(label, url, image_data, image_name, levels, requests_per_level):
+    print(f"\n{label}")
+    print(f"{'concorrência':>12s} {'req/s':>8s} {'p50':>9s} {'p95':>9s} {'p99':>9s}  erros")
+    for concurrency in levels:
+        total = max(requests_per_level, concurrency * 2)
+        result = run_level(url, image_data, image_name, concurrency, total)
+        errors = ', '.join(f"{status}: {count}" for status, count in result['errors'].items()) or '-'
+        print(f"{concurrency:12d} {result['throughput']:8.2f} {result['p50']:7.0f}ms "
+              f"{result['p95']:7.0f}ms {result['p99']:7.0f}ms  {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga do /analyze-image')
+    parser.add_argument('--url', help='servidor já em execução (não inicia stub nem servidor)')
+    parser.add_argument('--modes', default='production', help='dev, production ou ambos separados por vírgula')
+    parser.add_argument('--levels', default='1,2,4,8,16,32')
+    parser.add_argument('--requests', type=int, default=20, help='requisições por nível (no mínimo 2x a concorrência)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.8, help='latência média do stub do Gemini (s)')
+    parser.add_argument('--image', default=os.path.join(ROOT_DIR, 'data', 'meme-2012.png'))
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as f:
+        image_data = f.read()
+    image_name = os.path.basename(args.image)
+    levels = [int(level) for level in args.levels.split(',')]
+
+    if args.url:
+        report(args.url, args.url.rstrip('/'), image_data, image_name, levels, args.requests)
+        return
+
+    stub, stub_url = start_stub(args.latency)
+    try:
+        for mode in args.modes.split(','):
+            server, url = start_server(mode, stub_url, args.workers, args.threads)
+            try:
+                label = ('servidor de desenvolvimento do Flask' if mode == 'dev'
+                         else f"produção ({args.workers} processos x {args.threads} threads)")
+                report(label, url, image_data, image_name, levels, args.requests)
+            finally:
+                # SIGTERM: encerramento gracioso
+                server.terminate()
+                server.wait(timeout=60)
+    finally:
+        stub.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""
+Imagens com vários quadros (GIF/WebP/PNG animados, TIFF com várias páginas).
+
+Os quadros são decodificados um de cada vez pelo PIL; só ficam na memória os quadros-
+chave, que são escolhidos por deduplicação: um quadro é novo se o pHash estiver a mais
+de FRAME_MIN_DISTANCE bits de todos os já escolhidos ou se a miniatura diferir em
+média mais de FRAME_MIN_DIFF níveis de cinza (legendas que mudam alteram pouco o
+pHash). Os quadros repetidos somam o seu tempo de exibição ao quadro-chave mais
+próximo, que mede o quanto cada um representa a animação.
+
+- Texto: o OCR dos FRAME_OCR_FRAMES quadros-chave mais representativos roda em
+  paralelo e as linhas são unidas sem repetições (linhas iguais ou parecidas aparecem
+  uma vez; uma legenda revelada aos poucos fica só na versão completa).
+- Imagem: os FRAME_VISION_FRAMES quadros mais representativos vão para o Gemini em um
+  mosaico (um quadro = o próprio quadro).
+
+Limites de custo: no máximo FRAME_SCAN_LIMIT quadros decodificados (o restante da
+animação é ignorado) e FRAME_MAX_KEYFRAMES quadros-chave na memória.
+"""
+import io
+import os
+import re
+import time
+import difflib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from image_processor import ocr_image, OCR_POOL_SIZE
+from phash_index import compute_phash, hamming_distance
+
+
+# Análise quadro a quadro das imagens animadas (false = apenas o primeiro quadro)
+MULTI_FRAME_ENABLED = os.getenv('MULTI_FRAME', 'true').lower() == 'true'
+FRAME_SCAN_LIMIT = int(os.getenv('FRAME_SCAN_LIMIT', '150'))
+FRAME_MAX_KEYFRAMES = int(os.getenv('FRAME_MAX_KEYFRAMES', '8'))
+FRAME_OCR_FRAMES = int(os.getenv('FRAME_OCR_FRAMES', '4'))
+FRAME_VISION_FRAMES = int(os.getenv('FRAME_VISION_FRAMES', '4'))
+FRAME_MIN_DISTANCE = int(os.getenv('FRAME_MIN_DISTANCE', '10'))
+FRAME_MIN_DIFF = float(os.getenv('FRAME_MIN_DIFF', '12'))
+# Similaridade a partir da qual duas linhas de quadros diferentes são consideradas a mesma
+FRAME_TEXT_SIMILARITY = float(os.getenv('FRAME_TEXT_SIMILARITY', '0.8'))
+
+# Duração usada quando o arquivo não informa a de um quadro (ex: TIFF)
+DEFAULT_FRAME_DURATION_MS = 100
+_THUMBNAIL_SIZE = (64, 64)
+
+_frame_executor = None
+_executor_lock = threading.Lock()
+
+
+def frame_settings():
+    """Configuração que altera o resultado (faz parte da versão da análise)"""
+    return (MULTI_FRAME_ENABLED, FRAME_SCAN_LIMIT, FRAME_MAX_KEYFRAMES, FRAME_OCR_FRAMES,
+            FRAME_VISION_FRAMES, FRAME_MIN_DISTANCE, FRAME_MIN_DIFF, FRAME_TEXT_SIMILARITY)
+
+
+def is_multi_frame(data):
+    """Se a imagem tem mais de um quadro (lê apenas o cabeçalho; False se o PIL não a abrir)"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return bool(getattr(image, 'is_animated', False) or getattr(image, 'n_frames', 1) > 1)
+    except Exception:
+        return False
+
+
+class Keyframe:
+    def __init__(self, index, gray, duration_ms):
+        self.index = index
+        self.gray = gray
+        self.phash = compute_phash(gray)
+        self.thumbnail = cv2.resize(gray, _THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+        # Tempo de exibição deste quadro e dos repetidos atribuídos a ele
+        self.coverage_ms = duration_ms
+
+    def distance(self, phash, thumbnail):
+        return hamming_distance(self.phash, phash), float(np.abs(self.thumbnail - thumbnail).mean())
+
+
+class FrameSelection:
+    """
+    Quadros-chave de uma animação.
+
+    Attributes:
+        keyframes: Keyframe em ordem temporal
+        scanned: quadros decodificados
+        truncated: se a animação tem mais quadros que FRAME_SCAN_LIMIT
+        duration_ms: duração dos quadros decodificados
+        decode_ms: tempo de decodificação e seleção
+    """
+
+    def __init__(self, keyframes, scanned, truncated, duration_ms, decode_ms):
+        self.keyframes = keyframes
+        self.scanned = scanned
+        self.truncated = truncated
+        self.duration_ms = duration_ms
+        self.decode_ms = decode_ms
+
+    def representative(self, count):
+        """Os count quadros-chave com maior tempo de exibição, em ordem temporal"""
+        ranked = sorted(self.keyframes, key=lambda keyframe: -keyframe.coverage_ms)[:max(1, count)]
+        return sorted(ranked, key=lambda keyframe: keyframe.index)
+
+    def report(self):
+        return {
+            'scanned': self.scanned,
+            'truncated': self.truncated,
+            'duration_ms': self.duration_ms,
+            'decode_ms': round(self.decode_ms, 2),
+            'keyframes': [{'index': keyframe.index, 'coverage': round(keyframe.coverage_ms / self.duration_ms, 3)
+                           if self.duration_ms else 0.0} for keyframe in self.keyframes],
+        }
+
+
+def select_keyframes(data, scan_limit=FRAME_SCAN_LIMIT, max_keyframes=FRAME_MAX_KEYFRAMES,
+                     min_distance=FRAME_MIN_DISTANCE, min_diff=FRAME_MIN_DIFF):
+    """
+    Decodifica os quadros em sequência e escolhe os quadros-chave.
+
+    Com max_keyframes quadros-chave escolhidos, quadros novos passam a ser atribuídos
+    ao quadro-chave mais próximo.
+
+    Returns:
+        FrameSelection
+
+    Raises:
+        ValueError: se a imagem não puder ser decodificada
+    """
+    start = time.perf_counter()
+    keyframes = []
+    scanned = 0
+    duration_ms = 0
+    truncated = False
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            for index in range(scan_limit + 1):
+                try:
+                    image.seek(index)
+                except EOFError:
+                    break
+                if index == scan_limit:
+                    truncated = True
+                    break
+                frame_duration = image.info.get('duration') or DEFAULT_FRAME_DURATION_MS
+                gray = np.asarray(image.convert('L'))
+                scanned += 1
+                duration_ms += frame_duration
+
+                phash = compute_phash(gray)
+                thumbnail = cv2.resize(gray, _THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+                nearest = None
+                new = True
+                for keyframe in keyframes:
+                    bits, diff = keyframe.distance(phash, thumbnail)
+                    if bits < min_distance and diff < min_diff:
+                        new = False
+                    if nearest is None or (bits, diff) < nearest[0]:
+                        nearest = ((bits, diff), keyframe)
+                if new and len(keyframes) < max_keyframes:
+                    keyframes.append(Keyframe(index, gray, frame_duration))
+                else:
+                    nearest[1].coverage_ms += frame_duration
+    except Exception as e:
+        if not keyframes:
+            raise ValueError(f"Erro ao decodificar os quadros da imagem: {e}")
+    return FrameSelection(keyframes, scanned, truncated, duration_ms, (time.perf_counter() - start) * 1000)
+
+
+def _get_frame_executor():
+    """Pool de threads do OCR dos quadros (separado do pool das regiões usado dentro de ocr_image)"""
+    global _frame_executor
+    if _frame_executor is None:
+        with _executor_lock:
+            if _frame_executor is None:
+                _frame_executor = ThreadPoolExecutor(max_workers=OCR_POOL_SIZE, thread_name_prefix='ocr-frame')
+    return _frame_executor
+
+
+def _normalize(text):
+    return ' '.join(re.findall(r"[^\W_]+", text.lower()))
+
+
+def merge_ocr_results(results, similarity=FRAME_TEXT_SIMILARITY):
+    """
+    Une o OCR de vários quadros, em ordem temporal, sem repetir linhas.
+
+    Linhas iguais ou com similaridade >= similarity aparecem uma vez (a de maior
+    confiança); uma linha contida em outra (legenda revelada aos poucos) dá lugar à
+    mais longa, na posição em que apareceu primeiro.
+
+    Args:
+        results: [(índice do quadro, resultado de ocr_image)]
+
+    Returns:
+        dict: mesmo formato de ocr_image ('text', 'confidence', 'lines', 'words'), com
+        o índice do quadro em cada linha
+    """
+    lines = []
+    for index, result in results:
+        for line in result['lines']:
+            normalized = _normalize(line['text'])
+            if not normalized:
+                continue
+            candidate = {**line, 'frame': index}
+            for position, (kept_normalized, kept) in enumerate(lines):
+                same = (normalized == kept_normalized
+                        or difflib.SequenceMatcher(None, normalized, kept_normalized).ratio() >= similarity)
+                if same:
+                    if candidate['confidence'] > kept['confidence']:
+                        lines[position] = (normalized, candidate)
+                    break
+                if kept_normalized in normalized:
+                    lines[position] = (normalized, candidate)
+                    break
+                if normalized in kept_normalized:
+                    break
+            else:
+                lines.append((normalized, candidate))
+
+    kept_lines = [line for _, line in lines]
+    kept_words = set(' '.join(normalized for normalized, _ in lines).split())
+    words = {}
+    for _, result in results:
+        for word in result['words']:
+            normalized = _normalize(word['text'])
+            if normalized in kept_words and (normalized not in words
+                                             or word['confidence'] > words[normalized]['confidence']):
+                words[normalized] = word
+    confidences = [word['confidence'] for word in words.values() if word['confidence'] > 0]
+    return {
+        'text': '\n'.join(line['text'] for line in kept_lines),
+        'confidence': round(sum(confidences) / len(confidences), 2) if confidences else 0,
+        'lines': kept_lines,
+        'words': list(words.values()),
+    }
+
+
+def ocr_keyframes(selection, count=FRAME_OCR_FRAMES, ocr=ocr_image):
+    """
+    OCR em paralelo dos count quadros-chave mais representativos, com o texto unido.
+
+    Returns:
+        dict: resultado de merge_ocr_results com 'preprocessing' (do primeiro quadro) e
+        'frames' (quadros lidos e relatório da seleção)
+    """
+    keyframes = selection.representative(count)
+    futures = [(keyframe.index, _get_frame_executor().submit(ocr, keyframe.gray)) for keyframe in keyframes]
+    results = [(index, future.result()) for index, future in futures]
+    merged = merge_ocr_results(results)
+    if 'preprocessing' in results[0][1]:
+        merged['preprocessing'] = results[0][1]['preprocessing']
+    merged['frames'] = {**selection.report(), 'ocr_frames': [index for index, _ in results]}
+    return merged
+
+
+def ocr_image_frames(data):
+    """ocr_image que, em imagens com vários quadros, lê os quadros-chave (ex: modo lote)"""
+    if MULTI_FRAME_ENABLED and is_multi_frame(data):
+        return ocr_keyframes(select_keyframes(data))
+    return ocr_image(data)
+
+
+def montage(frames):
+    """
+    Mosaico dos quadros em escala de cinza: lado a lado (2), em grade 2x2 (3-4) ou em
+    grade de 3 colunas. Os quadros têm o mesmo tamanho nas animações; se não, são
+    redimensionados para o tamanho do primeiro.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    height, width = frames[0].shape[:2]
+    columns = 2 if len(frames) <= 4 else 3
+    rows = -(-len(frames) // columns)
+    # Separação de 4px entre os quadros, para o modelo distinguir os limites
+    gap = 4
+    canvas = np.full((rows * height + (rows - 1) * gap, columns * width + (columns - 1) * gap), 255, np.uint8)
+    for position, frame in enumerate(frames):
+        if frame.shape[:2] != (height, width):
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        row, column = divmod(position, columns)
+        top, left = row * (height + gap), column * (width + gap)
+        canvas[top:top + height, left:left + width] = frame
+    return canvas
+
+
+def vision_frames(selection, count=FRAME_VISION_FRAMES):
+    """
+    Imagem do ramo visual: mosaico dos count quadros-chave mais representativos.
+
+    Returns:
+        tuple: (imagem em escala de cinza, índices dos quadros usados)
+    """
+    keyframes = selection.representative(count)
+    return montage([keyframe.gray for keyframe in keyframes]), [keyframe.index for keyframe in keyframes]
@@ -0,0 +1,357 @@
+"""
+Cliente HTTP compartilhado para a API do Google Gemini.
+
+Mantém conexões reutilizáveis (keep-alive) em um pool, aplica tempos limite de
+conexão e leitura, repete requisições com erro 429/5xx com backoff exponencial
+(respeitando Retry-After) e usa um circuit breaker para falhar rápido quando a
+API está fora do ar.
+
+Antes de cada envio, respeita o limite de requisições e tokens por minuto
+(rate_limiter.py, compartilhado entre processos) e chamadas idênticas em
+andamento no mesmo processo (ex: a mesma imagem enviada duas vezes ao mesmo
+tempo) compartilham uma única requisição ao Gemini.
+
+As respostas podem ser gravadas e reproduzidas sem acesso à API (GEMINI_FIXTURES,
+veja gemini_fixtures.py).
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import (
+    GEMINI_REQUESTS, GEMINI_RETRIES, GEMINI_CIRCUIT_REJECTIONS, GEMINI_SECONDS,
+    GEMINI_REQUEST_BYTES, GEMINI_RESPONSE_BYTES, GEMINI_IN_FLIGHT, GEMINI_COALESCED, GEMINI_RATE_LIMIT_WAIT
+)
+from rate_limiter import RateLimiter, estimate_tokens, default_state_path
+from gemini_fixtures import FixtureStore, fixture_key, FIXTURES_MODE, FIXTURES_DIR, REPLAY_LATENCY
+
+
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL', 'https://generativelanguage.googleapis.com/v1beta').rstrip('/')
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Abre após failure_threshold falhas consecutivas e rejeita chamadas por
+    recovery_timeout segundos. Depois disso deixa passar uma chamada de teste
+    (meio-aberto): sucesso fecha o circuito, falha o abre novamente.
+    """
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return 'half_open'
+            return 'open'
+
+    def before_call(self):
+        """
+        Returns:
+            bool: True se esta é a chamada de teste (quem a recebe deve encerrá-la com
+            record_success, record_failure ou release_trial)
+
+        Raises:
+            CircuitOpenError: se o circuito estiver aberto
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at < self.recovery_timeout or self._trial_in_progress:
+                raise CircuitOpenError("API do Gemini indisponível (circuit breaker aberto). Tente novamente mais tarde.")
+            self._trial_in_progress = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def release_trial(self):
+        """Libera a chamada de teste sem alterar o estado (a chamada terminou sem resposta avaliável)"""
+        with self._lock:
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+
+def _parse_retry_after(value):
+    """Converte o cabeçalho Retry-After (segundos ou data HTTP) em segundos"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _usage_tokens(response):
+    """Total de tokens consumidos, do usageMetadata da resposta (None se ausente)"""
+    try:
+        return response.json().get('usageMetadata', {}).get('totalTokenCount')
+    except (ValueError, AttributeError):
+        return None
+
+
+class GeminiClient:
+    """
+    Args:
+        api_key: chave da API do Gemini
+        model: modelo usado nas chamadas
+        base_url: URL base da API (pode apontar para um servidor stub local)
+        connect_timeout / read_timeout: tempos limite em segundos
+        max_retries: número de novas tentativas para 429/5xx e erros de conexão
+        backoff_base / backoff_max: espera inicial e máxima entre tentativas (segundos)
+        pool_size: conexões mantidas abertas por host
+        failure_threshold / recovery_timeout: parâmetros do circuit breaker
+        rpm / tpm: limite de requisições e de tokens por minuto (0 = sem limite)
+        rate_limit_file: arquivo do estado do limite, compartilhado entre processos
+            (padrão: um arquivo por chave de API no diretório temporário; '' = só este processo)
+        rate_limit_max_wait: espera máxima pelo limite antes de RateLimitTimeoutError
+        coalesce: se True, chamadas idênticas em andamento compartilham a mesma requisição
+        fixtures_mode: 'off', 'record' (grava as respostas) ou 'replay' (reproduz as
+            gravadas sem chamar a API; dispensa a chave)
+        fixtures_dir / replay_latency: diretório das fixtures e latência simulada na
+            reprodução ('recorded' ou segundos)
+    """
+
+    def __init__(self, api_key, model=GEMINI_MODEL, base_url=GEMINI_BASE_URL,
+                 connect_timeout=float(os.getenv('GEMINI_CONNECT_TIMEOUT', '5')),
+                 read_timeout=float(os.getenv('GEMINI_READ_TIMEOUT', '60')),
+                 max_retries=int(os.getenv('GEMINI_MAX_RETRIES', '3')),
+                 backoff_base=float(os.getenv('GEMINI_BACKOFF_BASE', '0.5')),
+                 backoff_max=float(os.getenv('GEMINI_BACKOFF_MAX', '20')),
+                 pool_size=int(os.getenv('GEMINI_POOL_SIZE', '20')),
+                 failure_threshold=int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5')),
+                 recovery_timeout=float(os.getenv('GEMINI_BREAKER_COOLDOWN', '30')),
+                 rpm=int(os.getenv('GEMINI_RPM', '0')),
+                 tpm=int(os.getenv('GEMINI_TPM', '0')),
+                 rate_limit_file=os.getenv('GEMINI_RATE_LIMIT_FILE'),
+                 rate_limit_max_wait=float(os.getenv('GEMINI_RATE_LIMIT_MAX_WAIT', '30')),
+                 coalesce=os.getenv('GEMINI_COALESCE', 'true').lower() == 'true',
+                 fixtures_mode=FIXTURES_MODE, fixtures_dir=FIXTURES_DIR, replay_latency=REPLAY_LATENCY):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+        if rate_limit_file is None:
+            rate_limit_file = default_state_path(api_key)
+        self.rate_limiter = RateLimiter(rpm, tpm, rate_limit_file or None, rate_limit_max_wait)
+        self.coalesce = coalesce
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.fixtures = FixtureStore(fixtures_dir, fixtures_mode, replay_latency) if fixtures_mode != 'off' else None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'X-goog-api-key': api_key
+        })
+
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'retries': 0, 'failures': 0, 'circuit_rejections': 0, 'coalesced': 0}
+
+    @property
+    def url(self):
+        return f"{self.base_url}/models/{self.model}:generateContent"
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['circuit_state'] = self.breaker.state
+        if self.fixtures is not None:
+            stats['fixtures'] = self.fixtures.stats()
+        if self.rate_limiter.enabled:
+            stats['rate_limit'] = self.rate_limiter.stats()
+        return stats
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Backoff exponencial com jitter completo
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, payload, call='generate'):
+        """
+        Envia o payload para generateContent.
+
+        Args:
+            payload: corpo da requisição
+            call: nome da chamada nas métricas (ex: 'cleanup', 'text_analysis', 'vision')
+
+        Returns:
+            requests.Response: a última resposta recebida (pode ser de erro, após esgotar as tentativas)
+
+        Raises:
+            ValueError: se a chave de API não foi configurada (exceto no modo replay)
+            FixtureNotFoundError: no modo replay, se a chamada não tiver sido gravada
+            CircuitOpenError: se o circuit breaker estiver aberto
+            RateLimitTimeoutError: se a espera pelo limite de RPM/TPM passar de rate_limit_max_wait
+            requests.RequestException: se todas as tentativas falharem por erro de rede
+        """
+        if not self.api_key and not (self.fixtures and self.fixtures.replaying):
+            raise ValueError("GOOG_API_KEY não encontrada nas variáveis de ambiente. "
+                             "Por favor, configure a variável GOOG_API_KEY.")
+        body = json.dumps(payload).encode('utf-8')
+        if not self.coalesce:
+            return self._post(payload, body, call)
+
+        key = hashlib.sha256(self.url.encode('utf-8') + body).digest()
+        with self._inflight_lock:
+            shared = self._inflight.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._inflight[key] = Future()
+        if not leader:
+            # Mesma chamada já em andamento: espera a resposta dela
+            self._count('coalesced')
+            GEMINI_COALESCED.inc(call=call)
+            return shared.result()
+
+        try:
+            response = self._post(payload, body, call)
+        except BaseException as e:
+            shared.set_exception(e)
+            raise
+        else:
+            shared.set_result(response)
+            return response
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _post(self, payload, body, call):
+        try:
+            trial = self.breaker.before_call()
+        except CircuitOpenError:
+            self._count('circuit_rejections')
+            GEMINI_CIRCUIT_REJECTIONS.inc(call=call)
+            raise
+
+        start = time.perf_counter()
+        GEMINI_IN_FLIGHT.inc(call=call)
+        try:
+            return self._post_with_retries(payload, body, call)
+        except BaseException:
+            # Exceções que não são falhas da API (fixture ausente, espera da cota esgotada,
+            # interrupção) não mudam o estado, mas a chamada de teste precisa ser liberada.
+            # Se a falha já foi registrada, a liberação não tem efeito.
+            if trial:
+                self.breaker.release_trial()
+            raise
+        finally:
+            GEMINI_IN_FLIGHT.dec(call=call)
+            GEMINI_SECONDS.observe(time.perf_counter() - start, call=call)
+
+    def _wait_for_quota(self, tokens, call):
+        # RateLimitTimeoutError não é falha da API: o circuit breaker não conta (veja _post)
+        waited = self.rate_limiter.acquire(tokens)
+        if waited:
+            GEMINI_RATE_LIMIT_WAIT.observe(waited, call=call)
+
+    def _send(self, payload, body, call):
+        if self.fixtures is None:
+            return self.session.post(self.url, data=body, timeout=self.timeout)
+        key = fixture_key(self.model, body)
+        if self.fixtures.replaying:
+            return self.fixtures.replay(key, call, payload, url=self.url)
+        start = time.perf_counter()
+        response = self.session.post(self.url, data=body, timeout=self.timeout)
+        self.fixtures.record(key, call, payload, response, time.perf_counter() - start)
+        return response
+
+    def _post_with_retries(self, payload, body, call):
+        tokens = estimate_tokens(payload)
+        attempt = 0
+        while True:
+            self._wait_for_quota(tokens, call)
+            self._count('requests')
+            try:
+                response = self._send(payload, body, call)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                GEMINI_REQUESTS.inc(call=call, status='error')
+                if attempt >= self.max_retries:
+                    self._count('failures')
+                    self.breaker.record_failure()
+                    raise
+                time.sleep(self._backoff(attempt))
+            else:
+                GEMINI_REQUESTS.inc(call=call, status=response.status_code)
+                GEMINI_REQUEST_BYTES.inc(len(body), call=call)
+                GEMINI_RESPONSE_BYTES.inc(len(response.content), call=call)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self.breaker.record_success()
+                    self.rate_limiter.settle(tokens, _usage_tokens(response))
+                    return response
+                if attempt >= self.max_retries:
+                    self._count('failures')
+                    self.breaker.record_failure()
+                    return response
+                delay = self._backoff(attempt, _parse_retry_after(response.headers.get('Retry-After')))
+                if response.status_code == 429:
+                    # Cota esgotada: todos os chamadores (inclusive de outros processos) esperam
+                    self.rate_limiter.block(delay)
+                time.sleep(delay)
+            attempt += 1
+            self._count('retries')
+            GEMINI_RETRIES.inc(call=call)
+
+    def generate_content(self, parts, call='generate', generation_config=None):
+        """
+        Args:
+            parts: lista de partes do conteúdo (ex: [{"text": "..."}] ou inline_data)
+            call: nome da chamada nas métricas
+            generation_config: generationConfig opcional da API
+                (ex: {"responseMimeType": "application/json"} para o modo JSON)
+
+        Returns:
+            requests.Response
+        """
+        payload = {"contents": [{"parts": parts}]}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        return self.post(payload, call=call)
@@ -0,0 +1,153 @@
+"""
+Gravação e reprodução das respostas do Gemini (fixtures), para medir e testar o
+fluxo completo sem chave de API e sem depender da rede.
+
+GEMINI_FIXTURES=record: as chamadas vão à API normalmente e cada resposta 200 é
+gravada em GEMINI_FIXTURES_DIR, um arquivo JSON por chamada, identificado pelo
+hash do modelo e do corpo da requisição (mesmo prompt e mesma imagem enviada).
+
+GEMINI_FIXTURES=replay: nenhuma requisição é feita; a resposta gravada é devolvida
+após uma latência simulada (GEMINI_REPLAY_LATENCY: 'recorded' repete o tempo medido
+na gravação, ou um valor fixo em segundos). Uma chamada sem fixture gera
+FixtureNotFoundError, a menos que um fallback tenha sido configurado (ex: as
+respostas do stub nos benchmarks).
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+import requests
+
+
+FIXTURES_MODES = ('off', 'record', 'replay')
+FIXTURES_MODE = os.getenv('GEMINI_FIXTURES', 'off').lower()
+FIXTURES_DIR = os.getenv('GEMINI_FIXTURES_DIR', os.path.join('fixtures', 'gemini'))
+REPLAY_LATENCY = os.getenv('GEMINI_REPLAY_LATENCY', 'recorded')
+
+
+class FixtureNotFoundError(Exception):
+    pass
+
+
+def fixture_key(model, body):
+    """Identifica a chamada pelo modelo e pelo corpo já serializado"""
+    return hashlib.sha256(model.encode('utf-8') + b'\0' + body).hexdigest()[:32]
+
+
+def describe_payload(payload, limit=200):
+    """Resumo legível da chamada gravado junto da resposta (o corpo completo inclui a imagem)"""
+    texts = []
+    images = 0
+    for content in payload.get('contents', []):
+        for part in content.get('parts', []):
+            if 'text' in part:
+                texts.append(part['text'])
+            elif 'inline_data' in part:
+                images += 1
+    prompt = ' '.join(texts)
+    return {'prompt': prompt[:limit] + ('...' if len(prompt) > limit else ''), 'images': images}
+
+
+def build_response(body, status_code=200, url=None):
+    """requests.Response montada a partir de um corpo JSON, como se viesse da API"""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode('utf-8')
+    response.headers['Content-Type'] = 'application/json'
+    response.encoding = 'utf-8'
+    response.url = url
+    return response
+
+
+class FixtureStore:
+    """
+    Args:
+        directory: diretório das fixtures
+        mode: 'record' ou 'replay'
+        latency: 'recorded' ou segundos de espera por resposta reproduzida
+        fallback: no modo replay, função chamada como fallback(payload) para chamadas
+            sem fixture; devolve o texto da resposta (None = FixtureNotFoundError)
+        fallback_latency: espera, em segundos, das respostas do fallback
+    """
+
+    def __init__(self, directory=FIXTURES_DIR, mode=FIXTURES_MODE, latency=REPLAY_LATENCY,
+                 fallback=None, fallback_latency=0.0):
+        if mode not in FIXTURES_MODES[1:]:
+            raise ValueError(f"GEMINI_FIXTURES inválido: {mode}. Use {', '.join(FIXTURES_MODES)}.")
+        self.directory = directory
+        self.mode = mode
+        self.latency = latency if latency == 'recorded' else float(latency)
+        self.fallback = fallback
+        self.fallback_latency = fallback_latency
+        self._lock = threading.Lock()
+        self._stats = {'recorded': 0, 'replayed': 0, 'fallbacks': 0, 'missing': 0}
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return {'mode': self.mode, 'directory': self.directory, **self._stats}
+
+    def record(self, key, call, payload, response, elapsed):
+        """Grava a resposta (apenas 200) de forma atômica: leitores nunca veem um arquivo pela metade"""
+        if response.status_code != 200:
+            return
+        fixture = {
+            'key': key,
+            'call': call,
+            **describe_payload(payload),
+            'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'elapsed': round(elapsed, 4),
+            'status_code': response.status_code,
+            'response': response.json(),
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path(key))
+        self._count('recorded')
+
+    def load(self, key):
+        try:
+            with open(self.path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def replay(self, key, call, payload, url=None):
+        """
+        Devolve a resposta gravada para a chamada, após a latência simulada.
+
+        Raises:
+            FixtureNotFoundError: se não houver fixture nem fallback
+        """
+        fixture = self.load(key)
+        if fixture is None:
+            text = self.fallback(payload) if self.fallback else None
+            if text is None:
+                self._count('missing')
+                raise FixtureNotFoundError(
+                    f"Nenhuma fixture para a chamada '{call}' ({key}) em {self.directory}. "
+                    f"Grave-a com GEMINI_FIXTURES=record."
+                )
+            self._count('fallbacks')
+            time.sleep(self.fallback_latency)
+            return build_response({'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}]},
+                                  url=url)
+        self._count('replayed')
+        time.sleep(fixture.get('elapsed', 0.0) if self.latency == 'recorded' else self.latency)
+        return build_response(fixture['response'], fixture.get('status_code', 200), url=url)
@@ -0,0 +1,4 @@
+# Configuração do gunicorn (gunicorn -c gunicorn.conf.py wsgi:app), lida do ambiente. Veja serving.py
+from serving import gunicorn_options
+
+globals().update(gunicorn_options())
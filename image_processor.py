@@ -1,51 +1,587 @@
 """
 Módulo para processamento de imagens e extração de texto usando OCR (Tesseract)
 """
+import os
+import io
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
 import pytesseract
 from PIL import Image
-import io
 
+from preprocessing import PreprocessingPipeline, OCR_PREPROCESS
+from text_regions import OCR_REGIONS, MAX_REGION_COVERAGE, MAX_REGIONS, detect_text_regions, region_coverage
 
-def extract_text_from_image(image_data):
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+OCR_CONFIG = r'--oem 3 --psm 6'
+OCR_LANG = 'por+eng'
+
+# Backend de OCR: 'auto' (tesserocr se instalado, senão pytesseract), 'tesserocr' ou 'pytesseract'
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'auto').lower()
+# Número de engines tesserocr reutilizáveis (padrão: número de CPUs)
+OCR_POOL_SIZE = int(os.getenv('OCR_POOL_SIZE', '0')) or os.cpu_count() or 1
+
+# Pré-processamento aplicado antes do OCR (preset ou lista de etapas, veja preprocessing.py)
+OCR_PREPROCESSING = PreprocessingPipeline.from_spec(OCR_PREPROCESS)
+
+# Imagem enviada ao Gemini: maior lado em pixels e tamanho máximo do arquivo em bytes
+VISION_MAX_SIDE = int(os.getenv('VISION_MAX_SIDE', '1536'))
+VISION_BYTE_BUDGET = int(os.getenv('VISION_BYTE_BUDGET', str(300 * 1024)))
+# Codificadores testados (jpeg, webp, png). WebP gera arquivos menores, mas é ~10x mais lento que JPEG
+VISION_ENCODERS = [name.strip() for name in os.getenv('VISION_ENCODERS', 'jpeg').split(',') if name.strip()]
+VISION_QUALITIES = (90, 80, 70, 60, 50, 40)
+
+_ENCODERS = {
+    'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+    'png': ('.png', 'image/png', None),
+}
+
+
+def _array_to_pil(img):
+    """PIL Image sobre o buffer de um array uint8 em escala de cinza (sem cópia); BGR é convertido"""
+    if img.ndim == 2:
+        img = np.ascontiguousarray(img)
+        return Image.frombuffer('L', (img.shape[1], img.shape[0]), img, 'raw', 'L', 0, 1)
+    return Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+
+
+class PytesseractEngine:
+    """
+    Backend via pytesseract: cada chamada grava a imagem em arquivo temporário
+    e executa o binário tesseract, recarregando os modelos de idioma.
+    """
+    name = 'pytesseract'
+
+    def image_to_data(self, image):
+        if isinstance(image, np.ndarray):
+            image = _array_to_pil(image)
+        return pytesseract.image_to_data(image, config=OCR_CONFIG, lang=OCR_LANG, output_type=pytesseract.Output.DICT)
+
+
+class TesserocrEngine:
+    """
+    Backend via libtesseract (tesserocr): os modelos são carregados uma vez por
+    engine e as engines ficam em um pool, reutilizadas entre requisições.
+    Cada engine atende uma imagem por vez.
+    """
+    name = 'tesserocr'
+
+    def __init__(self, pool_size=OCR_POOL_SIZE):
+        if tesserocr is None:
+            raise ImportError("tesserocr não está instalado.")
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(tesserocr.PyTessBaseAPI(
+                lang=OCR_LANG,
+                psm=tesserocr.PSM.SINGLE_BLOCK,
+                oem=tesserocr.OEM.DEFAULT
+            ))
+
+    def image_to_data(self, image):
+        """Retorna os mesmos campos de pytesseract.image_to_data (Output.DICT)"""
+        api = self._pool.get()
+        try:
+            if isinstance(image, np.ndarray):
+                # Passa os pixels diretamente, sem recodificar a imagem como faz SetImage(PIL)
+                image = np.ascontiguousarray(image) if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+                api.SetImageBytes(image.tobytes(), image.shape[1], image.shape[0], bytes_per_pixel, image.strides[0])
+            else:
+                api.SetImage(image)
+            api.Recognize()
+
+            data = {key: [] for key in ('text', 'conf', 'left', 'top', 'width', 'height',
+                                        'block_num', 'par_num', 'line_num', 'word_num')}
+            level = tesserocr.RIL.WORD
+            block_num = par_num = line_num = word_num = 0
+            for word in tesserocr.iterate_level(api.GetIterator(), level):
+                if word.IsAtBeginningOf(tesserocr.RIL.BLOCK):
+                    block_num += 1
+                    par_num = 0
+                if word.IsAtBeginningOf(tesserocr.RIL.PARA):
+                    par_num += 1
+                    line_num = 0
+                if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                    line_num += 1
+                    word_num = 0
+                word_num += 1
+
+                box = word.BoundingBox(level)
+                if box is None:
+                    continue
+                x1, y1, x2, y2 = box
+                data['text'].append(word.GetUTF8Text(level) or '')
+                data['conf'].append(word.Confidence(level))
+                data['left'].append(x1)
+                data['top'].append(y1)
+                data['width'].append(x2 - x1)
+                data['height'].append(y2 - y1)
+                data['block_num'].append(block_num)
+                data['par_num'].append(par_num)
+                data['line_num'].append(line_num)
+                data['word_num'].append(word_num)
+            return data
+        finally:
+            api.Clear()
+            self._pool.put(api)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def create_ocr_engine(backend=OCR_BACKEND, pool_size=OCR_POOL_SIZE):
+    """
+    Cria um backend de OCR.
+
+    Args:
+        backend: 'auto', 'tesserocr' ou 'pytesseract'
+        pool_size: número de engines tesserocr
+    """
+    if backend == 'pytesseract':
+        return PytesseractEngine()
+    if backend == 'tesserocr':
+        return TesserocrEngine(pool_size)
+    if backend == 'auto':
+        try:
+            return TesserocrEngine(pool_size)
+        except Exception:
+            return PytesseractEngine()
+    raise ValueError(f"Backend de OCR desconhecido: {backend}")
+
+
+def init_ocr_engine(pool_size=OCR_POOL_SIZE):
+    """
+    Cria o backend de OCR do processo antecipadamente (carregando os modelos de idioma).
+    Processos de trabalho que fazem OCR de uma imagem por vez usam pool_size=1.
+    """
+    global _engine
+    with _engine_lock:
+        _engine = create_ocr_engine(pool_size=pool_size)
+    return _engine
+
+
+def get_ocr_engine():
+    """Retorna o backend de OCR do processo, criado (e com modelos carregados) uma única vez"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_ocr_engine()
+    return _engine
+
+
+class DecodedImage:
+    """
+    Imagem decodificada uma única vez por requisição e compartilhada entre as etapas
+    (OCR, pré-processamento, hash perceptual).
+
+    As visões são calculadas sob demanda e reaproveitadas: 'gray' é decodificada
+    diretamente em escala de cinza (sem passar por BGR) e 'pil_gray' é um PIL Image
+    sobre o mesmo buffer, sem cópia. Os arrays são somente leitura; etapas que
+    alteram a imagem devem trabalhar em uma cópia.
+
+    A conversão para cinza do decodificador arredonda diferente de
+    cv2.cvtColor(BGR2GRAY): 40-50% dos pixels diferem em um nível. Etapas que
+    esticam o histograma ampliam a diferença: após o pré-processamento visual
+    (equalizeHist) ela chega a ~32 níveis em ~27-32% dos pixels, sem mudança visível
+    na imagem. Comparação: python3 benchmarks/bench_decode.py
+
+    Args:
+        data: bytes da imagem
+
+    Attributes:
+        decode_ms: tempo gasto decodificando a imagem até agora, em ms
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.decode_ms = 0.0
+        self._bgr = None
+        self._gray = None
+        self._lock = threading.Lock()
+
+    def _decode(self, flags, pil_mode):
+        start = time.perf_counter()
+        img = cv2.imdecode(np.frombuffer(self.data, np.uint8), flags)
+        if img is None:
+            # Formatos que o OpenCV não lê (ex: GIF) passam pelo PIL
+            try:
+                pil_image = Image.open(io.BytesIO(self.data)).convert(pil_mode)
+            except Exception:
+                raise ValueError("Erro ao decodificar a imagem.")
+            img = np.asarray(pil_image)
+            if pil_mode == 'RGB':
+                img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+        img.flags.writeable = False
+        self.decode_ms += (time.perf_counter() - start) * 1000
+        return img
+
+    @property
+    def bgr(self):
+        with self._lock:
+            if self._bgr is None:
+                self._bgr = self._decode(cv2.IMREAD_COLOR, 'RGB')
+            return self._bgr
+
+    @property
+    def gray(self):
+        with self._lock:
+            if self._gray is None:
+                if self._bgr is not None:
+                    gray = cv2.cvtColor(self._bgr, cv2.COLOR_BGR2GRAY)
+                    gray.flags.writeable = False
+                    self._gray = gray
+                else:
+                    self._gray = self._decode(cv2.IMREAD_GRAYSCALE, 'L')
+            return self._gray
+
+    @property
+    def pil_gray(self):
+        return _array_to_pil(self.gray)
+
+    @property
+    def size(self):
+        """(largura, altura)"""
+        img = self._gray if self._gray is not None else self.gray
+        return img.shape[1], img.shape[0]
+
+
+def _load_image(image_data):
+    if isinstance(image_data, bytes):
+        return Image.open(io.BytesIO(image_data))
+    elif isinstance(image_data, DecodedImage):
+        return image_data.gray
+    elif isinstance(image_data, (Image.Image, np.ndarray)):
+        return image_data
+    else:
+        raise ValueError("Formato de imagem não suportado. Use bytes, PIL Image, numpy ou DecodedImage.")
+
+
+def _to_gray(image):
+    if isinstance(image, np.ndarray):
+        return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return np.asarray(image.convert('L'))
+
+
+def _scale_boxes(result, factor):
+    for item in result['lines'] + result['words'] + result.get('regions', []):
+        item['box'] = [round(value * factor) for value in item['box']]
+
+
+_region_executor = None
+
+
+def _get_region_executor():
+    """Pool de threads compartilhado para o OCR das regiões (o Tesseract libera o GIL)"""
+    global _region_executor
+    if _region_executor is None:
+        with _engine_lock:
+            if _region_executor is None:
+                _region_executor = ThreadPoolExecutor(max_workers=OCR_POOL_SIZE, thread_name_prefix='ocr-region')
+    return _region_executor
+
+
+def _ocr_regions(image, engine, method, detect_image=None, scale=1.0):
+    """
+    Detecta as regiões de texto e faz o OCR de cada recorte em paralelo.
+
+    Args:
+        image: imagem (já pré-processada) usada no OCR
+        detect_image: imagem usada na detecção (padrão: image); as caixas encontradas
+            são multiplicadas por scale para chegar às coordenadas de image
+
+    Returns:
+        tuple: (resultado no formato de _build_ocr_result com o campo 'regions', ou None
+        quando o OCR da imagem inteira é preferível: nenhuma região encontrada, regiões
+        demais ou cobertura alta; relatório da detecção, com o motivo em 'fallback')
+    """
+    start = time.perf_counter()
+    regions = detect_text_regions(image if detect_image is None else detect_image, method)
+    if scale != 1:
+        height, width = image.shape[:2]
+        regions = [
+            [round(x * scale), round(y * scale), min(width, round((x + w) * scale)) - round(x * scale),
+             min(height, round((y + h) * scale)) - round(y * scale)]
+            for x, y, w, h in regions
+        ]
+    coverage = region_coverage(regions, image.shape)
+    report = {
+        'method': method,
+        'count': len(regions),
+        'coverage': round(coverage, 3),
+        'detection_ms': round((time.perf_counter() - start) * 1000, 2),
+        'fallback': None,
+    }
+    if not regions:
+        # Legendas com pouco contraste, pequenas ou estilizadas podem escapar do detector
+        report['fallback'] = 'no_regions'
+        return None, report
+    if len(regions) > MAX_REGIONS:
+        report['fallback'] = 'too_many_regions'
+        return None, report
+    if coverage > MAX_REGION_COVERAGE:
+        report['fallback'] = 'coverage'
+        return None, report
+
+    # Recortes são visões do mesmo buffer, sem cópia
+    futures = [
+        _get_region_executor().submit(engine.image_to_data, image[y:y + h, x:x + w])
+        for x, y, w, h in regions
+    ]
+    merged = {key: [] for key in ('text', 'conf', 'left', 'top', 'width', 'height',
+                                  'block_num', 'par_num', 'line_num', 'word_num')}
+    region_results = []
+    for index, ((x, y, w, h), future) in enumerate(zip(regions, futures)):
+        data = future.result()
+        region_result = _build_ocr_result(data)
+        region_results.append({
+            'box': [x, y, w, h],
+            'text': region_result['text'],
+            'confidence': region_result['confidence'],
+        })
+        # Cada região vira um bloco próprio, deslocado para as coordenadas da imagem
+        for i in range(len(data['text'])):
+            merged['text'].append(data['text'][i])
+            merged['conf'].append(data['conf'][i])
+            merged['left'].append(data['left'][i] + x)
+            merged['top'].append(data['top'][i] + y)
+            merged['width'].append(data['width'][i])
+            merged['height'].append(data['height'][i])
+            merged['block_num'].append((index, data['block_num'][i]))
+            merged['par_num'].append(data['par_num'][i])
+            merged['line_num'].append(data['line_num'][i])
+            merged['word_num'].append(data['word_num'][i])
+
+    result = _build_ocr_result(merged)
+    result['regions'] = region_results
+    return result, report
+
+
+def _build_ocr_result(data):
+    """
+    Reconstrói texto, linhas e palavras a partir da saída de image_to_data.
+
+    Args:
+        data: dicionário retornado por pytesseract.image_to_data (Output.DICT)
+
+    Returns:
+        dict: {'text', 'confidence', 'lines', 'words'}
+    """
+    words = []
+    lines = []
+    current_key = None
+    current_words = []
+
+    def close_line():
+        if not current_words:
+            return
+        line_confidences = [w['confidence'] for w in current_words if w['confidence'] > 0]
+        left = min(w['box'][0] for w in current_words)
+        top = min(w['box'][1] for w in current_words)
+        right = max(w['box'][0] + w['box'][2] for w in current_words)
+        bottom = max(w['box'][1] + w['box'][3] for w in current_words)
+        lines.append({
+            'text': ' '.join(w['text'] for w in current_words),
+            'confidence': round(sum(line_confidences) / len(line_confidences), 2) if line_confidences else 0,
+            'box': [left, top, right - left, bottom - top],
+            'paragraph': current_key[:2],
+        })
+
+    for i, raw_text in enumerate(data['text']):
+        text = (raw_text or '').strip()
+        if not text:
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        if key != current_key:
+            close_line()
+            current_key = key
+            current_words = []
+        word = {
+            'text': text,
+            'confidence': float(data['conf'][i]),
+            'box': [data['left'][i], data['top'][i], data['width'][i], data['height'][i]],
+        }
+        current_words.append(word)
+        words.append(word)
+    close_line()
+
+    # Linhas do mesmo parágrafo separadas por '\n', parágrafos por linha em branco
+    text_parts = []
+    previous_paragraph = None
+    for line in lines:
+        if previous_paragraph is not None and line['paragraph'] != previous_paragraph:
+            text_parts.append('')
+        text_parts.append(line['text'])
+        previous_paragraph = line.pop('paragraph')
+
+    confidences = [w['confidence'] for w in words if w['confidence'] > 0]
+    avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+
+    return {
+        'text': '\n'.join(text_parts).strip(),
+        'confidence': round(avg_confidence, 2),
+        'lines': lines,
+        'words': words,
+    }
+
+
+def ocr_image(image_data, engine=None, preprocessing=None, regions=None):
+    """
+    Executa o Tesseract uma única vez e retorna o resultado estruturado.
+
+    Args:
+        image_data: bytes da imagem, PIL Image, numpy (escala de cinza ou BGR) ou DecodedImage
+        engine: backend de OCR (padrão: get_ocr_engine())
+        preprocessing: PreprocessingPipeline aplicado antes do OCR (padrão: OCR_PREPROCESSING)
+        regions: detector de regiões de texto ('off', 'gradient' ou 'mser'; padrão: OCR_REGIONS).
+            Com um detector, apenas os recortes com texto passam pelo Tesseract, em paralelo
+
+    Returns:
+        dict: {
+            'text': texto extraído,
+            'confidence': confiança média das palavras,
+            'lines': [{'text', 'confidence', 'box'}],
+            'words': [{'text', 'confidence', 'box'}],
+            'preprocessing': relatório do pré-processamento (apenas se houver etapas),
+            'regions': [{'text', 'confidence', 'box'}] em ordem de leitura (apenas com detector),
+            'region_detection': {'method', 'count', 'coverage', 'detection_ms', 'fallback'}
+        }
+        onde box = [left, top, width, height], sempre nas coordenadas da imagem original
+        (exceto pela rotação de 'deskew', indicada em preprocessing['angle'])
+    """
     try:
-        if isinstance(image_data, bytes):
-            image = Image.open(io.BytesIO(image_data))
-        elif isinstance(image_data, Image.Image):
-            image = image_data
+        preprocessing = OCR_PREPROCESSING if preprocessing is None else preprocessing
+        regions = (regions or OCR_REGIONS).lower()
+        engine = engine or get_ocr_engine()
+        report = None
+        if preprocessing or regions != 'off':
+            if isinstance(image_data, bytes):
+                image_data = DecodedImage(image_data)
+            image = gray = _to_gray(_load_image(image_data))
+            if preprocessing:
+                image, report = preprocessing.run(gray)
         else:
-            raise ValueError("Formato de imagem não suportado. Use bytes ou PIL Image.")
-        
-        custom_config = r'--oem 3 --psm 6'
-        extracted_text = pytesseract.image_to_string(image, config=custom_config, lang='por+eng')
-        
-        return extracted_text.strip()
-    
+            image = _load_image(image_data)
+
+        result = None
+        detection = None
+        if regions != 'off':
+            # A detecção usa a imagem original (realces como CLAHE destacam também a textura),
+            # exceto se o pré-processamento girou a imagem
+            if report is None or report['angle'] is not None:
+                result, detection = _ocr_regions(image, engine, regions)
+            else:
+                result, detection = _ocr_regions(image, engine, regions, detect_image=gray, scale=report['scale'])
+        if result is None:
+            result = _build_ocr_result(engine.image_to_data(image))
+        if detection is not None:
+            result['region_detection'] = detection
+        if report is not None:
+            if report['scale'] != 1:
+                _scale_boxes(result, 1 / report['scale'])
+            result['preprocessing'] = report
+        return result
+
     except Exception as e:
         raise Exception(f"Erro ao processar imagem: {str(e)}")
 
 
+def extract_text_from_image(image_data):
+    return ocr_image(image_data)['text']
+
+
 def extract_text_with_confidence(image_data):
-    try:
-        if isinstance(image_data, bytes):
-            image = Image.open(io.BytesIO(image_data))
-        elif isinstance(image_data, Image.Image):
-            image = image_data
-        else:
-            raise ValueError("Formato de imagem não suportado. Use bytes ou PIL Image.")
-        
-        custom_config = r'--oem 3 --psm 6'
-        data = pytesseract.image_to_data(image, config=custom_config, lang='por+eng', output_type=pytesseract.Output.DICT)
-        
-        text = pytesseract.image_to_string(image, config=custom_config, lang='por+eng')
-        
-        confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0
-        
-        return {
-            'text': text.strip(),
-            'confidence': round(avg_confidence, 2)
-        }
-    
-    except Exception as e:
-        raise Exception(f"Erro ao processar imagem: {str(e)}")
+    result = ocr_image(image_data)
+    return {
+        'text': result['text'],
+        'confidence': result['confidence']
+    }
+
+
+def _encode(img, encoder, quality):
+    extension, mime_type, quality_flag = _ENCODERS[encoder]
+    params = [quality_flag, quality] if quality_flag is not None else [cv2.IMWRITE_PNG_COMPRESSION, 6]
+    success, encoded = cv2.imencode(extension, img, params)
+    if not success:
+        raise ValueError(f"Erro ao codificar a imagem em {encoder}.")
+    return encoded.tobytes(), mime_type
+
+
+def optimize_image_payload(img, original_bytes=None, max_side=VISION_MAX_SIDE,
+                           byte_budget=VISION_BYTE_BUDGET, encoders=None):
+    """
+    Reduz e recodifica a imagem para o envio ao Gemini.
+
+    Limita o maior lado a max_side e escolhe a maior qualidade cujo resultado cabe
+    em byte_budget (o menor entre os codificadores). Se nenhuma qualidade couber,
+    reduz a imagem proporcionalmente ao excesso e tenta novamente.
+
+    Args:
+        img: imagem numpy (BGR ou escala de cinza)
+        original_bytes: tamanho do arquivo original, apenas para o relatório
+        max_side: maior lado permitido em pixels
+        byte_budget: tamanho máximo desejado em bytes
+        encoders: lista de codificadores ('jpeg', 'webp', 'png')
+
+    Returns:
+        tuple: (bytes codificados, tipo MIME, relatório com tamanhos e dimensões)
+    """
+    encoders = encoders or VISION_ENCODERS
+    original_height, original_width = img.shape[:2]
+
+    longest = max(original_height, original_width)
+    if longest > max_side:
+        scale = max_side / longest
+        img = cv2.resize(img, (max(1, round(original_width * scale)), max(1, round(original_height * scale))),
+                         interpolation=cv2.INTER_AREA)
+
+    def encode_smallest(quality):
+        best = None
+        for encoder in encoders:
+            data, mime_type = _encode(img, encoder, quality)
+            if best is None or len(data) < len(best[0]):
+                best = (data, mime_type, encoder, quality)
+        return best
+
+    while True:
+        # O tamanho cresce com a qualidade: tenta a maior e, se não couber, faz busca binária
+        best = encode_smallest(VISION_QUALITIES[0])
+        if len(best[0]) > byte_budget and any(_ENCODERS[encoder][2] is not None for encoder in encoders):
+            low, high = 1, len(VISION_QUALITIES) - 1
+            while low <= high:
+                middle = (low + high) // 2
+                candidate = encode_smallest(VISION_QUALITIES[middle])
+                if len(candidate[0]) <= byte_budget:
+                    best = candidate
+                    high = middle - 1
+                else:
+                    if len(candidate[0]) < len(best[0]):
+                        best = candidate
+                    low = middle + 1
+        height, width = img.shape[:2]
+        if len(best[0]) <= byte_budget or max(height, width) <= 256:
+            break
+        # O tamanho do arquivo é aproximadamente proporcional à área da imagem
+        scale = min(0.9, max(0.5, (byte_budget / len(best[0])) ** 0.5))
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
 
+    data, mime_type, encoder, quality = best
+    height, width = img.shape[:2]
+    return data, mime_type, {
+        'original_bytes': original_bytes,
+        'final_bytes': len(data),
+        'original_size': [original_width, original_height],
+        'final_size': [width, height],
+        'encoder': encoder,
+        'quality': quality if _ENCODERS[encoder][2] is not None else None,
+    }
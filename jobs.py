@@ -0,0 +1,498 @@
+"""
+Fila de trabalhos assíncronos para análises demoradas.
+
+POST /jobs enfileira a imagem e devolve um id imediatamente; um pool de threads
+processa a fila (maior prioridade primeiro, depois a mais antiga) e o resultado
+fica disponível em GET /jobs/<id> e, opcionalmente, é enviado para uma URL de
+callback. Sem broker externo:
+- em memória (padrão): a fila pertence ao processo
+- SQLite (JOB_QUEUE_DB): a fila é compartilhada pelos processos do servidor e
+  sobrevive a reinícios; qualquer processo pode consultar ou processar os trabalhos
+
+O resultado é gravado assim que a análise termina; o callback é enviado depois, por
+um pool separado, e o estado da entrega ('pending', 'delivered' ou 'failed') é
+registrado no campo 'callback' do trabalho.
+"""
+import os
+import json
+import time
+import uuid
+import heapq
+import socket
+import sqlite3
+import ipaddress
+import threading
+import itertools
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+JOB_QUEUE_DB = os.getenv('JOB_QUEUE_DB') or None
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+# Trabalhos aguardando na fila acima disso são recusados (429)
+JOB_QUEUE_MAX_DEPTH = int(os.getenv('JOB_QUEUE_MAX_DEPTH', '100'))
+# Tempo (s) que os resultados ficam disponíveis após a conclusão
+JOB_RETENTION = float(os.getenv('JOB_RETENTION', '3600'))
+# Trabalhos em execução há mais tempo que isso (ex: processo encerrado) voltam para a fila (SQLite)
+JOB_STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', '600'))
+
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+CALLBACK_ATTEMPTS = 3
+CALLBACK_TIMEOUT = 10
+# Envios de callback simultâneos por processo
+CALLBACK_WORKERS = int(os.getenv('JOB_CALLBACK_WORKERS', '4'))
+# Hosts aceitos em callback_url, separados por vírgula (".exemplo.com" aceita os subdomínios).
+# Sem a lista, qualquer host com endereço público é aceito; endereços privados, de loopback,
+# link-local e reservados são sempre recusados, exceto para hosts da lista
+JOB_CALLBACK_HOSTS = [host.strip().lower() for host in os.getenv('JOB_CALLBACK_HOSTS', '').split(',') if host.strip()]
+
+# Processos do servidor atendendo requisições (veja set_server_processes)
+_server_processes = 1
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobStoreUnavailableError(Exception):
+    """Fila em memória com vários processos: cada processo só enxerga os próprios trabalhos"""
+
+
+def set_server_processes(count):
+    """
+    Informa quantos processos atendem as requisições (chamado pelo serving.py antes do
+    fork). Com mais de um e sem JOB_QUEUE_DB, /jobs é recusado: a consulta de um trabalho
+    chegaria a outro processo e responderia 404.
+    """
+    global _server_processes
+    _server_processes = count
+    if count > 1 and not JOB_QUEUE_DB:
+        print(f"Aviso: {count} processos sem JOB_QUEUE_DB; a fila de trabalhos (/jobs) fica desativada. "
+              "Defina JOB_QUEUE_DB para compartilhar a fila entre os processos.")
+
+
+def _host_allowed(host):
+    return any(host == allowed or (allowed.startswith('.') and host.endswith(allowed))
+               for allowed in JOB_CALLBACK_HOSTS)
+
+
+def validate_callback_url(url):
+    """
+    Verifica se o servidor pode enviar o callback para a URL: http(s), host na lista
+    JOB_CALLBACK_HOSTS (se definida) e, fora da lista, só endereços públicos.
+
+    Raises:
+        ValueError: se a URL for recusada
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError("callback_url deve ser uma URL http:// ou https://.")
+    host = parts.hostname.lower()
+    if _host_allowed(host):
+        return
+    if JOB_CALLBACK_HOSTS:
+        raise ValueError(f"Host de callback_url não permitido: {host}.")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or None, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise ValueError(f"Host de callback_url não encontrado: {host}.")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if getattr(ip, 'ipv4_mapped', None):
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"callback_url aponta para um endereço interno ({ip}).")
+
+
+def _public(job, position=None):
+    """Campos do trabalho devolvidos pela API (sem a imagem)"""
+    data = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'priority': job['priority'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+    }
+    if position is not None:
+        data['queue_position'] = position
+    if job['status'] in ('done', 'failed'):
+        data['status_code'] = job['status_code']
+        data['result'] = job['result']
+        if job['error']:
+            data['error'] = job['error']
+        if job['callback_url']:
+            data['callback'] = job['callback']
+    return data
+
+
+class MemoryJobStore:
+    """Fila em memória: uma heap por (prioridade, ordem de chegada)"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, job, max_depth):
+        with self._lock:
+            if len(self._heap) >= max_depth:
+                raise QueueFullError()
+            self._jobs[job['id']] = job
+            heapq.heappush(self._heap, (PRIORITIES[job['priority']], next(self._counter), job['id']))
+
+    def claim(self):
+        with self._lock:
+            if not self._heap:
+                return None
+            _, _, job_id = heapq.heappop(self._heap)
+            job = self._jobs[job_id]
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+            return dict(job)
+
+    def update(self, job_id, **fields):
+        if fields.get('status') in ('done', 'failed'):
+            # A imagem não é mais necessária
+            fields['image'] = None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None, None
+            position = None
+            if job['status'] == 'queued':
+                key = next(entry for entry in self._heap if entry[2] == job_id)
+                position = sum(1 for entry in self._heap if entry < key)
+            return dict(job), position
+
+    def purge(self, finished_before):
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['finished_at'] is not None and job['finished_at'] < finished_before]
+            for job_id in expired:
+                del self._jobs[job_id]
+            return len(expired)
+
+    def requeue_stale(self, started_before):
+        # Em memória, os trabalhos morrem com o processo: nada a recuperar
+        return 0
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            lanes = {name: 0 for name in PRIORITIES}
+            for priority, _, _ in self._heap:
+                lanes[next(name for name, value in PRIORITIES.items() if value == priority)] += 1
+        return {'backend': 'memory', 'queued': len(self._heap), 'lanes': lanes, 'by_status': counts}
+
+
+class SqliteJobStore:
+    """
+    Fila em SQLite. A retirada de um trabalho é uma transação BEGIN IMMEDIATE,
+    então vários processos podem consumir a mesma fila sem pegar o mesmo trabalho.
+    """
+
+    _COLUMNS = ('id', 'status', 'priority', 'created_at', 'started_at', 'finished_at', 'options',
+                'use_cache', 'callback_url', 'status_code', 'result', 'error', 'callback')
+    _JSON_COLUMNS = ('options', 'result', 'callback')
+
+    def __init__(self, db_path):
+        self._db_path = db_path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def _db(self):
+        # Conexões SQLite não podem ser herdadas após um fork (workers do gunicorn)
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self._db_path, check_same_thread=False, timeout=10,
+                                         isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY, status TEXT NOT NULL, priority TEXT NOT NULL,
+                    priority_rank INTEGER NOT NULL, created_at REAL NOT NULL, started_at REAL,
+                    finished_at REAL, options TEXT, use_cache INTEGER, callback_url TEXT,
+                    status_code INTEGER, result TEXT, error TEXT, callback TEXT, image BLOB
+                )
+            ''')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority_rank, created_at)'
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def _row_to_job(self, row, columns):
+        job = dict(zip(columns, row))
+        for column in self._JSON_COLUMNS:
+            if column in job and job[column] is not None:
+                job[column] = json.loads(job[column])
+        if 'use_cache' in job:
+            job['use_cache'] = bool(job['use_cache'])
+        return job
+
+    def add(self, job, max_depth):
+        with self._lock:
+            db = self._db
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                depth = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if depth >= max_depth:
+                    raise QueueFullError()
+                db.execute(
+                    'INSERT INTO jobs (id, status, priority, priority_rank, created_at, options, use_cache, '
+                    'callback_url, image) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (job['id'], job['status'], job['priority'], PRIORITIES[job['priority']], job['created_at'],
+                     json.dumps(job['options']), int(job['use_cache']), job['callback_url'], job['image'])
+                )
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+
+    def claim(self):
+        columns = self._COLUMNS + ('image',)
+        with self._lock:
+            db = self._db
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute(
+                    f"SELECT {', '.join(columns)} FROM jobs WHERE status = 'queued' "
+                    'ORDER BY priority_rank, created_at LIMIT 1'
+                ).fetchone()
+                if row is None:
+                    db.execute('COMMIT')
+                    return None
+                started_at = time.time()
+                db.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (started_at, row[0]))
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        job = self._row_to_job(row, columns)
+        job['status'] = 'running'
+        job['started_at'] = started_at
+        return job
+
+    def update(self, job_id, **fields):
+        if not fields:
+            return
+        if fields.get('status') in ('done', 'failed'):
+            # A imagem não é mais necessária
+            fields['image'] = None
+        values = [json.dumps(value) if key in self._JSON_COLUMNS else value for key, value in fields.items()]
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET {', '.join(f'{key} = ?' for key in fields)} WHERE id = ?",
+                (*values, job_id)
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(self._COLUMNS)}, priority_rank FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None, None
+            job = self._row_to_job(row[:-1], self._COLUMNS)
+            position = None
+            if job['status'] == 'queued':
+                position = self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+                    '(priority_rank < ? OR (priority_rank = ? AND created_at < ?))',
+                    (row[-1], row[-1], job['created_at'])
+                ).fetchone()[0]
+        return job, position
+
+    def purge(self, finished_before):
+        with self._lock:
+            return self._db.execute(
+                'DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?', (finished_before,)
+            ).rowcount
+
+    def requeue_stale(self, started_before):
+        with self._lock:
+            return self._db.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running' AND started_at < ?",
+                (started_before,)
+            ).rowcount
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+            lanes = {name: 0 for name in PRIORITIES}
+            lanes.update(self._db.execute(
+                "SELECT priority, COUNT(*) FROM jobs WHERE status = 'queued' GROUP BY priority"
+            ).fetchall())
+        return {'backend': 'sqlite', 'queued': counts.get('queued', 0), 'lanes': lanes, 'by_status': counts}
+
+
+class JobManager:
+    """
+    Args:
+        process: função (bytes da imagem, opções, use_cache) -> (resposta, status HTTP)
+        db_path: banco SQLite da fila (None = em memória)
+        workers: threads que processam a fila (por processo)
+        max_depth: máximo de trabalhos aguardando na fila
+        retention: segundos que os resultados ficam disponíveis após a conclusão
+    """
+
+    def __init__(self, process, db_path=JOB_QUEUE_DB, workers=JOB_WORKERS,
+                 max_depth=JOB_QUEUE_MAX_DEPTH, retention=JOB_RETENTION):
+        self.process = process
+        self.shared = bool(db_path)
+        self.store = SqliteJobStore(db_path) if db_path else MemoryJobStore()
+        self.workers = workers
+        self.max_depth = max_depth
+        self.retention = retention
+        self._wakeup = threading.Condition()
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        self._callbacks = None
+        self._last_purge = 0.0
+
+    def ensure_started(self):
+        """
+        Inicia as threads de processamento no processo atual. Threads não sobrevivem
+        a um fork, por isso são iniciadas no primeiro uso em cada worker do servidor.
+
+        Raises:
+            JobStoreUnavailableError: fila em memória com vários processos do servidor
+        """
+        if not self.shared and _server_processes > 1:
+            raise JobStoreUnavailableError(
+                "Fila de trabalhos indisponível: o servidor tem vários processos e JOB_QUEUE_DB não foi definido.")
+        if self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self.store.requeue_stale(time.time() - JOB_STALE_AFTER)
+            for index in range(self.workers):
+                threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True).start()
+            self._callbacks = ThreadPoolExecutor(max_workers=CALLBACK_WORKERS, thread_name_prefix='job-callback')
+            self._started_pid = os.getpid()
+
+    def submit(self, image_data, options, use_cache=True, priority='normal', callback_url=None):
+        """
+        Enfileira uma análise.
+
+        Returns:
+            dict: dados públicos do trabalho criado
+
+        Raises:
+            ValueError: prioridade ou URL de callback inválida
+            QueueFullError: fila cheia
+            JobStoreUnavailableError: fila em memória com vários processos do servidor
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Prioridade inválida: {priority}. Use {', '.join(PRIORITIES)}.")
+        if callback_url:
+            validate_callback_url(callback_url)
+        self.ensure_started()
+        self._purge_expired()
+
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'priority': priority,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'options': options,
+            'use_cache': use_cache,
+            'callback_url': callback_url,
+            'status_code': None,
+            'result': None,
+            'error': None,
+            'callback': None,
+            'image': image_data,
+        }
+        self.store.add(job, self.max_depth)
+        with self._wakeup:
+            self._wakeup.notify()
+        return _public(job)
+
+    def get(self, job_id):
+        """Dados públicos do trabalho, ou None se ele não existir ou tiver expirado"""
+        self.ensure_started()
+        self._purge_expired()
+        job, position = self.store.get(job_id)
+        return _public(job, position) if job is not None else None
+
+    def stats(self):
+        stats = self.store.stats()
+        stats['max_depth'] = self.max_depth
+        stats['workers'] = self.workers
+        return stats
+
+    def _purge_expired(self):
+        now = time.time()
+        if now - self._last_purge >= min(60.0, self.retention):
+            self._last_purge = now
+            self.store.purge(now - self.retention)
+
+    def _worker(self):
+        while True:
+            job = self.store.claim()
+            if job is None:
+                # Com SQLite, outros processos também enfileiram: verifica a fila periodicamente
+                with self._wakeup:
+                    self._wakeup.wait(timeout=1.0)
+                self._purge_expired()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        try:
+            result, status_code = self.process(job['image'], job['options'], job['use_cache'])
+            fields = {'status': 'done', 'result': result, 'status_code': status_code, 'error': None}
+        except Exception as e:
+            fields = {'status': 'failed', 'result': None, 'status_code': 500, 'error': str(e)}
+        fields['finished_at'] = time.time()
+        if job['callback_url']:
+            fields['callback'] = {'status': 'pending'}
+        job.update(fields)
+        # O resultado fica disponível antes do callback, que não ocupa a thread da fila
+        self.store.update(job['id'], **fields)
+        if job['callback_url']:
+            self._callbacks.submit(self._deliver_callback, job)
+
+    def _deliver_callback(self, job):
+        self.store.update(job['id'], callback=self._send_callback(job))
+
+    def _send_callback(self, job):
+        """Envia o resultado para a URL de callback, com novas tentativas em caso de falha"""
+        payload = _public(job)
+        payload.pop('callback', None)
+        try:
+            # O endereço do host pode ter mudado desde o envio do trabalho
+            validate_callback_url(job['callback_url'])
+        except ValueError as e:
+            return {'status': 'failed', 'error': str(e), 'attempts': 0}
+        error = None
+        for attempt in range(CALLBACK_ATTEMPTS):
+            try:
+                response = requests.post(job['callback_url'], json=payload, timeout=CALLBACK_TIMEOUT,
+                                         allow_redirects=False)
+                if response.status_code < 500:
+                    return {'status': 'delivered', 'status_code': response.status_code, 'attempts': attempt + 1}
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt + 1 < CALLBACK_ATTEMPTS:
+                time.sleep(2 ** attempt)
+        return {'status': 'failed', 'error': error, 'attempts': CALLBACK_ATTEMPTS}
@@ -0,0 +1,197 @@
+"""
+Pré-classificação visual local (CPU, alguns ms): estima a probabilidade de a imagem
+ser um meme pelo layout, antes de chamar o Gemini. Quando a probabilidade passa de
+LOCAL_VISION_THRESHOLD, a análise visual do Gemini é dispensada e o resultado local
+é usado no lugar dela.
+
+Sem modelo, usa características do layout típico dos memes, na imagem em escala de
+cinza reduzida:
+- legendas no topo e na base: largura das faixas de texto (text_regions.py) no
+  quarto superior e no inferior da imagem
+- fonte Impact: pixels quase brancos colados em pixels quase pretos (letra branca
+  com contorno) dentro das faixas de texto
+- faixa de legenda: bloco de linhas quase brancas no topo com texto (formato
+  "legenda + imagem")
+- textura: muitas regiões de texto candidatas indicam foto ou documento
+combinadas por uma regressão logística com pesos fixos.
+
+Com LOCAL_VISION_MODEL (arquivo ONNX executado pelo cv2.dnn, entrada 1x3x224x224
+RGB em [0, 1], saída com 1 logit ou 2 classes [não meme, meme]), a probabilidade
+vem do modelo.
+"""
+import os
+import math
+import time
+import threading
+
+import cv2
+import numpy as np
+
+from text_regions import detect_text_regions
+
+
+# Pré-classificação local antes da análise visual (ativada por requisição com local_vision=true).
+# Desativada por padrão: os pesos e o limiar ainda não foram calibrados com referências
+# reais do Gemini (veja benchmarks/eval_local_vision.py --gemini)
+LOCAL_VISION_ENABLED = os.getenv('LOCAL_VISION', 'false').lower() == 'true'
+# Probabilidade (0-100) a partir da qual a chamada visual ao Gemini é dispensada
+LOCAL_VISION_THRESHOLD = float(os.getenv('LOCAL_VISION_THRESHOLD', '92'))
+LOCAL_VISION_MODEL = os.getenv('LOCAL_VISION_MODEL') or None
+
+CLASSIFIER_MAX_SIDE = 480
+BAND_FRACTION = 0.25
+# Pesos da regressão logística sobre as características (escala 0-1)
+WEIGHTS = {
+    'bias': -2.0,
+    'top_caption': 2.5,
+    'bottom_caption': 2.5,
+    'top_and_bottom': 1.5,
+    'impact_outline': 2.0,
+    'caption_banner': 1.5,
+    'texture': -2.0,
+}
+
+_model = None
+_load_lock = threading.Lock()
+# cv2.dnn.Net não é seguro para chamadas simultâneas
+_model_lock = threading.Lock()
+
+
+def classifier_version():
+    """Configuração que altera o resultado (faz parte da versão da análise)"""
+    model = None
+    if LOCAL_VISION_MODEL:
+        model = (LOCAL_VISION_MODEL, os.path.getmtime(LOCAL_VISION_MODEL) if os.path.exists(LOCAL_VISION_MODEL) else None)
+    return LOCAL_VISION_THRESHOLD, tuple(sorted(WEIGHTS.items())), model
+
+
+def _band_caption(boxes, width, top, bottom):
+    """Largura da maior faixa de texto cujo centro está entre top e bottom, em fração da largura"""
+    widths = [w for x, y, w, h in boxes if top <= y + h / 2 < bottom]
+    return min(1.0, max(widths, default=0) / (width * 0.5))
+
+
+def _impact_outline(small, boxes):
+    """Fração das faixas de texto com letra quase branca contornada por pixels quase pretos"""
+    if not boxes:
+        return 0.0
+    white = (small >= 225).astype(np.uint8)
+    black = cv2.dilate((small <= 40).astype(np.uint8), np.ones((3, 3), np.uint8))
+    outlined = total = 0
+    for x, y, w, h in boxes:
+        region_white = white[y:y + h, x:x + w]
+        outlined += int((region_white & black[y:y + h, x:x + w]).sum())
+        total += int(region_white.sum())
+    # Em letras com contorno, boa parte dos pixels brancos encosta no preto
+    return min(1.0, outlined / total / 0.3) if total else 0.0
+
+
+def _caption_banner(small, boxes):
+    """Altura (fração, até 1 a partir de 20%) do bloco claro no topo, se ele contiver texto"""
+    height = small.shape[0]
+    # Linhas quase brancas ou cobertas por uma faixa de texto (a legenda dentro do bloco)
+    banner_rows = (small >= 225).mean(axis=1) >= 0.9
+    for x, y, w, h in boxes:
+        banner_rows[y:y + h] = True
+    dark = np.flatnonzero(~banner_rows[:height // 2])
+    banner = int(dark[0]) if dark.size else height // 2
+    if banner < height * 0.06 or not any(y + h <= banner for x, y, w, h in boxes):
+        return 0.0
+    return min(1.0, banner / (height * 0.2))
+
+
+def extract_features(gray):
+    """
+    Características do layout (0-1) da imagem em escala de cinza.
+
+    Returns:
+        dict: {'top_caption', 'bottom_caption', 'top_and_bottom', 'impact_outline',
+        'caption_banner', 'texture'}
+    """
+    height, width = gray.shape[:2]
+    factor = min(1.0, CLASSIFIER_MAX_SIDE / max(height, width))
+    small = cv2.resize(gray, (max(1, round(width * factor)), max(1, round(height * factor))),
+                       interpolation=cv2.INTER_AREA) if factor < 1 else gray
+    height, width = small.shape[:2]
+    boxes = [[max(0, x), max(0, y), w, h] for x, y, w, h in detect_text_regions(small, 'gradient', min_height=6)]
+
+    top = _band_caption(boxes, width, 0, height * BAND_FRACTION)
+    bottom = _band_caption(boxes, width, height * (1 - BAND_FRACTION), height)
+    band_boxes = [box for box in boxes
+                  if box[1] + box[3] / 2 < height * BAND_FRACTION or box[1] + box[3] / 2 >= height * (1 - BAND_FRACTION)]
+    return {
+        'top_caption': round(top, 3),
+        'bottom_caption': round(bottom, 3),
+        'top_and_bottom': round(min(top, bottom), 3),
+        'impact_outline': round(_impact_outline(small, band_boxes), 3),
+        'caption_banner': round(_caption_banner(small, boxes), 3),
+        # Mais de 25 regiões candidatas: textura de foto ou página de texto
+        'texture': round(min(1.0, max(0, len(boxes) - 25) / 25), 3),
+    }
+
+
+def heuristic_probability(features):
+    z = WEIGHTS['bias'] + sum(WEIGHTS[name] * value for name, value in features.items())
+    return 100 / (1 + math.exp(-z))
+
+
+def _get_model():
+    global _model
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                _model = cv2.dnn.readNetFromONNX(LOCAL_VISION_MODEL)
+    return _model
+
+
+def model_probability(gray):
+    """Probabilidade (0-100) do modelo ONNX de LOCAL_VISION_MODEL"""
+    rgb = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+    blob = cv2.dnn.blobFromImage(rgb, scalefactor=1 / 255, size=(224, 224))
+    model = _get_model()
+    with _model_lock:
+        model.setInput(blob)
+        output = model.forward().flatten()
+    if output.size == 1:
+        return 100 / (1 + math.exp(-float(output[0])))
+    exp = np.exp(output - output.max())
+    return float(exp[1] / exp.sum() * 100)
+
+
+def classify(gray, threshold=LOCAL_VISION_THRESHOLD):
+    """
+    Pré-classifica a imagem.
+
+    Returns:
+        dict: {'probability': 0-100, 'decision': 'skip' (dispensa o Gemini) ou 'gemini',
+        'method': 'heuristic' ou 'model', 'features', 'ms'}
+    """
+    start = time.perf_counter()
+    if LOCAL_VISION_MODEL:
+        features = None
+        probability = model_probability(gray)
+        method = 'model'
+    else:
+        features = extract_features(gray)
+        probability = heuristic_probability(features)
+        method = 'heuristic'
+    return {
+        'probability': round(probability, 2),
+        'decision': 'skip' if probability >= threshold else 'gemini',
+        'method': method,
+        'features': features,
+        'ms': round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+def local_image_analysis(result):
+    """image_analysis no formato da resposta do Gemini, a partir da pré-classificação"""
+    features = result['features'] or {}
+    cues = [label for name, label in (('top_and_bottom', 'legendas no topo e na base'),
+                                      ('impact_outline', 'texto com contorno (fonte Impact)'),
+                                      ('caption_banner', 'faixa de legenda sobre a imagem'))
+            if features.get(name, 0) >= 0.5]
+    detail = f"Classificação visual local ({result['method']}), sem chamada ao Gemini"
+    if cues:
+        detail += ': ' + ', '.join(cues)
+    return {'analise_geral': {'probabilidade_de_ser_meme': result['probability'], 'detalhamento': detail + '.'}}
@@ -0,0 +1,332 @@
+"""
+Métricas do servidor no formato de texto do Prometheus (GET /metrics).
+
+Contadores, gauges e histogramas com rótulos, sem dependências externas. Cada
+operação é um incremento sob um lock (alguns microssegundos), desprezível diante
+do tempo de uma análise; veja benchmarks/bench_metrics.py.
+
+Com vários processos (gunicorn), cada worker tem as próprias métricas. Com
+METRICS_DIR definido, cada processo grava periodicamente um retrato das suas
+métricas nesse diretório e o /metrics soma os retratos de todos os processos
+(gauges só dos processos ainda vivos). Sem METRICS_DIR, o /metrics mostra apenas
+o processo que atendeu a requisição.
+"""
+import os
+import json
+import glob
+import time
+import bisect
+import threading
+
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_DIR = os.getenv('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1'))
+
+# Em segundos: de etapas locais rápidas (text_gate, parse) até chamadas lentas ao Gemini
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Em bytes: de 1 KB a 16 MB
+BYTES_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(8))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Métrica {self.name}: rótulos esperados {self.labelnames}, recebidos {tuple(labels)}")
+        # Os valores só viram texto na geração do /metrics
+        return tuple([labels[name] for name in self.labelnames])
+
+    def snapshot(self):
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(_Metric):
+    """Valor que só cresce (ex: requisições, novas tentativas, bytes enviados)"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Valor que sobe e desce (ex: requisições em andamento)"""
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Distribuição de valores em faixas acumuladas (ex: latência de cada etapa)"""
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [contagem por faixa (a última é +Inf), soma, total]
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _copy(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+
+class Registry:
+    """
+    Conjunto de métricas do processo.
+
+    Args:
+        enabled: se False, as operações das métricas não fazem nada (para medir o custo)
+        directory: diretório compartilhado entre processos (veja METRICS_DIR)
+        flush_interval: intervalo em segundos entre as gravações do retrato do processo
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.enabled = enabled
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica já registrada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _snapshot(self):
+        return {
+            name: {
+                'type': metric.type,
+                'help': metric.documentation,
+                'labels': list(metric.labelnames),
+                'buckets': list(getattr(metric, 'buckets', ())),
+                'samples': [[list(key), value] for key, value in metric.snapshot().items()],
+            }
+            for name, metric in list(self._metrics.items())
+        }
+
+    # Vários processos
+
+    def ensure_flusher(self):
+        """
+        Inicia, no processo atual, a thread que grava o retrato das métricas em
+        self.directory. Threads não sobrevivem a um fork, por isso é chamada a
+        cada requisição (custo: uma comparação de pid).
+        """
+        if not self.enabled or not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+            self._flusher_pid = os.getpid()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def flush(self):
+        """Grava o retrato do processo atual (escrita atômica: arquivo temporário + rename)"""
+        path = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(self._snapshot(), f)
+        os.replace(temporary, path)
+
+    def clear_directory(self):
+        """Remove retratos de execuções anteriores (chamada no processo mestre, antes dos workers)"""
+        if self.directory:
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*.json*')):
+                os.remove(path)
+
+    def _collect(self):
+        if not self.directory:
+            return self._snapshot()
+
+        self.flush()
+        merged = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            pid = int(os.path.basename(path)[len('metrics-'):-len('.json')])
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _process_alive(pid)
+            for name, data in snapshot.items():
+                if data['type'] == 'gauge' and not alive:
+                    continue
+                target = merged.setdefault(name, {**data, 'samples': {}})
+                for key, value in data['samples']:
+                    key = tuple(key)
+                    if key not in target['samples']:
+                        target['samples'][key] = value
+                    elif data['type'] == 'histogram':
+                        current = target['samples'][key]
+                        target['samples'][key] = [[a + b for a, b in zip(current[0], value[0])],
+                                                  current[1] + value[1], current[2] + value[2]]
+                    else:
+                        target['samples'][key] += value
+        for data in merged.values():
+            data['samples'] = list(data['samples'].items())
+        return merged
+
+    def render(self):
+        """Métricas no formato de texto do Prometheus (versão 0.0.4)"""
+        lines = []
+        for name, data in sorted(self._collect().items()):
+            lines.append(f"# HELP {name} {data['help']}")
+            lines.append(f"# TYPE {name} {data['type']}")
+            labelnames = data['labels']
+            for key, value in sorted(data['samples'], key=lambda sample: list(sample[0])):
+                if data['type'] != 'histogram':
+                    lines.append(f"{name}{_format_labels(labelnames, key)} {_format_number(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(data['buckets']) + [float('inf')], counts):
+                    cumulative += bucket_count
+                    le = _format_number(float(bound)) if bound != float('inf') else '+Inf'
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_number(float(total))}")
+                lines.append(f"{name}_count{_format_labels(labelnames, key)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+registry = Registry()
+
+# Métricas do fluxo de análise, compartilhadas pelos módulos
+
+STAGE_SECONDS = registry.histogram(
+    'meme_stage_duration_seconds',
+    'Duração de cada etapa da análise (decode, ocr, text_gate, cleanup, text_analysis, local_vision, preprocess, vision, parse)',
+    ['stage'])
+STAGE_FAILURES = registry.counter(
+    'meme_stage_failures_total', 'Etapas da análise que falharam ou excederam o tempo limite', ['stage'])
+ANALYSIS_RESULTS = registry.counter(
+    'meme_analysis_total', 'Análises por origem do resultado (hit, near_duplicate, miss, bypass)', ['cache'])
+UPLOAD_BYTES = registry.histogram(
+    'meme_upload_bytes', 'Tamanho das imagens recebidas para análise', buckets=BYTES_BUCKETS)
+VISION_PAYLOAD_BYTES = registry.histogram(
+    'meme_vision_payload_bytes', 'Tamanho da imagem codificada enviada ao Gemini', buckets=BYTES_BUCKETS)
+LOCAL_VISION_DECISIONS = registry.counter(
+    'meme_local_vision_total', 'Decisões da pré-classificação visual local (skip dispensa o Gemini, gemini, error)',
+    ['decision'])
+
+HTTP_REQUESTS = registry.counter(
+    'http_requests_total', 'Requisições HTTP atendidas', ['method', 'endpoint', 'status'])
+HTTP_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'Duração das requisições HTTP', ['method', 'endpoint'])
+HTTP_IN_FLIGHT = registry.gauge(
+    'http_requests_in_flight', 'Requisições HTTP em andamento')
+
+GEMINI_REQUESTS = registry.counter(
+    'gemini_requests_total', 'Tentativas de chamada ao Gemini por código de status (error = falha de rede)',
+    ['call', 'status'])
+GEMINI_RETRIES = registry.counter(
+    'gemini_retries_total', 'Novas tentativas de chamada ao Gemini', ['call'])
+GEMINI_CIRCUIT_REJECTIONS = registry.counter(
+    'gemini_circuit_rejections_total', 'Chamadas rejeitadas pelo circuit breaker', ['call'])
+GEMINI_SECONDS = registry.histogram(
+    'gemini_request_duration_seconds', 'Duração de cada chamada ao Gemini, incluindo novas tentativas', ['call'])
+GEMINI_REQUEST_BYTES = registry.counter(
+    'gemini_request_bytes_total', 'Bytes enviados ao Gemini', ['call'])
+GEMINI_RESPONSE_BYTES = registry.counter(
+    'gemini_response_bytes_total', 'Bytes recebidos do Gemini', ['call'])
+GEMINI_COALESCED = registry.counter(
+    'gemini_coalesced_total', 'Chamadas idênticas que aguardaram uma requisição já em andamento', ['call'])
+GEMINI_RATE_LIMIT_WAIT = registry.histogram(
+    'gemini_rate_limit_wait_seconds', 'Espera pelo limite de requisições/tokens por minuto', ['call'])
+GEMINI_IN_FLIGHT = registry.gauge(
+    'gemini_requests_in_flight', 'Chamadas ao Gemini em andamento', ['call'])
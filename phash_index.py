@@ -0,0 +1,173 @@
+"""
+Hash perceptual (pHash/dHash) e índice de quase-duplicatas.
+
+Reposts de memes raramente chegam com os mesmos bytes (recompressão, redimensionamento,
+bordas). O hash perceptual de 64 bits muda pouco nesses casos e a busca é feita por
+distância de Hamming usando multi-index hashing: o hash é dividido em blocos e, pelo
+princípio da casa dos pombos, qualquer hash a distância <= d tem ao menos um bloco a
+distância <= d // n_blocos do bloco correspondente da consulta.
+"""
+import threading
+from itertools import chain, combinations
+
+import cv2
+import numpy as np
+
+
+HASH_BITS = 64
+
+# Número de bits 1 de cada byte, para o popcount vetorizado
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def compute_phash(gray):
+    """
+    pHash: DCT da imagem reduzida para 32x32, comparando os 8x8 coeficientes de
+    baixa frequência com a mediana.
+
+    Args:
+        gray: imagem em escala de cinza (numpy uint8)
+
+    Returns:
+        int: hash de 64 bits
+    """
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8]
+    median = np.median(low.flatten()[1:])
+    return _bits_to_int(low > median)
+
+
+def compute_dhash(gray):
+    """
+    dHash: compara pixels vizinhos na horizontal da imagem reduzida para 9x8.
+
+    Args:
+        gray: imagem em escala de cinza (numpy uint8)
+
+    Returns:
+        int: hash de 64 bits
+    """
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class NearDuplicateIndex:
+    """
+    Índice de hashes de 64 bits com busca por distância de Hamming.
+
+    Args:
+        max_distance: distância máxima considerada quase-duplicata
+        n_blocks: número de blocos (tabelas) do multi-index hashing. 4 blocos de 16 bits
+            mantêm os baldes pequenos mesmo com milhões de entradas.
+    """
+
+    def __init__(self, max_distance=6, n_blocks=4):
+        self.max_distance = max_distance
+        self.n_blocks = n_blocks
+        self._block_bits = HASH_BITS // n_blocks
+        self._block_mask = (1 << self._block_bits) - 1
+        self._block_radius = max_distance // n_blocks
+        self._tables = [{} for _ in range(n_blocks)]
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._values = []
+        # chave -> posição da entrada; posições removidas são reaproveitadas
+        self._ids = {}
+        self._free = []
+        self._lock = threading.Lock()
+        self._flip_masks = [0]
+        for radius in range(1, self._block_radius + 1):
+            for positions in combinations(range(self._block_bits), radius):
+                mask = 0
+                for position in positions:
+                    mask |= 1 << position
+                self._flip_masks.append(mask)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _blocks(self, hash_value):
+        return [(hash_value >> (i * self._block_bits)) & self._block_mask for i in range(self.n_blocks)]
+
+    def add(self, hash_value, value, key=None):
+        """
+        Adiciona um hash. key (padrão: o próprio valor) identifica a entrada em remove;
+        adicionar uma chave já existente substitui a entrada anterior.
+        """
+        key = value if key is None else key
+        with self._lock:
+            self._remove(key)
+            if self._free:
+                entry_id = self._free.pop()
+                self._values[entry_id] = value
+            else:
+                entry_id = len(self._values)
+                if entry_id == len(self._hashes):
+                    grown = np.zeros(len(self._hashes) * 2, dtype=np.uint64)
+                    grown[:entry_id] = self._hashes
+                    self._hashes = grown
+                self._values.append(value)
+            self._hashes[entry_id] = hash_value
+            self._ids[key] = entry_id
+            for table, block in zip(self._tables, self._blocks(hash_value)):
+                table.setdefault(block, []).append(entry_id)
+
+    def remove(self, key):
+        """Remove a entrada da chave (ex: quando o resultado sai do cache). Retorna se ela existia."""
+        with self._lock:
+            return self._remove(key)
+
+    def _remove(self, key):
+        entry_id = self._ids.pop(key, None)
+        if entry_id is None:
+            return False
+        for table, block in zip(self._tables, self._blocks(int(self._hashes[entry_id]))):
+            bucket = table[block]
+            bucket.remove(entry_id)
+            if not bucket:
+                del table[block]
+        self._values[entry_id] = None
+        self._free.append(entry_id)
+        return True
+
+    def lookup(self, hash_value, max_distance=None):
+        """
+        Busca hashes a distância <= max_distance (limitada ao max_distance do índice).
+
+        Returns:
+            list: [(distância, valor)] ordenada da mais próxima para a mais distante
+        """
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+
+        with self._lock:
+            buckets = []
+            for table, block in zip(self._tables, self._blocks(hash_value)):
+                for mask in self._flip_masks:
+                    bucket = table.get(block ^ mask)
+                    if bucket:
+                        buckets.append(bucket)
+            if not buckets:
+                return []
+            # Verificação vetorizada dos candidatos: XOR + popcount por tabela de bytes
+            candidates = np.fromiter(chain.from_iterable(buckets), dtype=np.int64)
+            xor = self._hashes[candidates] ^ np.uint64(hash_value)
+            distances = _POPCOUNT_TABLE[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+            close = np.unique(candidates[distances <= max_distance])
+            matches = [
+                ((int(self._hashes[entry_id]) ^ hash_value).bit_count(), self._values[entry_id])
+                for entry_id in close
+            ]
+
+        matches.sort(key=lambda match: match[0])
+        return matches
@@ -0,0 +1,192 @@
+"""
+Executor concorrente para as etapas do fluxo de análise de imagem.
+
+Cada etapa declara de quais outras depende; etapas independentes (ex: o ramo
+de texto e o ramo visual) são executadas em paralelo em um pool de threads.
+"""
+import sys
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    import resource
+except ImportError:
+    # Indisponível no Windows: o pico de RSS não é reportado
+    resource = None
+
+
+class StageTimeoutError(Exception):
+    pass
+
+
+class Stage:
+    """
+    Etapa do pipeline.
+
+    Args:
+        name: nome único da etapa
+        func: função chamada com os resultados das dependências, na ordem de depends_on
+        depends_on: nomes das etapas que precisam terminar antes desta
+        timeout: tempo máximo em segundos (None = sem limite)
+        fallback: função opcional chamada com a exceção quando a etapa falha ou excede o
+            tempo limite; o valor devolvido é usado como resultado da etapa (etapas
+            opcionais, cuja falha não deve interromper a análise)
+    """
+
+    def __init__(self, name, func, depends_on=(), timeout=None, fallback=None):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+        self.fallback = fallback
+
+
+def _run_stage(stage, args):
+    """Executa a etapa e devolve (resultado, duração em segundos, tempo de CPU da thread em segundos)"""
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    result = stage.func(*args)
+    return result, time.perf_counter() - start, time.thread_time() - cpu_start
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo desde o início, em MB (None se indisponível)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 2)
+
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+@contextmanager
+def measure_resources():
+    """
+    Mede a memória alocada durante o bloco (tracemalloc, inclui arrays numpy/OpenCV)
+    e o pico de RSS do processo. O dicionário retornado é preenchido na saída do bloco:
+    {'allocated_peak_mb', 'peak_rss_mb', 'rss_growth_mb'}.
+
+    O tracemalloc é global ao processo: com blocos medidos simultaneamente, o pico
+    de alocação inclui o das outras requisições. O rastreamento deixa as alocações
+    mais lentas e só fica ativo enquanto houver algum bloco medido.
+    """
+    global _tracing_users
+    usage = {}
+    rss_start = peak_rss_mb()
+    with _tracing_lock:
+        if _tracing_users == 0:
+            tracemalloc.start()
+        _tracing_users += 1
+        allocated_start = tracemalloc.get_traced_memory()[0]
+        if _tracing_users == 1:
+            tracemalloc.reset_peak()
+    try:
+        yield usage
+    finally:
+        with _tracing_lock:
+            peak = tracemalloc.get_traced_memory()[1]
+            _tracing_users -= 1
+            if _tracing_users == 0:
+                tracemalloc.stop()
+        usage['allocated_peak_mb'] = round(max(0, peak - allocated_start) / (1024 * 1024), 2)
+        usage['peak_rss_mb'] = peak_rss_mb()
+        usage['rss_growth_mb'] = round(usage['peak_rss_mb'] - rss_start, 2) if rss_start is not None else None
+
+
+def run_pipeline(stages, max_workers=None, on_stage_complete=None, cpu_times=None):
+    """
+    Executa as etapas respeitando as dependências e rodando as independentes em paralelo.
+
+    Args:
+        stages: lista de Stage
+        max_workers: número de threads (padrão: número de etapas)
+        on_stage_complete: callback opcional chamado como (nome, resultado) a cada etapa concluída
+        cpu_times: dicionário opcional preenchido com o tempo de CPU (ms) de cada etapa concluída.
+            Conta apenas a thread da etapa: subprocessos (ex: binário tesseract) e threads
+            internas do OpenCV ficam de fora
+
+    Returns:
+        tuple: (resultados, tempos em ms, erros) — dicionários indexados pelo nome da etapa.
+        Etapas cujas dependências falharam não são executadas e aparecem em erros.
+        Etapas com fallback que falham aparecem nos resultados, com o valor do fallback.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dep in stage.depends_on:
+            if dep not in by_name:
+                raise ValueError(f"Etapa '{stage.name}' depende de etapa inexistente '{dep}'.")
+
+    results = {}
+    timings = {}
+    errors = {}
+    pending = list(stages)
+    running = {}
+
+    def fail(stage, error):
+        if stage.fallback is None:
+            errors[stage.name] = error
+            return
+        results[stage.name] = result = stage.fallback(error)
+        if on_stage_complete:
+            on_stage_complete(stage.name, result)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1)
+    try:
+        while pending or running:
+            # Descartar etapas cujas dependências falharam
+            for stage in list(pending):
+                failed = [dep for dep in stage.depends_on if dep in errors]
+                if failed:
+                    errors[stage.name] = Exception(f"Etapa '{stage.name}' não executada: dependência '{failed[0]}' falhou.")
+                    pending.remove(stage)
+
+            # Submeter etapas prontas
+            for stage in list(pending):
+                if all(dep in results for dep in stage.depends_on):
+                    args = [results[dep] for dep in stage.depends_on]
+                    future = executor.submit(_run_stage, stage, args)
+                    deadline = time.monotonic() + stage.timeout if stage.timeout else None
+                    running[future] = (stage, deadline)
+                    pending.remove(stage)
+
+            if not running:
+                if pending:
+                    raise ValueError("Dependência circular entre etapas do pipeline.")
+                break
+
+            deadlines = [deadline for _, deadline in running.values() if deadline is not None]
+            wait_timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            done, _ = wait(list(running), timeout=wait_timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                stage, _ = running.pop(future)
+                try:
+                    result, elapsed, cpu = future.result()
+                except Exception as e:
+                    fail(stage, e)
+                    continue
+                results[stage.name] = result
+                timings[stage.name] = round(elapsed * 1000, 2)
+                if cpu_times is not None:
+                    cpu_times[stage.name] = round(cpu * 1000, 2)
+                if on_stage_complete:
+                    on_stage_complete(stage.name, result)
+
+            # Etapas que estouraram o tempo limite são abandonadas (a thread não é interrompida)
+            now = time.monotonic()
+            for future, (stage, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline:
+                    running.pop(future)
+                    fail(stage, StageTimeoutError(
+                        f"Etapa '{stage.name}' excedeu o tempo limite de {stage.timeout}s."
+                    ))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results, timings, errors
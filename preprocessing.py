@@ -0,0 +1,202 @@
+"""
+Pipeline configurável de pré-processamento de imagens em escala de cinza.
+
+Cada etapa tem um nome (ex: 'clahe', 'adaptive_threshold', 'deskew') e trabalha
+em um único buffer uint8: a entrada é copiada uma vez e as etapas a alteram no
+lugar. Apenas as que mudam a geometria (upscale, deskew) alocam um novo buffer.
+
+O mesmo tipo de pipeline alimenta o OCR (OCR_PREPROCESS) e o ramo visual
+(VISION_PREPROCESS), configurados com o nome de um preset ou uma lista de etapas
+separadas por vírgula, ex: OCR_PREPROCESS=upscale,clahe.
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+def equalize(img, context):
+    """Equalização global do histograma"""
+    return cv2.equalizeHist(img, dst=img)
+
+
+def normalize(img, context):
+    """Estica os níveis de cinza para 0-255"""
+    return cv2.normalize(img, img, 0, 255, cv2.NORM_MINMAX)
+
+
+def clahe(img, context, clip_limit=2.0, tile_size=8):
+    """Equalização adaptativa (CLAHE): realça o contraste local sem saturar áreas claras"""
+    return cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(tile_size, tile_size)).apply(img, dst=img)
+
+
+def box_blur(img, context, ksize=3):
+    """Média em uma janela ksize x ksize (suaviza ruído de compressão)"""
+    return cv2.blur(img, (ksize, ksize), dst=img)
+
+
+def median_blur(img, context, ksize=3):
+    """Mediana: remove ruído impulsivo preservando as bordas das letras"""
+    return cv2.medianBlur(img, ksize, dst=img)
+
+
+def adaptive_threshold(img, context, block_size=31, c=15):
+    """Binarização com limiar local (gaussiano), robusta a fundos com gradiente"""
+    return cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                 block_size, c, dst=img)
+
+
+def upscale(img, context, target_side=1600, max_scale=2.0):
+    """
+    Amplia imagens pequenas, cujo texto fica abaixo da altura que o Tesseract
+    reconhece bem (~20-30px), até o maior lado chegar a target_side.
+    """
+    height, width = img.shape[:2]
+    scale = min(max_scale, target_side / max(height, width))
+    if scale <= 1.05:
+        return img
+    context['scale'] *= scale
+    return cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_CUBIC)
+
+
+def estimate_skew(img, max_side=800):
+    """
+    Estima a inclinação das linhas de texto em graus: as letras são unidas em
+    faixas horizontais (dilatação) e o ângulo é a mediana dos retângulos mínimos
+    das faixas alongadas. Retorna None se não houver linhas suficientes.
+    """
+    height, width = img.shape[:2]
+    factor = min(1.0, max_side / max(height, width))
+    small = cv2.resize(img, (max(1, round(width * factor)), max(1, round(height * factor))),
+                       interpolation=cv2.INTER_AREA) if factor < 1 else img
+
+    # Gradiente morfológico destaca as bordas das letras (texto claro ou escuro)
+    gradient = cv2.morphologyEx(small, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, small.shape[1] // 40), 1))
+    cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel, dst=binary)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    angles = []
+    weights = []
+    for contour in contours:
+        (_, _), (rect_width, rect_height), angle = cv2.minAreaRect(contour)
+        if rect_width < rect_height:
+            rect_width, rect_height = rect_height, rect_width
+            angle -= 90
+        if rect_height < 4 or rect_width < rect_height * 5:
+            continue
+        # Convenção do OpenCV >= 4.5 (0, 90]; normaliza para [-45, 45]
+        while angle > 45:
+            angle -= 90
+        while angle < -45:
+            angle += 90
+        angles.append(angle)
+        weights.append(rect_width)
+    if len(angles) < 2:
+        return None
+    order = np.argsort(angles)
+    cumulative = np.cumsum(np.asarray(weights)[order])
+    return float(np.asarray(angles)[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+
+def deskew(img, context, max_angle=10.0, min_angle=0.5):
+    """
+    Corrige a rotação do texto. Ângulos fora de [min_angle, max_angle] são ignorados
+    (texto já reto, ou estimativa pouco confiável em fotos e ilustrações).
+    """
+    angle = estimate_skew(img)
+    if angle is None or abs(angle) < min_angle or abs(angle) > max_angle:
+        return img
+    height, width = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    context['angle'] = round(angle, 2)
+    return cv2.warpAffine(img, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+STAGES = {
+    'equalize': equalize,
+    'normalize': normalize,
+    'clahe': clahe,
+    'box_blur': box_blur,
+    'median_blur': median_blur,
+    'adaptive_threshold': adaptive_threshold,
+    'upscale': upscale,
+    'deskew': deskew,
+}
+
+PRESETS = {
+    # Sem pré-processamento: o OCR recebe a imagem em escala de cinza
+    'none': [],
+    # Pré-processamento original do ramo visual (pprocess.py)
+    'legacy': ['equalize', 'normalize', 'box_blur'],
+    'clahe': ['clahe'],
+    'ocr_small_text': ['upscale', 'clahe'],
+    'ocr_binary': ['upscale', 'clahe', 'median_blur', 'adaptive_threshold'],
+    'ocr_scan': ['deskew', 'upscale', 'clahe', 'adaptive_threshold'],
+}
+
+
+class PreprocessingPipeline:
+    """
+    Sequência de etapas de pré-processamento.
+
+    Args:
+        stages: lista de nomes de etapas ou de (nome, parâmetros), ex:
+            ['upscale', ('clahe', {'clip_limit': 3.0})]
+        name: nome exibido nos relatórios (padrão: as etapas separadas por vírgula)
+    """
+
+    def __init__(self, stages=(), name=None):
+        self.stages = []
+        for stage in stages:
+            stage_name, params = (stage, {}) if isinstance(stage, str) else stage
+            if stage_name not in STAGES:
+                raise ValueError(f"Etapa de pré-processamento desconhecida: {stage_name}. "
+                                 f"Disponíveis: {', '.join(STAGES)}")
+            self.stages.append((stage_name, dict(params)))
+        self.name = name or ','.join(stage_name for stage_name, _ in self.stages) or 'none'
+
+    @classmethod
+    def from_spec(cls, spec):
+        """Cria o pipeline a partir do nome de um preset ou de uma lista de etapas separadas por vírgula"""
+        spec = (spec or 'none').strip()
+        if spec in PRESETS:
+            return cls(PRESETS[spec], name=spec)
+        return cls([name.strip() for name in spec.split(',') if name.strip()])
+
+    def __bool__(self):
+        return bool(self.stages)
+
+    def __repr__(self):
+        return f"PreprocessingPipeline({self.name!r})"
+
+    def run(self, img):
+        """
+        Aplica as etapas. A imagem de entrada não é alterada.
+
+        Args:
+            img: imagem uint8 em escala de cinza
+
+        Returns:
+            tuple: (imagem processada, relatório {'preset', 'stages': {etapa: ms}, 'scale', 'angle'}).
+            'scale' é o fator de ampliação aplicado (as coordenadas na imagem processada
+            divididas por ele voltam à imagem original) e 'angle' a rotação corrigida.
+        """
+        if img.ndim != 2 or img.dtype != np.uint8:
+            raise ValueError("O pré-processamento espera uma imagem uint8 em escala de cinza.")
+        context = {'scale': 1.0, 'angle': None}
+        timings = {}
+        if self.stages:
+            img = img.copy()
+        for stage_name, params in self.stages:
+            start = time.perf_counter()
+            img = STAGES[stage_name](img, context, **params)
+            timings[stage_name] = round((time.perf_counter() - start) * 1000, 3)
+        return img, {'preset': self.name, 'stages': timings,
+                     'scale': round(context['scale'], 4), 'angle': context['angle']}
+
+
+OCR_PREPROCESS = os.getenv('OCR_PREPROCESS', 'none')
+VISION_PREPROCESS = os.getenv('VISION_PREPROCESS', 'legacy')
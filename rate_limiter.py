@@ -0,0 +1,236 @@
+"""
+Limite de taxa do lado do cliente para a cota do Gemini (requisições e tokens por minuto).
+
+Dois baldes de fichas (token bucket), um para requisições (RPM) e outro para tokens
+(TPM). Cada chamada reserva uma requisição e a estimativa de tokens antes de ser
+enviada e espera enquanto algum dos baldes não tiver saldo; a estimativa é acertada
+com o usageMetadata da resposta. Um 429 do Gemini bloqueia todos os chamadores até
+o Retry-After.
+
+O estado dos baldes fica em um arquivo com lock (fcntl.flock), compartilhado por
+todas as threads e processos da máquina que usam a mesma chave de API (workers
+do gunicorn, processos do modo lote). Sem fcntl (Windows), o limite vale por processo.
+"""
+import os
+import time
+import struct
+import hashlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Tokens por imagem enviada em inline_data (imagens de até 384px; maiores usam blocos de 258)
+IMAGE_TOKENS = 258
+# Tokens da resposta, reservados antes do envio e acertados com o usageMetadata
+OUTPUT_TOKENS_ESTIMATE = int(os.getenv('GEMINI_OUTPUT_TOKENS_ESTIMATE', '500'))
+# Fração da cota que pode ser usada de uma vez (rajada); o restante é liberado aos poucos
+RATE_LIMIT_BURST = float(os.getenv('GEMINI_RATE_LIMIT_BURST', '0.1'))
+
+# Nível do balde de requisições, nível do balde de tokens, última atualização, bloqueado até
+_STATE = struct.Struct('<4d')
+
+
+class RateLimitTimeoutError(Exception):
+    pass
+
+
+def estimate_tokens(payload, output_tokens=OUTPUT_TOKENS_ESTIMATE):
+    """Estimativa dos tokens de uma chamada: ~4 caracteres por token de texto, imagens e resposta"""
+    tokens = output_tokens
+    for content in payload.get('contents', []):
+        for part in content.get('parts', []):
+            if 'text' in part:
+                tokens += len(part['text']) // 4 + 1
+            elif 'inline_data' in part:
+                tokens += IMAGE_TOKENS
+    return tokens
+
+
+def default_state_path(api_key):
+    """Arquivo de estado por chave de API (a cota do Gemini é por chave)"""
+    digest = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"gemini-rate-{digest}.state")
+
+
+class _MemoryState:
+    """Estado dos baldes no próprio processo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+    def read(self):
+        return self._values
+
+    def write(self, values):
+        self._values = values
+
+
+class _FileState:
+    """
+    Estado dos baldes em um arquivo compartilhado entre processos. O flock vale por
+    descritor aberto, que é herdado em um fork: cada processo abre o próprio.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            if self._pid != os.getpid():
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                self._pid = os.getpid()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+    def read(self):
+        data = os.pread(self._fd, _STATE.size, 0)
+        return _STATE.unpack(data) if len(data) == _STATE.size else None
+
+    def write(self, values):
+        os.pwrite(self._fd, _STATE.pack(*values), 0)
+
+
+class RateLimiter:
+    """
+    Args:
+        rpm: requisições por período (0 = sem limite)
+        tpm: tokens por período (0 = sem limite)
+        state_path: arquivo de estado compartilhado (None = apenas este processo)
+        max_wait: espera máxima por chamada, em segundos; além disso RateLimitTimeoutError
+        burst: fração da cota disponível de uma vez. O reabastecimento é
+            (cota - rajada) por período, para que nenhuma janela de um período ultrapasse a cota.
+            Com cotas muito pequenas (ex: GEMINI_RPM=1) a rajada ainda comporta uma chamada e o
+            reabastecimento é de metade da cota por período
+        period: duração da janela da cota em segundos (60 para RPM/TPM)
+    """
+
+    def __init__(self, rpm=0, tpm=0, state_path=None, max_wait=30.0, burst=RATE_LIMIT_BURST, period=60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_wait = max_wait
+        self.period = period
+        self._capacity = (self._burst(rpm, burst, 1), self._burst(tpm, burst, OUTPUT_TOKENS_ESTIMATE + IMAGE_TOKENS))
+        self._rate = tuple(max(limit - capacity, limit * 0.5) / period if limit else 0.0
+                           for limit, capacity in zip((rpm, tpm), self._capacity))
+        self._state = _FileState(state_path) if state_path and fcntl is not None else _MemoryState()
+        self._stats_lock = threading.Lock()
+        self._stats = {'waits': 0, 'wait_seconds': 0.0, 'timeouts': 0}
+
+    @staticmethod
+    def _burst(limit, fraction, minimum):
+        if not limit:
+            return 0.0
+        # A rajada deixa ao menos metade da cota para o reabastecimento, mas sempre comporta
+        # uma chamada inteira (senão nenhuma chamada passaria com cotas pequenas)
+        return float(max(minimum, min(limit * fraction, limit * 0.5)))
+
+    @property
+    def enabled(self):
+        return bool(self.rpm or self.tpm)
+
+    def _refill(self, values, now):
+        if values is None:
+            return [*self._capacity, now, 0.0]
+        requests_level, tokens_level, updated_at, blocked_until = values
+        elapsed = max(0.0, now - updated_at)
+        return [min(self._capacity[0], requests_level + elapsed * self._rate[0]),
+                min(self._capacity[1], tokens_level + elapsed * self._rate[1]),
+                now, blocked_until]
+
+    def acquire(self, tokens):
+        """
+        Reserva uma requisição e tokens, esperando se necessário.
+
+        Returns:
+            float: tempo esperado, em segundos
+
+        Raises:
+            RateLimitTimeoutError: se a espera ultrapassar max_wait
+        """
+        if not self.enabled:
+            return 0.0
+        # Uma chamada maior que a rajada espera o balde encher
+        tokens = min(tokens, self._capacity[1]) if self.tpm else 0
+        start = time.monotonic()
+        while True:
+            with self._state:
+                now = time.time()
+                state = self._refill(self._state.read(), now)
+                wait = state[3] - now
+                if wait <= 0:
+                    wait = max((1 - state[0]) / self._rate[0] if self.rpm else 0.0,
+                               (tokens - state[1]) / self._rate[1] if self.tpm else 0.0)
+                    if wait <= 0:
+                        if self.rpm:
+                            state[0] -= 1
+                        state[1] -= tokens
+                        self._state.write(state)
+                        waited = time.monotonic() - start
+                        if waited > 0.001:
+                            self._record(waits=1, wait_seconds=waited)
+                        return waited
+                self._state.write(state)
+            if time.monotonic() - start + wait > self.max_wait:
+                self._record(timeouts=1)
+                raise RateLimitTimeoutError(
+                    f"Limite de chamadas ao Gemini atingido (GEMINI_RPM={self.rpm}, GEMINI_TPM={self.tpm}): "
+                    f"espera maior que {self.max_wait:g}s."
+                )
+            time.sleep(wait)
+
+    def settle(self, estimated, actual):
+        """Acerta o balde de tokens com o consumo real informado pela API"""
+        if not self.tpm or actual is None:
+            return
+        with self._state:
+            state = self._refill(self._state.read(), time.time())
+            # Pode ficar negativo: a diferença é descontada das próximas chamadas
+            state[1] = min(self._capacity[1], state[1] + min(estimated, self._capacity[1]) - actual)
+            self._state.write(state)
+
+    def block(self, seconds):
+        """Suspende as chamadas de todos os processos por seconds (ex: Retry-After de um 429)"""
+        if not self.enabled or seconds <= 0:
+            return
+        with self._state:
+            now = time.time()
+            state = self._refill(self._state.read(), now)
+            state[3] = max(state[3], now + seconds)
+            self._state.write(state)
+
+    def _record(self, **values):
+        with self._stats_lock:
+            for name, value in values.items():
+                self._stats[name] += value
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+        return {'rpm': self.rpm, 'tpm': self.tpm, **stats}
@@ -0,0 +1,303 @@
+"""
+Interpretação das respostas estruturadas do Gemini (JSON das análises de texto e imagem).
+
+- extract_json: localiza o primeiro objeto JSON do texto (blocos ```json, texto
+  antes/depois e vários objetos não atrapalham). Se o objeto não decodifica, um
+  scanner de chaves balanceadas, em uma única passada e ignorando chaves dentro de
+  strings, corrige erros comuns do modelo: vírgulas sobrando antes de } ou ] e
+  saída truncada (fecha o que ficou aberto, descartando o último item incompleto).
+  Quebras de linha dentro de strings são aceitas.
+- validate_analysis: confere o formato esperado ({"frase_N" | "elemento_visual_N" |
+  "analise_geral": {"probabilidade_de_ser_meme", "detalhamento"}}), converte
+  probabilidades em texto ("85", "85%") em números e descarta entradas inválidas.
+- parse_analysis_response: as duas etapas sobre o JSON da API; 'usable' indica se
+  sobrou alguma entrada válida (caso contrário a chamada pode ser repetida).
+"""
+import re
+import json
+import time
+
+
+PROBABILITY_KEY = 'probabilidade_de_ser_meme'
+DETAIL_KEY = 'detalhamento'
+GENERAL_KEY = 'analise_geral'
+ENTRY_PATTERNS = {
+    'text': re.compile(r'frase_\d+'),
+    'image': re.compile(r'elemento_visual_\d+'),
+}
+
+# Caracteres que mudam o estado do scanner; o resto do texto é pulado pelo regex
+_TOKENS = re.compile(r'[{}\[\]",:\\]')
+_NUMBER = re.compile(r'-?\d+(?:[.,]\d+)?')
+_CLOSERS = {'{': '}', '[': ']'}
+_MAX_CANDIDATES = 8
+
+
+class ParsedAnalysis:
+    """
+    Resultado da interpretação de uma resposta.
+
+    Attributes:
+        data: dicionário da análise (None se nenhum JSON foi encontrado)
+        usable: se há pelo menos uma entrada válida
+        repairs: correções aplicadas ao texto (ex: 'trailing_comma', 'truncated')
+        problems: divergências do formato esperado
+        parse_seconds: tempo gasto na interpretação
+        attempts: número de chamadas ao Gemini até esta resposta
+    """
+
+    def __init__(self, data, usable, repairs, problems, parse_seconds=0.0, attempts=1):
+        self.data = data
+        self.usable = usable
+        self.repairs = repairs
+        self.problems = problems
+        self.parse_seconds = parse_seconds
+        self.attempts = attempts
+
+    def report(self):
+        return {'attempts': self.attempts, 'repairs': self.repairs, 'problems': self.problems}
+
+
+def _scan(text, start):
+    """
+    Percorre o objeto que começa em text[start] ('{').
+
+    Returns:
+        tuple: (fim do objeto ou None se truncado, vírgulas fora de strings, último ponto
+        seguro de corte como (posição, contêineres abertos), se terminou dentro de uma string)
+    """
+    stack = []
+    # Em cada objeto aberto: True enquanto o próximo item esperado for uma chave
+    expect_key = []
+    commas = []
+    safe = (start, ())
+    in_string = False
+    string_is_key = False
+    skip_until = -1
+    for match in _TOKENS.finditer(text, start):
+        position = match.start()
+        if position < skip_until:
+            continue
+        char = match.group()
+        if in_string:
+            if char == '\\':
+                skip_until = position + 2
+            elif char == '"':
+                in_string = False
+                if not string_is_key:
+                    safe = (position + 1, tuple(stack))
+            continue
+        if char == '"':
+            in_string = True
+            string_is_key = bool(stack) and stack[-1] == '{' and expect_key[-1]
+        elif char in '{[':
+            stack.append(char)
+            expect_key.append(char == '{')
+            safe = (position + 1, tuple(stack))
+        elif char in '}]':
+            if not stack:
+                return position + 1, commas, safe, False
+            stack.pop()
+            expect_key.pop()
+            if not stack:
+                return position + 1, commas, safe, False
+            safe = (position + 1, tuple(stack))
+        elif char == ',':
+            commas.append(position)
+            safe = (position, tuple(stack))
+            if stack[-1] == '{':
+                expect_key[-1] = True
+        elif char == ':':
+            if stack[-1] == '{':
+                expect_key[-1] = False
+    return None, commas, safe, in_string
+
+
+def _remove_trailing_commas(fragment, commas, offset):
+    """Remove vírgulas (fora de strings) seguidas apenas de espaços e de } ou ]"""
+    removed = []
+    for comma in commas:
+        index = comma - offset
+        # Vírgulas além do corte de uma saída truncada já não estão no fragmento
+        if index >= len(fragment) or fragment[index] != ',':
+            continue
+        rest = fragment[index + 1:].lstrip()
+        if not rest or rest[0] in '}]':
+            removed.append(index)
+    if not removed:
+        return fragment, False
+    pieces = []
+    previous = 0
+    for index in removed:
+        pieces.append(fragment[previous:index])
+        previous = index + 1
+    pieces.append(fragment[previous:])
+    return ''.join(pieces), True
+
+
+# strict=False aceita quebras de linha e tabs dentro de strings
+_DECODER = json.JSONDecoder(strict=False)
+
+
+def _loads(fragment):
+    data = _DECODER.decode(fragment)
+    return data if isinstance(data, dict) and data else None
+
+
+def extract_json(text):
+    """
+    Extrai o primeiro objeto JSON válido (ou recuperável) do texto.
+
+    Cada '{' candidato é decodificado direto do texto (raw_decode, em C, ignora o que
+    vier depois); só quando isso falha o scanner percorre o objeto para corrigi-lo. Um
+    candidato que não pode ser recuperado é pulado inteiro, para não devolver um dos
+    objetos internos no lugar dele.
+
+    Returns:
+        tuple: (dicionário ou None, lista de correções aplicadas)
+    """
+    if not text:
+        return None, []
+    start = text.find('{')
+    candidates = 0
+    while start != -1 and candidates < _MAX_CANDIDATES:
+        candidates += 1
+        try:
+            data, _ = _DECODER.raw_decode(text, start)
+            if isinstance(data, dict) and data:
+                return data, []
+        except ValueError:
+            pass
+        end, commas, safe, in_string = _scan(text, start)
+        repairs = []
+        if end is not None:
+            fragment = text[start:end]
+        else:
+            # Saída truncada: corta no último item completo e fecha os contêineres abertos
+            cut, open_containers = safe
+            if cut <= start + 1:
+                # Nenhum item completo: não há o que recuperar
+                break
+            fragment = text[start:cut].rstrip()
+            if fragment.endswith(','):
+                fragment = fragment[:-1]
+            fragment += ''.join(_CLOSERS[container] for container in reversed(open_containers))
+            repairs.append('truncated')
+            if in_string:
+                repairs.append('unterminated_string')
+        fragment, removed = _remove_trailing_commas(fragment, commas, start)
+        if removed:
+            repairs.append('trailing_comma')
+        try:
+            data = _loads(fragment)
+            if data is not None:
+                return data, repairs
+        except ValueError:
+            pass
+        if end is None:
+            break
+        start = text.find('{', end)
+    return None, []
+
+
+def _probability(value):
+    """Converte a probabilidade em número (aceita "85", "85%", "85,5"); None se inválida"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        match = _NUMBER.search(value)
+        if match:
+            number = float(match.group().replace(',', '.'))
+            return int(number) if number.is_integer() else number
+    return None
+
+
+def validate_analysis(data, kind):
+    """
+    Confere e normaliza uma análise.
+
+    Args:
+        data: dicionário extraído da resposta
+        kind: 'text' (frase_N), 'image' (elemento_visual_N) ou 'fused' (frase_N e comprehensible_text)
+
+    Returns:
+        tuple: (análise normalizada, lista de problemas, se há alguma entrada válida)
+    """
+    if not isinstance(data, dict):
+        return None, ['não é um objeto JSON'], False
+    pattern = ENTRY_PATTERNS['image' if kind == 'image' else 'text']
+    problems = []
+    normalized = {}
+    valid_entries = 0
+    for key, entry in data.items():
+        if kind == 'fused' and key == 'comprehensible_text':
+            normalized[key] = entry
+            continue
+        if key != GENERAL_KEY and not pattern.fullmatch(key):
+            problems.append(f"chave inesperada: {key}")
+        if not isinstance(entry, dict):
+            problems.append(f"{key}: não é um objeto")
+            continue
+        probability = _probability(entry.get(PROBABILITY_KEY))
+        if probability is None:
+            problems.append(f"{key}: {PROBABILITY_KEY} ausente ou inválida")
+            continue
+        if probability != entry[PROBABILITY_KEY]:
+            problems.append(f"{key}: {PROBABILITY_KEY} convertida de {entry[PROBABILITY_KEY]!r}")
+            entry = {**entry, PROBABILITY_KEY: probability}
+        if not 0 <= probability <= 100:
+            problems.append(f"{key}: {PROBABILITY_KEY} fora de 0-100")
+            entry = {**entry, PROBABILITY_KEY: min(100, max(0, probability))}
+        if not isinstance(entry.get(DETAIL_KEY), str):
+            problems.append(f"{key}: {DETAIL_KEY} ausente")
+        normalized[key] = entry
+        valid_entries += 1
+    if GENERAL_KEY not in data:
+        problems.append(f"{GENERAL_KEY} ausente")
+    if not valid_entries:
+        problems.append('nenhuma entrada válida')
+    return normalized, problems, valid_entries > 0
+
+
+def response_text(response_json):
+    """Texto gerado (todas as partes da primeira candidata) e o motivo de término"""
+    candidates = response_json.get('candidates') or [{}]
+    candidate = candidates[0]
+    parts = (candidate.get('content') or {}).get('parts') or []
+    return ''.join(part.get('text', '') for part in parts), candidate.get('finishReason')
+
+
+def parse_analysis_response(response_json, kind):
+    """
+    Interpreta o JSON de uma resposta de generateContent.
+
+    Args:
+        response_json: corpo da resposta da API já decodificado
+        kind: 'text', 'image' ou 'fused' (veja validate_analysis)
+
+    Returns:
+        ParsedAnalysis
+    """
+    start = time.perf_counter()
+    text, finish_reason = response_text(response_json)
+    data, repairs = extract_json(text)
+    if finish_reason == 'MAX_TOKENS':
+        repairs = [*repairs, 'max_tokens']
+    if data is None:
+        return ParsedAnalysis(None, False, repairs, ['nenhum JSON encontrado na resposta'],
+                              time.perf_counter() - start)
+    data, problems, usable = validate_analysis(data, kind)
+    return ParsedAnalysis(data, usable, repairs, problems, time.perf_counter() - start)
+
+
+def average_probability(analysis):
+    """Média das probabilidades das entradas de uma análise validada (None se não houver)"""
+    if not analysis or not isinstance(analysis, dict):
+        return None
+    probabilities = [entry[PROBABILITY_KEY] for entry in analysis.values()
+                     if isinstance(entry, dict) and isinstance(entry.get(PROBABILITY_KEY), (int, float))]
+    if not probabilities:
+        return None
+    return sum(probabilities) / len(probabilities)
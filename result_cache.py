@@ -0,0 +1,136 @@
+"""
+Cache de resultados da análise de imagens, endereçado pelo hash do conteúdo.
+
+Camada em memória (LRU com limite de entradas e expiração por TTL) e camada
+opcional em disco (SQLite), que sobrevive a reinícios do servidor.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def make_cache_key(image_data, *parts):
+    """
+    Gera a chave do cache a partir dos bytes da imagem e de partes adicionais
+    (versão dos prompts/modelo, flags da requisição).
+    """
+    digest = hashlib.sha256(image_data)
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(str(part).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Args:
+        max_entries: número máximo de entradas na memória (as menos usadas são removidas)
+        ttl: tempo de vida das entradas em segundos (0 = sem expiração)
+        db_path: caminho do banco SQLite para a camada em disco (None = desativada)
+        on_evict: função opcional chamada com a chave de cada entrada que deixa o cache
+            (removida da memória sem camada em disco, ou expirada)
+    """
+
+    def __init__(self, max_entries=1024, ttl=86400, db_path=None, on_evict=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+        self._db_path = db_path
+        self._db_conn = None
+        self._db_pid = None
+        if db_path:
+            self._connect()
+
+    def _connect(self):
+        # WAL permite leituras de vários processos (workers do servidor) durante uma escrita
+        self._db_conn = sqlite3.connect(self._db_path, check_same_thread=False, timeout=10)
+        self._db_conn.execute('PRAGMA journal_mode=WAL')
+        self._db_conn.execute(
+            'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)'
+        )
+        self._db_conn.commit()
+        self._db_pid = os.getpid()
+
+    @property
+    def _db(self):
+        """Conexão SQLite do processo atual: conexões não podem ser herdadas após um fork"""
+        if self._db_path is None:
+            return None
+        if self._db_pid != os.getpid():
+            self._connect()
+        return self._db_conn
+
+    def _expired(self, created_at, now):
+        return self.ttl > 0 and now - created_at > self.ttl
+
+    def get(self, key):
+        """Retorna o valor armazenado ou None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._expired(created_at, now):
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    self._counters['memory_hits'] += 1
+                    return value
+                del self._entries[key]
+                if self._db is None:
+                    self._evicted(key)
+
+            if self._db is not None:
+                row = self._db.execute('SELECT value, created_at FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    if not self._expired(row[1], now):
+                        value = json.loads(row[0])
+                        self._store_in_memory(key, value, row[1])
+                        self._counters['hits'] += 1
+                        self._counters['disk_hits'] += 1
+                        return value
+                    self._db.execute('DELETE FROM results WHERE key = ?', (key,))
+                    self._db.commit()
+                    self._evicted(key)
+
+            self._counters['misses'] += 1
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._store_in_memory(key, value, now)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO results (key, value, created_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value), now)
+                )
+                self._db.commit()
+
+    def _store_in_memory(self, key, value, created_at):
+        self._entries[key] = (created_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            # Com a camada em disco, a entrada continua disponível
+            if self._db is None:
+                self._evicted(evicted)
+
+    def _evicted(self, key):
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
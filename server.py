@@ -1,28 +1,135 @@
 import os
-import requests
 import argparse
-import json
-import re
 import base64
-import numpy as np
-import cv2
-from PIL import Image
-import io
-from flask import Flask, request, jsonify
+import time
+import uuid
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from dotenv import load_dotenv
-from image_processor import extract_text_from_image, extract_text_with_confidence
 
+# Carregado antes dos módulos locais, que leem a configuração do ambiente ao serem importados
 load_dotenv('./.env')
 
+from image_processor import DecodedImage, ocr_image, optimize_image_payload, OCR_PREPROCESSING
+from preprocessing import PreprocessingPipeline, VISION_PREPROCESS
+from text_regions import OCR_REGIONS
+from pipeline import Stage, run_pipeline, measure_resources
+from gemini_client import GeminiClient, GEMINI_MODEL
+from result_cache import ResultCache, make_cache_key
+from phash_index import NearDuplicateIndex, compute_phash
+from text_quality import evaluate_text_quality
+from batch import run_batch, list_images, BATCH_OCR_WORKERS, BATCH_CONCURRENCY
+from jobs import JobManager, QueueFullError, JobStoreUnavailableError
+from streaming import stream_format, stream_analysis
+from response_parser import ParsedAnalysis, parse_analysis_response, average_probability
+from frames import (MULTI_FRAME_ENABLED, is_multi_frame, select_keyframes, ocr_keyframes, vision_frames,
+                    frame_settings)
+from meme_classifier import LOCAL_VISION_ENABLED, classify, local_image_analysis, classifier_version
+from metrics import (registry as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE, STAGE_SECONDS,
+                     STAGE_FAILURES, ANALYSIS_RESULTS, UPLOAD_BYTES, VISION_PAYLOAD_BYTES,
+                     LOCAL_VISION_DECISIONS,
+                     HTTP_REQUESTS, HTTP_SECONDS, HTTP_IN_FLIGHT)
+from serving import (serve, SERVER_HOST, SERVER_PORT, SERVER_BACKEND, SERVER_WORKERS, SERVER_THREADS,
+                     MAX_UPLOAD_MB, MAX_CONTENT_LENGTH)
+
 app = Flask(__name__)
 CORS(app)
+# Requisições maiores que MAX_UPLOAD_MB são recusadas com 413 antes de serem lidas
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
+# Sem a chave, o servidor sobe normalmente (rotas de OCR, /health, fixtures em modo
+# replay); as chamadas ao Gemini falham com ValueError (veja GeminiClient.post)
 GOOG_API_KEY = os.getenv('GOOG_API_KEY')
-SERVER_PORT = os.getenv('SERVER_PORT')
 
-if not GOOG_API_KEY:
-    raise ValueError("GOOG_API_KEY não encontrada nas variáveis de ambiente. Por favor, configure a variável GOOG_API_KEY.")
+# Cliente compartilhado (pool de conexões, timeouts, retentativas e circuit breaker)
+gemini_client = GeminiClient(GOOG_API_KEY)
+
+# Processamento em lote: diretório dos resultados e diretório base dos caminhos aceitos em /analyze-batch
+BATCH_OUTPUT_DIR = os.getenv('BATCH_OUTPUT_DIR', 'results')
+BATCH_BASE_DIR = os.getenv('BATCH_BASE_DIR', '.')
+
+# Análise do texto: 'two_step' (limpeza e análise em chamadas separadas) ou
+# 'fused' (uma única chamada). Pode ser escolhido por requisição com text_mode
+TEXT_ANALYSIS_MODES = ('two_step', 'fused')
+TEXT_ANALYSIS_MODE = os.getenv('TEXT_ANALYSIS_MODE', 'two_step')
+# Avaliação local do texto do OCR antes de chamar o Gemini (veja text_quality.py).
+# Pode ser desativada por requisição com text_gate=false
+TEXT_GATE_ENABLED = os.getenv('TEXT_GATE', 'true').lower() == 'true'
+# Modo JSON do Gemini (responseMimeType application/json) nas chamadas de análise
+GEMINI_JSON_MODE = os.getenv('GEMINI_JSON_MODE', 'true').lower() == 'true'
+# Novas chamadas de um ramo (texto ou imagem) cuja resposta não tem nenhuma entrada válida
+GEMINI_PARSE_RETRIES = int(os.getenv('GEMINI_PARSE_RETRIES', '1'))
+
+# Pré-processamento da imagem enviada ao Gemini (preset ou lista de etapas, veja preprocessing.py)
+VISION_PREPROCESSING = PreprocessingPipeline.from_spec(VISION_PREPROCESS)
+
+# Ordem das etapas do fluxo de análise e tempo limite (segundos) de cada uma.
+# Pode ser sobrescrito com STAGE_TIMEOUT_<ETAPA>, ex: STAGE_TIMEOUT_VISION=90
+PIPELINE_STAGE_ORDER = ['frames', 'ocr', 'text_gate', 'cleanup', 'text_analysis', 'local_vision', 'preprocess',
+                        'vision']
+DEFAULT_STAGE_TIMEOUTS = {
+    'frames': 30,
+    'ocr': 60,
+    'cleanup': 60,
+    'text_analysis': 60,
+    'local_vision': 10,
+    'preprocess': 30,
+    'vision': 90,
+}
+STAGE_TIMEOUTS = {
+    name: float(os.getenv(f'STAGE_TIMEOUT_{name.upper()}', default))
+    for name, default in DEFAULT_STAGE_TIMEOUTS.items()
+}
+
+# Cache de resultados: RESULT_CACHE_SIZE entradas em memória, expiração em
+# RESULT_CACHE_TTL segundos e, se RESULT_CACHE_DB for definido, persistência em SQLite
+result_cache = ResultCache(
+    max_entries=int(os.getenv('RESULT_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('RESULT_CACHE_TTL', '86400')),
+    db_path=os.getenv('RESULT_CACHE_DB') or None,
+    # Entradas que deixam o cache saem também do índice de quase-duplicatas
+    on_evict=lambda key: near_duplicate_index.remove(key)
+)
+
+# Quase-duplicatas: imagens com hash perceptual a distância de Hamming <= NEAR_DUP_MAX_DISTANCE
+# de uma imagem já analisada reutilizam a análise visual dela (0 desativa). O OCR e a
+# análise do texto sempre rodam: memes do mesmo modelo com legendas diferentes têm hashes
+# quase iguais
+NEAR_DUP_MAX_DISTANCE = int(os.getenv('NEAR_DUP_MAX_DISTANCE', '6'))
+near_duplicate_index = NearDuplicateIndex(max_distance=max(NEAR_DUP_MAX_DISTANCE, 0))
+
+VISION_PROMPT = """Analise APENAS os elementos visuais desta imagem (sem considerar textos ou frases). Foque na composição visual, estilo, elementos gráficos, cores, formas e layout.
+
+Instruções:
+1. Analise os elementos visuais presentes na imagem (imagens, gráficos, composição, estilo visual, cores, formas, layout)
+2. Para cada elemento visual identificado, analise:
+   - A probabilidade de ser meme (valor de 0 a 100)
+   - Um detalhamento explicando a análise baseada APENAS em elementos visuais
+
+3. Além disso, faça uma análise geral considerando TODOS os elementos visuais em conjunto, avaliando a imagem completa como um todo, baseando-se APENAS em aspectos visuais (composição, estilo de meme, elementos gráficos, contexto visual).
+
+4. Retorne APENAS um JSON válido no seguinte formato (sem markdown, sem explicações adicionais):
+
+{
+  "elemento_visual_1": {
+    "probabilidade_de_ser_meme": <número de 0 a 100>,
+    "detalhamento": "<explicação detalhada da análise baseada APENAS em elementos visuais>"
+  },
+  "elemento_visual_2": {
+    "probabilidade_de_ser_meme": <número de 0 a 100>,
+    "detalhamento": "<explicação detalhada da análise baseada APENAS em elementos visuais>"
+  },
+  "analise_geral": {
+    "probabilidade_de_ser_meme": <número de 0 a 100, considerando todos os elementos visuais em conjunto>,
+    "detalhamento": "<explicação detalhada da análise geral da imagem completa, considerando APENAS aspectos visuais como composição, estilo típico de memes, elementos gráficos, cores, formas, layout, contexto visual, etc. NÃO mencione textos ou frases.>"
+  }
+}
+
+IMPORTANTE: 
+- Analise APENAS elementos visuais (imagens, gráficos, composição, estilo, cores, formas, layout)
+- NÃO analise ou mencione textos ou frases
+- Retorne APENAS o JSON, sem markdown, sem código, sem explicações. Apenas o JSON puro."""
 
 def format_prompt(user_text):
     prompt = f"""Analise o seguinte texto extraído de uma imagem e identifique cada frase ou sentença separadamente. Para cada frase, retorne um JSON estruturado com as seguintes informações:
@@ -58,39 +165,72 @@ Instruções:
 IMPORTANTE: Retorne APENAS o JSON, sem markdown, sem código, sem explicações. Apenas o JSON puro."""
     return prompt
 
-def get_validation_parameters(user_text):
+def format_fused_prompt(extracted_text):
+    """
+    Prompt único que faz a limpeza do texto do OCR e a análise por frase na mesma
+    chamada (modo 'fused'), retornando também o campo comprehensible_text.
+    """
+    prompt = f"""O texto abaixo foi extraído de uma imagem por OCR e pode conter caracteres estranhos e erros de reconhecimento óptico.
 
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    
-    headers = {
-        'Content-Type': 'application/json',
-        'X-goog-api-key': GOOG_API_KEY
-    }
-    
-    payload = {
-        "contents": [
-            {
-                "parts": [
-                    {
-                        "text": user_text
-                    }
-                ]
-            }
-        ]
-    }
+Texto extraído:
+{extracted_text}
+
+Instruções:
+1. Extraia apenas o texto compreensível e legível: remova caracteres estranhos e erros de reconhecimento óptico, mantendo apenas o texto que faz sentido
+2. Identifique e separe cada frase ou sentença do texto limpo
+3. Para cada frase, analise:
+   - A métrica de credibilidade (valor de 1 a 5, onde 1 = muito falso, 5 = muito verdadeiro)
+   - Um detalhamento explicando a análise
+
+4. Além disso, faça uma análise geral considerando TODAS as frases em conjunto, avaliando o texto completo como um todo.
+
+5. Retorne APENAS um JSON válido no seguinte formato (sem markdown, sem explicações adicionais):
+
+{{
+  "comprehensible_text": "<texto limpo e compreensível>",
+  "frase_1": {{
+    "probabilidade_de_ser_meme": <número de 0 a 100>,
+    "detalhamento": "<explicação detalhada da análise>"
+  }},
+  "frase_2": {{
+    "probabilidade_de_ser_meme": <número de 0 a 100>,
+    "detalhamento": "<explicação detalhada da análise>"
+  }},
+  "analise_geral": {{
+    "probabilidade_de_ser_meme": <número de 0 a 100, considerando todas as frases em conjunto>,
+    "detalhamento": "<explicação detalhada da análise geral do texto completo, considerando o contexto e a relação entre todas as frases>"
+  }}
+}}
+
+IMPORTANTE: Retorne APENAS o JSON, sem markdown, sem código, sem explicações. Apenas o JSON puro."""
+    return prompt
+
+def analysis_generation_config():
+    """generationConfig das chamadas que devem retornar o JSON da análise"""
+    return {"responseMimeType": "application/json"} if GEMINI_JSON_MODE else None
+
+def get_validation_parameters(user_text, call='text_analysis', generation_config=None):
+
+    parts = [
+        {
+            "text": user_text
+        }
+    ]
     
-    response = requests.post(url, headers=headers, json=payload)
+    response = gemini_client.generate_content(parts, call=call, generation_config=generation_config)
     return response
 
-def extract_comprehensible_text(extracted_text):
-    prompt = f"""Extraia e retorne apenas o texto compreensível e legível do seguinte texto extraído de uma imagem por OCR. 
+CLEANUP_PROMPT = """Extraia e retorne apenas o texto compreensível e legível do seguinte texto extraído de uma imagem por OCR. 
 Remova caracteres estranhos, erros de reconhecimento óptico e mantenha apenas o texto que faz sentido:
 
 {extracted_text}
 
 Retorne apenas o texto limpo e compreensível, sem explicações adicionais."""
+
+def extract_comprehensible_text(extracted_text):
+    prompt = CLEANUP_PROMPT.format(extracted_text=extracted_text)
     
-    response = get_validation_parameters(prompt)
+    response = get_validation_parameters(prompt, call='cleanup')
     
     if response.status_code == 200:
         result = response.json()
@@ -102,101 +242,55 @@ Retorne apenas o texto limpo e compreensível, sem explicações adicionais."""
     
     return extracted_text
 
-def extract_json_from_response(text):
+def preprocess_image_array(image_data, pipeline=None):
     """
-    Extrai JSON da resposta do Gemini, removendo markdown e texto adicional
-    """
-    # Remove markdown code blocks
-    text = re.sub(r'```json\s*', '', text)
-    text = re.sub(r'```\s*', '', text)
-    
-    # Tenta encontrar JSON entre chaves
-    json_match = re.search(r'\{.*\}', text, re.DOTALL)
-    if json_match:
-        try:
-            json_str = json_match.group(0)
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            pass
-    
-    # Se não encontrou, tenta parsear o texto inteiro
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        return None
-
-def calculate_average_probability(analysis_dict):
-    """
-    Calcula a média de todas as probabilidades_de_ser_meme em um dicionário de análise.
+    Aplica o pré-processamento do ramo visual na imagem em escala de cinza.
+    O padrão (VISION_PREPROCESS=legacy) é o de pprocess.py: equalização,
+    normalização e blur.
     
     Args:
-        analysis_dict: dicionário com análises (ex: text_analysis ou image_analysis)
+        image_data: bytes da imagem ou DecodedImage (reaproveita a escala de cinza já decodificada)
+        pipeline: PreprocessingPipeline (padrão: VISION_PREPROCESSING)
         
     Returns:
-        float: média das probabilidades, ou None se não houver probabilidades
+        tuple: (imagem pré-processada em escala de cinza, relatório do pré-processamento)
     """
-    if not analysis_dict or not isinstance(analysis_dict, dict):
-        return None
-    
-    probabilities = []
-    
-    def extract_probabilities(obj):
-        """Função recursiva para extrair todas as probabilidades"""
-        if isinstance(obj, dict):
-            if 'probabilidade_de_ser_meme' in obj:
-                prob = obj['probabilidade_de_ser_meme']
-                if isinstance(prob, (int, float)):
-                    probabilities.append(prob)
-            # Recursivamente processar todos os valores do dicionário
-            for value in obj.values():
-                extract_probabilities(value)
-        elif isinstance(obj, list):
-            for item in obj:
-                extract_probabilities(item)
-    
-    extract_probabilities(analysis_dict)
-    
-    if not probabilities:
-        return None
+    try:
+        image = image_data if isinstance(image_data, DecodedImage) else DecodedImage(image_data)
+        return (pipeline or VISION_PREPROCESSING).run(image.gray)
     
-    return sum(probabilities) / len(probabilities)
+    except Exception as e:
+        raise Exception(f"Erro ao pré-processar imagem: {str(e)}")
 
 def preprocess_image(image_data):
     """
-    Aplica pré-processamento na imagem (grayscale, equalização, normalização, blur).
-    Baseado no código de pprocess.py linhas 9-17.
+    Pré-processa a imagem e a codifica para envio ao Gemini, reduzindo a resolução
+    e escolhendo formato/qualidade para caber em VISION_BYTE_BUDGET.
     
     Args:
-        image_data: bytes da imagem
+        image_data: bytes da imagem ou DecodedImage
         
     Returns:
-        bytes: imagem pré-processada em formato JPEG
+        tuple: (bytes da imagem, tipo MIME correspondente, relatório de tamanhos,
+        relatório do pré-processamento)
     """
     try:
-        # Converter bytes para numpy array
-        nparr = np.frombuffer(image_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise ValueError("Erro ao decodificar a imagem.")
-        
-        # Processamento da imagem em escala de cinza
-        imgGray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        imgEqualized = cv2.equalizeHist(imgGray)
-        imgNorm = np.zeros(imgEqualized.shape)
-        imgNormalized = cv2.normalize(imgEqualized, imgNorm, 0, 255, cv2.NORM_MINMAX)
-        kernel_blur = np.ones((3, 3), np.float32) / 9
-        imgBlur = cv2.filter2D(imgNormalized, -1, kernel_blur)
-        imgFinal = imgBlur
-        
-        # Converter de volta para bytes (JPEG)
-        # cv2.imencode retorna (sucesso, array de bytes)
-        success, encoded_img = cv2.imencode('.jpg', imgFinal)
-        if not success:
-            raise ValueError("Erro ao codificar a imagem pré-processada.")
-        
-        return encoded_img.tobytes()
-    
+        original_bytes = len(image_data.data if isinstance(image_data, DecodedImage) else image_data)
+        processed, report = preprocess_image_array(image_data)
+        return (*optimize_image_payload(processed, original_bytes=original_bytes), report)
+    except Exception as e:
+        raise Exception(f"Erro ao pré-processar imagem: {str(e)}")
+
+def preprocess_frames(image, frames):
+    """
+    preprocess_image de uma imagem com vários quadros: o ramo visual recebe o mosaico
+    dos quadros-chave mais representativos (veja frames.py)
+    """
+    try:
+        gray, indices = vision_frames(frames)
+        processed, report = VISION_PREPROCESSING.run(gray)
+        payload, mime_type, sizes = optimize_image_payload(processed, original_bytes=len(image.data))
+        return payload, mime_type, {**sizes, 'frames': indices}, report
     except Exception as e:
         raise Exception(f"Erro ao pré-processar imagem: {str(e)}")
 
@@ -212,7 +306,7 @@ def analyze_image_with_gemini(image_data, mime_type='image/jpeg'):
     
     Args:
         image_data: bytes da imagem
-        mime_type: tipo MIME da imagem (image/jpeg ou image/png)
+        mime_type: tipo MIME da imagem (image/jpeg, image/webp ou image/png)
         
     Returns:
         response: resposta da API do Gemini
@@ -220,64 +314,21 @@ def analyze_image_with_gemini(image_data, mime_type='image/jpeg'):
     # Converter imagem para base64
     image_base64 = base64.b64encode(image_data).decode('utf-8')
     
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    
-    headers = {
-        'Content-Type': 'application/json',
-        'X-goog-api-key': GOOG_API_KEY
-    }
-    
-    prompt = """Analise APENAS os elementos visuais desta imagem (sem considerar textos ou frases). Foque na composição visual, estilo, elementos gráficos, cores, formas e layout.
-
-Instruções:
-1. Analise os elementos visuais presentes na imagem (imagens, gráficos, composição, estilo visual, cores, formas, layout)
-2. Para cada elemento visual identificado, analise:
-   - A probabilidade de ser meme (valor de 0 a 100)
-   - Um detalhamento explicando a análise baseada APENAS em elementos visuais
-
-3. Além disso, faça uma análise geral considerando TODOS os elementos visuais em conjunto, avaliando a imagem completa como um todo, baseando-se APENAS em aspectos visuais (composição, estilo de meme, elementos gráficos, contexto visual).
-
-4. Retorne APENAS um JSON válido no seguinte formato (sem markdown, sem explicações adicionais):
-
-{
-  "elemento_visual_1": {
-    "probabilidade_de_ser_meme": <número de 0 a 100>,
-    "detalhamento": "<explicação detalhada da análise baseada APENAS em elementos visuais>"
-  },
-  "elemento_visual_2": {
-    "probabilidade_de_ser_meme": <número de 0 a 100>,
-    "detalhamento": "<explicação detalhada da análise baseada APENAS em elementos visuais>"
-  },
-  "analise_geral": {
-    "probabilidade_de_ser_meme": <número de 0 a 100, considerando todos os elementos visuais em conjunto>,
-    "detalhamento": "<explicação detalhada da análise geral da imagem completa, considerando APENAS aspectos visuais como composição, estilo típico de memes, elementos gráficos, cores, formas, layout, contexto visual, etc. NÃO mencione textos ou frases.>"
-  }
-}
-
-IMPORTANTE: 
-- Analise APENAS elementos visuais (imagens, gráficos, composição, estilo, cores, formas, layout)
-- NÃO analise ou mencione textos ou frases
-- Retorne APENAS o JSON, sem markdown, sem código, sem explicações. Apenas o JSON puro."""
+    prompt = VISION_PROMPT
     
-    payload = {
-        "contents": [
-            {
-                "parts": [
-                    {
-                        "inline_data": {
-                            "mime_type": mime_type,
-                            "data": image_base64
-                        }
-                    },
-                    {
-                        "text": prompt
-                    }
-                ]
+    parts = [
+        {
+            "inline_data": {
+                "mime_type": mime_type,
+                "data": image_base64
             }
-        ]
-    }
+        },
+        {
+            "text": prompt
+        }
+    ]
     
-    response = requests.post(url, headers=headers, json=payload)
+    response = gemini_client.generate_content(parts, call='vision', generation_config=analysis_generation_config())
     return response
 
 @app.route('/generate', methods=['POST'])
@@ -293,7 +344,7 @@ def generate_content():
         
         prompt = format_prompt(user_text)
         
-        response = get_validation_parameters(prompt)
+        response = get_validation_parameters(prompt, call='generate')
         
         if response.status_code == 200:
             return jsonify(response.json()), 200
@@ -304,9 +355,522 @@ def generate_content():
                 'message': response.text
             }), response.status_code
             
+    except RequestEntityTooLarge:
+        # Tratado por request_too_large (413)
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def request_analysis(send, kind):
+    """
+    Faz a chamada de um ramo da análise e interpreta o JSON da resposta (veja
+    response_parser.py). Se nenhuma entrada válida for encontrada, repete apenas esta
+    chamada até GEMINI_PARSE_RETRIES vezes; o outro ramo não é refeito.
+
+    Args:
+        send: função sem argumentos que faz a chamada ao Gemini e retorna a resposta
+        kind: 'text', 'fused' ou 'image'
+
+    Returns:
+        tuple: (resposta da API, ParsedAnalysis ou None se a resposta não for 200)
+    """
+    attempts = 0
+    while True:
+        response = send()
+        attempts += 1
+        if response.status_code != 200:
+            return response, None
+        parsed = parse_analysis_response(response.json(), kind)
+        parsed.attempts = attempts
+        if parsed.usable or attempts > GEMINI_PARSE_RETRIES:
+            return response, parsed
+
+def analysis_options(source=None):
+    """
+    Normaliza as opções da análise a partir do form-data/JSON da requisição.
+
+    Returns:
+        dict: {'detailed': bool, 'text_mode': 'two_step' ou 'fused', 'text_gate': bool,
+        'local_vision': bool}
+
+    Raises:
+        ValueError: se alguma opção for inválida
+    """
+    source = source or {}
+    options = {
+        'detailed': str(source.get('detailed', 'false')).lower() == 'true',
+        'text_mode': str(source.get('text_mode', TEXT_ANALYSIS_MODE)).lower(),
+        'text_gate': str(source.get('text_gate', TEXT_GATE_ENABLED)).lower() == 'true',
+        'local_vision': str(source.get('local_vision', LOCAL_VISION_ENABLED)).lower() == 'true',
+    }
+    if options['text_mode'] not in TEXT_ANALYSIS_MODES:
+        raise ValueError(f"text_mode inválido: {options['text_mode']}. Use {' ou '.join(TEXT_ANALYSIS_MODES)}.")
+    return options
+
+def options_signature(options):
+    return tuple(sorted(options.items()))
+
+def run_ocr(image, ocr_result=None):
+    """
+    Executa o OCR (uma única passada do Tesseract) e retorna o resultado de ocr_image.
+    Se ocr_result for informado, reutiliza-o sem executar o Tesseract.
+    """
+    return ocr_result if ocr_result is not None else ocr_image(image)
+
+def run_frames_ocr(frames, ocr_result=None):
+    """run_ocr de uma imagem com vários quadros: OCR dos quadros-chave, com o texto unido"""
+    return ocr_result if ocr_result is not None else ocr_keyframes(frames)
+
+def run_text_gate(ocr, enabled):
+    """Decide como tratar o texto do OCR: 'skip', 'local_cleanup' ou 'gemini_cleanup'"""
+    if not enabled:
+        return {'enabled': False, 'decision': 'gemini_cleanup'}
+    return {'enabled': True, **evaluate_text_quality(ocr)}
+
+def run_cleanup(ocr, gate):
+    if gate['decision'] == 'skip':
+        return ''
+    if gate['decision'] == 'local_cleanup':
+        return gate['clean_text']
+    return extract_comprehensible_text(ocr['text'])
+
+def run_text_analysis(text, gate):
+    if gate['decision'] == 'skip':
+        return None
+    return request_analysis(
+        lambda: get_validation_parameters(format_prompt(text), generation_config=analysis_generation_config()),
+        'text')
+
+def run_fused_text_analysis(ocr, gate):
+    if gate['decision'] == 'skip':
+        return None
+    if gate['decision'] == 'local_cleanup':
+        # Texto já limpo localmente: basta o prompt de análise
+        prompt, kind = format_prompt(gate['clean_text']), 'text'
+    else:
+        prompt, kind = format_fused_prompt(ocr['text']), 'fused'
+    return request_analysis(
+        lambda: get_validation_parameters(prompt, generation_config=analysis_generation_config()), kind)
+
+def run_local_vision(gray, enabled):
+    """Pré-classificação visual local: 'skip' (dispensa a chamada visual ao Gemini) ou 'gemini'"""
+    if not enabled:
+        return {'enabled': False, 'decision': 'gemini'}
+    result = classify(gray)
+    LOCAL_VISION_DECISIONS.inc(decision=result['decision'])
+    return {'enabled': True, **result}
+
+def local_vision_fallback(error):
+    """Falha ou tempo limite da pré-classificação não interrompe a análise: segue para o Gemini"""
+    LOCAL_VISION_DECISIONS.inc(decision='error')
+    return {'enabled': True, 'decision': 'gemini', 'error': str(error)}
+
+def run_vision(payload, local, image_analysis=None):
+    if image_analysis is not None:
+        # Análise visual reaproveitada de uma quase-duplicata
+        return None, ParsedAnalysis(image_analysis, True, [], [], attempts=0)
+    if local['decision'] == 'skip':
+        # Resultado local no lugar da resposta do Gemini (sem resposta HTTP)
+        return None, ParsedAnalysis(local_image_analysis(local), True, [], [], attempts=0)
+    return request_analysis(lambda: analyze_image_with_gemini(payload[0], payload[1]), 'image')
+
+def build_analysis_stages(image, options, ocr_result=None, image_analysis=None):
+    """
+    Monta o grafo de etapas da análise. O ramo de texto (ocr -> text_gate -> cleanup ->
+    text_analysis, sem cleanup no modo 'fused') e o ramo visual (preprocess -> vision)
+    não dependem um do outro e rodam em paralelo, compartilhando a mesma DecodedImage.
+
+    Em imagens com vários quadros (GIF animado, TIFF com páginas), a etapa 'frames'
+    escolhe os quadros-chave antes dos dois ramos: o OCR lê os quadros-chave e o
+    ramo visual recebe o mosaico deles.
+
+    A etapa 'local_vision' pré-classifica a imagem (o quadro-chave mais exibido, em
+    animações) e, acima de LOCAL_VISION_THRESHOLD, a etapa 'vision' usa o resultado
+    local em vez de chamar o Gemini.
+
+    Com image_analysis (análise visual de uma quase-duplicata), a etapa 'vision' a
+    reaproveita sem chamar o Gemini nem a pré-classificação local.
+    """
+    local_vision = options['local_vision'] and image_analysis is None
+    if options['text_mode'] == 'fused':
+        text_stages = [
+            Stage('text_analysis', run_fused_text_analysis,
+                  depends_on=['ocr', 'text_gate'], timeout=STAGE_TIMEOUTS['text_analysis']),
+        ]
+    else:
+        text_stages = [
+            Stage('cleanup', run_cleanup,
+                  depends_on=['ocr', 'text_gate'], timeout=STAGE_TIMEOUTS['cleanup']),
+            Stage('text_analysis', run_text_analysis,
+                  depends_on=['cleanup', 'text_gate'], timeout=STAGE_TIMEOUTS['text_analysis']),
+        ]
+    if MULTI_FRAME_ENABLED and is_multi_frame(image.data):
+        source_stages = [
+            Stage('frames', lambda: select_keyframes(image.data),
+                  timeout=STAGE_TIMEOUTS['frames']),
+            Stage('ocr', lambda frames: run_frames_ocr(frames, ocr_result),
+                  depends_on=['frames'], timeout=STAGE_TIMEOUTS['ocr']),
+            Stage('preprocess', lambda frames: preprocess_frames(image, frames),
+                  depends_on=['frames'], timeout=STAGE_TIMEOUTS['preprocess']),
+            Stage('local_vision', lambda frames: run_local_vision(frames.representative(1)[0].gray, local_vision),
+                  depends_on=['frames'], timeout=STAGE_TIMEOUTS['local_vision'], fallback=local_vision_fallback),
+        ]
+    else:
+        source_stages = [
+            Stage('ocr', lambda: run_ocr(image, ocr_result),
+                  timeout=STAGE_TIMEOUTS['ocr']),
+            Stage('preprocess', lambda: preprocess_image(image),
+                  timeout=STAGE_TIMEOUTS['preprocess']),
+            Stage('local_vision', lambda: run_local_vision(image.gray, local_vision),
+                  timeout=STAGE_TIMEOUTS['local_vision'], fallback=local_vision_fallback),
+        ]
+    return [
+        *source_stages,
+        Stage('text_gate', lambda ocr: run_text_gate(ocr, options['text_gate']),
+              depends_on=['ocr']),
+        *text_stages,
+        Stage('vision', lambda payload, local: run_vision(payload, local, image_analysis),
+              depends_on=['preprocess', 'local_vision'], timeout=STAGE_TIMEOUTS['vision']),
+    ]
+
+def analysis_version():
+    """
+    Identifica o modelo, os prompts e o pré-processamento usados na análise. Faz parte
+    da chave do cache, para que resultados antigos não sejam reaproveitados após mudanças.
+    """
+    return make_cache_key(
+        GEMINI_MODEL.encode('utf-8'), CLEANUP_PROMPT, format_prompt(''), format_fused_prompt(''), VISION_PROMPT,
+        OCR_PREPROCESSING.stages, VISION_PREPROCESSING.stages, OCR_REGIONS, GEMINI_JSON_MODE, frame_settings(),
+        classifier_version()
+    )[:16]
+
+ANALYSIS_VERSION = analysis_version()
+
+def analysis_cache_key(image_data, options):
+    return make_cache_key(image_data, ANALYSIS_VERSION, *options_signature(options))
+
+def compute_image_hash(image_data):
+    """Hash perceptual da imagem (bytes ou DecodedImage), ou None se ela não puder ser decodificada"""
+    image = image_data if isinstance(image_data, DecodedImage) else DecodedImage(image_data)
+    try:
+        return compute_phash(image.gray)
+    except ValueError:
+        return None
+
+def find_near_duplicate(image_hash, options):
+    """
+    Procura no cache a análise de uma imagem visualmente equivalente, com análise visual.
+
+    Returns:
+        tuple: (resultado em cache ou None, distância de Hamming ou None)
+    """
+    if image_hash is None:
+        return None, None
+    signature = options_signature(options)
+    for distance, (match_signature, match_key) in near_duplicate_index.lookup(image_hash):
+        if match_signature != signature:
+            continue
+        cached = result_cache.get(match_key)
+        if cached is None:
+            # Resultado expirado ou removido do cache
+            near_duplicate_index.remove(match_key)
+        elif cached.get('image_analysis'):
+            return cached, distance
+    return None, None
+
+def get_cached_analysis(image_data, options):
+    """
+    Procura a análise da imagem (mesmos bytes, mesmas opções) no cache.
+
+    Returns:
+        dict: resposta em cache ou None
+    """
+    start = time.perf_counter()
+    cached = result_cache.get(analysis_cache_key(image_data, options))
+    if cached is None:
+        return None
+    response_data = dict(cached)
+    response_data['cache'] = 'hit'
+    response_data['timings'] = {'total': round((time.perf_counter() - start) * 1000, 3)}
+    return response_data
+
+def record_stage_metrics(timings, errors, ocr_reused=False):
+    """Registra a duração das etapas concluídas e as falhas no histograma de etapas (veja metrics.py)"""
+    for stage, ms in timings.items():
+        # OCR reaproveitado (modo lote) não mede o Tesseract
+        if not (stage == 'ocr' and ocr_reused):
+            STAGE_SECONDS.observe(ms / 1000, stage=stage)
+    for stage in errors:
+        STAGE_FAILURES.inc(stage=stage)
+
+def analysis_outputs(options, on_event=None):
+    """
+    Acompanha a conclusão das etapas da análise e monta as partes da resposta assim que
+    ficam prontas: o JSON de cada ramo já vem interpretado da etapa (veja request_analysis)
+    e o texto compreensível é definido pela primeira etapa que o conhece.
+
+    Args:
+        options: opções da análise
+        on_event: callback opcional (evento, dados) chamado a cada parte pronta
+
+    Returns:
+        tuple: (callback on_stage_complete do run_pipeline, dicionário com 'extracted_text',
+        'comprehensible_text', 'text_analysis', 'image_analysis', 'parse_seconds' e
+        'parsing' (tentativas, correções e problemas do JSON de cada ramo))
+    """
+    outputs = {'parse_seconds': 0.0, 'parsing': {}}
+
+    def emit(event, **data):
+        if on_event:
+            on_event(event, data)
+
+    def set_comprehensible_text(text):
+        if 'comprehensible_text' not in outputs:
+            outputs['comprehensible_text'] = text
+            emit('comprehensible_text', comprehensible_text=text)
+
+    def parse(name, result):
+        # result: (resposta, ParsedAnalysis) ou None se o ramo foi dispensado
+        parsed = result[1] if result is not None else None
+        if parsed is None:
+            return None
+        outputs['parse_seconds'] += parsed.parse_seconds
+        if result[0] is not None:
+            # Sem resposta HTTP, o resultado veio da pré-classificação local
+            outputs['parsing'][name] = parsed.report()
+        return parsed.data
+
+    def stage_completed(name, result):
+        if name == 'ocr':
+            outputs['extracted_text'] = result['text']
+            emit('extracted_text', extracted_text=result['text'])
+        elif name == 'text_gate':
+            # Sem chamada de limpeza ao Gemini, o texto compreensível já é conhecido
+            if result['decision'] == 'skip':
+                set_comprehensible_text('')
+            elif result['decision'] == 'local_cleanup':
+                set_comprehensible_text(result['clean_text'])
+        elif name == 'cleanup':
+            set_comprehensible_text(result)
+        elif name == 'text_analysis':
+            text_analysis = parse('text_analysis', result)
+            if options['text_mode'] == 'fused' and 'comprehensible_text' not in outputs:
+                # O texto limpo vem no mesmo JSON da análise; sem ele, mantém o texto do OCR
+                # (mesmo comportamento de extract_comprehensible_text quando a chamada falha)
+                comprehensible_text = outputs['extracted_text']
+                if text_analysis:
+                    comprehensible_text = (str(text_analysis.pop('comprehensible_text', '') or '').strip()
+                                           or outputs['extracted_text'])
+                set_comprehensible_text(comprehensible_text)
+            outputs['text_analysis'] = text_analysis
+            emit('text_analysis', text_analysis=text_analysis or None,
+                 text_average=rounded(average_probability(text_analysis)))
+        elif name == 'vision':
+            image_analysis = parse('image_analysis', result)
+            outputs['image_analysis'] = image_analysis
+            emit('image_analysis', image_analysis=image_analysis or None,
+                 image_average=rounded(average_probability(image_analysis)))
+
+    return stage_completed, outputs
+
+def rounded(value):
+    return round(value, 2) if value is not None else None
+
+def response_events(response_data):
+    """Eventos do streaming extraídos da resposta final, na ordem em que são enviados"""
+    averages = response_data.get('averages', {})
+    return [
+        ('extracted_text', {'extracted_text': response_data.get('extracted_text')}),
+        ('comprehensible_text', {'comprehensible_text': response_data.get('comprehensible_text')}),
+        ('image_analysis', {'image_analysis': response_data.get('image_analysis'),
+                            'image_average': averages.get('image_average')}),
+        ('text_analysis', {'text_analysis': response_data.get('text_analysis'),
+                           'text_average': averages.get('text_average')}),
+        ('averages', averages),
+    ]
+
+def run_image_analysis(image_data, options=None, use_cache=True, ocr_result=None, profile=False, on_event=None,
+                       cache_checked=False):
+    """
+    Executa o fluxo completo de análise de uma imagem.
+
+    Args:
+        image_data: bytes da imagem
+        options: opções da análise (veja analysis_options)
+        use_cache: se False, ignora resultados em cache (o novo resultado é armazenado)
+        ocr_result: resultado de ocr_image já calculado (ex: no processamento em lote)
+        profile: se True, inclui na resposta o campo 'resources' com o tempo de CPU de
+            cada etapa e a memória alocada (veja pipeline.measure_resources)
+        on_event: callback opcional chamado como (evento, dados) assim que cada parte da
+            resposta fica pronta: 'extracted_text', 'comprehensible_text', 'image_analysis'
+            e 'text_analysis', na ordem em que as etapas terminam. Respostas do cache não
+            geram eventos
+        cache_checked: se True, o chamador já procurou os mesmos bytes no cache (ex: modo
+            lote); só a busca por quase-duplicatas é feita
+
+    Returns:
+        tuple: (dicionário de resposta, status HTTP). O campo 'cache' indica
+        'hit', 'near_duplicate', 'miss' ou 'bypass'.
+    """
+    options = options or analysis_options()
+    start = time.perf_counter()
+    UPLOAD_BYTES.observe(len(image_data))
+    cache_key = analysis_cache_key(image_data, options)
+    # Decodificada sob demanda, uma única vez, e compartilhada pelo hash, OCR e pré-processamento
+    image = DecodedImage(image_data)
+    image_hash = None
+    near_duplicate, distance = None, None
+    if use_cache:
+        cached = None if cache_checked else get_cached_analysis(image_data, options)
+        if cached is not None:
+            ANALYSIS_RESULTS.inc(cache='hit')
+            return cached, 200
+        if NEAR_DUP_MAX_DISTANCE > 0:
+            image_hash = compute_image_hash(image)
+            near_duplicate, distance = find_near_duplicate(image_hash, options)
+    cache_status = 'near_duplicate' if near_duplicate is not None else 'miss' if use_cache else 'bypass'
+    ANALYSIS_RESULTS.inc(cache=cache_status)
+
+    stage_completed, outputs = analysis_outputs(options, on_event)
+    stages = build_analysis_stages(image, options, ocr_result,
+                                   image_analysis=near_duplicate['image_analysis'] if near_duplicate else None)
+    if profile:
+        cpu_times = {}
+        with measure_resources() as resources:
+            results, timings, errors = run_pipeline(stages, on_stage_complete=stage_completed, cpu_times=cpu_times)
+        resources['cpu_ms'] = {**cpu_times, 'total': round(sum(cpu_times.values()), 2)}
+    else:
+        results, timings, errors = run_pipeline(stages, on_stage_complete=stage_completed)
+    # A decodificação acontece dentro da primeira etapa que usa a imagem (ocr ou preprocess)
+    timings['decode'] = round(image.decode_ms, 2)
+    record_stage_metrics(timings, errors, ocr_reused=ocr_result is not None)
+
+    if errors:
+        # Mesmo comportamento do fluxo sequencial: qualquer falha interrompe a análise
+        failed = next(name for name in PIPELINE_STAGE_ORDER if name in errors)
+        raise errors[failed]
+
+    extracted_text = outputs['extracted_text']
+    comprehensible_text = outputs['comprehensible_text']
+    ocr_confidence = results['ocr']['confidence']
+    gate = results['text_gate']
+    # text_response é None quando o ramo de texto foi dispensado pela avaliação local
+    text_response = results['text_analysis'][0] if results['text_analysis'] is not None else None
+    # image_response é None quando a pré-classificação local dispensou a chamada visual
+    image_response = results['vision'][0]
+    # Interpretados ao fim de cada etapa (veja analysis_outputs)
+    text_analysis = outputs['text_analysis']
+    image_analysis = outputs['image_analysis']
+    STAGE_SECONDS.observe(outputs['parse_seconds'], stage='parse')
+    timings['parse'] = round(outputs['parse_seconds'] * 1000, 2)
+
+    VISION_PAYLOAD_BYTES.observe(results['preprocess'][2]['final_bytes'])
+    timings['total'] = round((time.perf_counter() - start) * 1000, 2)
+
+    # Calcular médias e resultado final
+    text_avg = average_probability(text_analysis)
+    image_avg = average_probability(image_analysis)
+
+    # Aplicar peso de 1.25 na média da análise de imagem
+    if image_avg is not None:
+        image_avg_weighted = image_avg * 1.25
+        # Limitar a 100 (caso ultrapasse)
+        image_avg_weighted = min(image_avg_weighted, 100)
+    else:
+        image_avg_weighted = None
+
+    # Calcular média final: (média_texto + média_imagem_ponderada) / 2
+    final_average = None
+    if text_avg is not None and image_avg_weighted is not None:
+        final_average = (text_avg + image_avg_weighted) / 2
+    elif text_avg is not None:
+        final_average = text_avg
+    elif image_avg_weighted is not None:
+        final_average = image_avg_weighted
+
+    # Montar resposta
+    response_data = {
+        'success': True,
+        'extracted_text': extracted_text,
+        'comprehensible_text': comprehensible_text,
+        'text_analysis': text_analysis if text_analysis else None,
+        'image_analysis': image_analysis if image_analysis else None,
+        'averages': {
+            'text_average': round(text_avg, 2) if text_avg is not None else None,
+            'image_average': round(image_avg, 2) if image_avg is not None else None,
+            'image_average_weighted': round(image_avg_weighted, 2) if image_avg_weighted is not None else None,
+            'final_average': round(final_average, 2) if final_average is not None else None
+        },
+        'timings': timings,
+        'vision_payload': results['preprocess'][2],
+        # Tempo (ms) de cada etapa do pré-processamento do OCR e do ramo visual
+        'preprocessing': {
+            'ocr': results['ocr'].get('preprocessing', {'preset': 'none', 'stages': {}}),
+            'vision': results['preprocess'][3]
+        }
+    }
+
+    response_data['text_mode'] = options['text_mode']
+    if 'frames' in results:
+        # Quadros decodificados, quadros-chave e os usados no OCR e no ramo visual
+        response_data['frames'] = {
+            **results['frames'].report(),
+            'ocr_frames': results['ocr'].get('frames', {}).get('ocr_frames'),
+            'vision_frames': results['preprocess'][2]['frames'],
+        }
+    response_data['text_gate'] = {key: value for key, value in gate.items() if key != 'clean_text'}
+    response_data['local_vision'] = results['local_vision']
+
+    if options['detailed']:
+        response_data['ocr_confidence'] = ocr_confidence
+        if 'region_detection' in results['ocr']:
+            # Regiões de texto detectadas (OCR_REGIONS), com o texto de cada uma
+            response_data['text_regions'] = {
+                **results['ocr']['region_detection'],
+                'regions': results['ocr'].get('regions', [])
+            }
+        # Tentativas, correções aplicadas ao JSON e divergências do formato em cada ramo
+        response_data['response_parsing'] = outputs['parsing']
+
+    # Verificar se houve erros
+    text_failed = text_response is not None and text_response.status_code != 200
+    image_failed = image_response is not None and image_response.status_code != 200
+    if text_failed or image_failed:
+        response_data['success'] = False
+        response_data['errors'] = {}
+        if text_failed:
+            response_data['errors']['text_analysis'] = {
+                'status_code': text_response.status_code,
+                'message': text_response.text
+            }
+        if image_failed:
+            response_data['errors']['image_analysis'] = {
+                'status_code': image_response.status_code,
+                'message': image_response.text
+            }
+
+        status_code = max(text_response.status_code if text_failed else 0,
+                          image_response.status_code if image_failed else 0)
+        response_data['cache'] = cache_status
+        if profile:
+            response_data['resources'] = resources
+        return response_data, status_code
+
+    # Apenas análises completas vão para o cache
+    result_cache.set(cache_key, response_data)
+    if NEAR_DUP_MAX_DISTANCE > 0:
+        if image_hash is None:
+            image_hash = compute_image_hash(image)
+        if image_hash is not None:
+            near_duplicate_index.add(image_hash, (options_signature(options), cache_key), key=cache_key)
+    response_data = dict(response_data)
+    response_data['cache'] = cache_status
+    if distance is not None:
+        response_data['near_duplicate_distance'] = distance
+    if profile:
+        response_data['resources'] = resources
+    return response_data, 200
+
 @app.route('/analyze-image', methods=['POST'])
 def analyze_image():
     """
@@ -316,7 +880,19 @@ def analyze_image():
     3. Validação e análise de credibilidade com Gemini (baseado no texto)
     4. Análise direta da imagem com Gemini (análise visual)
     
-    Aceita parâmetro opcional 'detailed=true' para incluir confiança do OCR
+    Os passos 1-3 (ramo de texto) e o passo 4 (ramo visual) rodam em paralelo;
+    o tempo de cada etapa, em ms, é retornado no campo 'timings'.
+    
+    Aceita parâmetro opcional 'detailed=true' para incluir confiança do OCR,
+    'no_cache=true' para ignorar o cache de resultados, 'text_mode=fused' para
+    limpar e analisar o texto em uma única chamada ao Gemini, 'text_gate=false'
+    para desativar a avaliação local do texto do OCR e 'profile=true' para incluir
+    o uso de CPU e memória da requisição (campo 'resources')
+
+    Com 'stream=sse' ou 'stream=ndjson' (ou Accept: text/event-stream /
+    application/x-ndjson), as partes são enviadas conforme ficam prontas: eventos
+    extracted_text, comprehensible_text, image_analysis, text_analysis e averages,
+    e por último 'result' com a mesma resposta do modo normal (veja streaming.py)
     """
     try:
         if 'image' not in request.files:
@@ -332,125 +908,221 @@ def analyze_image():
         if not image_data:
             return jsonify({'error': 'Arquivo de imagem vazio.'}), 400
         
-        # Determinar o tipo MIME da imagem
-        filename = image_file.filename.lower()
-        if filename.endswith('.png'):
-            mime_type = 'image/png'
-        else:
-            mime_type = 'image/jpeg'
-        
-        detailed = request.form.get('detailed', 'false').lower() == 'true'
-        
-        # 1. Extração de texto (OCR)
-        if detailed:
-            result = extract_text_with_confidence(image_data)
-            extracted_text = result['text']
-            ocr_confidence = result['confidence']
-        else:
-            extracted_text = extract_text_from_image(image_data)
-            ocr_confidence = None
-        
-        # 2. Análise baseada no texto extraído
-        text_response, comprehensible_text = process_extracted_text_with_gemini(extracted_text)
-        
-        # 3. Pré-processar a imagem antes de enviar ao Gemini
-        preprocessed_image_data = preprocess_image(image_data)
-        
-        # 4. Análise direta da imagem (pré-processada)
-        image_response = analyze_image_with_gemini(preprocessed_image_data, mime_type)
-        
-        # Processar resposta do texto
-        text_analysis = None
-        if text_response.status_code == 200:
-            gemini_result = text_response.json()
-            gemini_text = ""
-            if 'candidates' in gemini_result and len(gemini_result['candidates']) > 0:
-                if 'content' in gemini_result['candidates'][0]:
-                    parts = gemini_result['candidates'][0]['content'].get('parts', [])
-                    if parts and 'text' in parts[0]:
-                        gemini_text = parts[0]['text']
-            
-            text_analysis = extract_json_from_response(gemini_text)
-        
-        # Processar resposta da imagem
-        image_analysis = None
-        if image_response.status_code == 200:
-            gemini_result = image_response.json()
-            gemini_text = ""
-            if 'candidates' in gemini_result and len(gemini_result['candidates']) > 0:
-                if 'content' in gemini_result['candidates'][0]:
-                    parts = gemini_result['candidates'][0]['content'].get('parts', [])
-                    if parts and 'text' in parts[0]:
-                        gemini_text = parts[0]['text']
-            
-            image_analysis = extract_json_from_response(gemini_text)
-        
-        # Calcular médias e resultado final
-        text_avg = calculate_average_probability(text_analysis) if text_analysis else None
-        image_avg = calculate_average_probability(image_analysis) if image_analysis else None
-        
-        # Aplicar peso de 1.25 na média da análise de imagem
-        if image_avg is not None:
-            image_avg_weighted = image_avg * 1.25
-            # Limitar a 100 (caso ultrapasse)
-            image_avg_weighted = min(image_avg_weighted, 100)
-        else:
-            image_avg_weighted = None
-        
-        # Calcular média final: (média_texto + média_imagem_ponderada) / 2
-        final_average = None
-        if text_avg is not None and image_avg_weighted is not None:
-            final_average = (text_avg + image_avg_weighted) / 2
-        elif text_avg is not None:
-            final_average = text_avg
-        elif image_avg_weighted is not None:
-            final_average = image_avg_weighted
-        
-        # Montar resposta
-        response_data = {
-            'success': True,
-            'extracted_text': extracted_text,
-            'comprehensible_text': comprehensible_text,
-            'text_analysis': text_analysis if text_analysis else None,
-            'image_analysis': image_analysis if image_analysis else None,
-            'averages': {
-                'text_average': round(text_avg, 2) if text_avg is not None else None,
-                'image_average': round(image_avg, 2) if image_avg is not None else None,
-                'image_average_weighted': round(image_avg_weighted, 2) if image_avg_weighted is not None else None,
-                'final_average': round(final_average, 2) if final_average is not None else None
-            }
-        }
-        
-        if detailed:
-            response_data['ocr_confidence'] = ocr_confidence
-        
-        # Verificar se houve erros
-        if text_response.status_code != 200 or image_response.status_code != 200:
-            response_data['success'] = False
-            response_data['errors'] = {}
-            if text_response.status_code != 200:
-                response_data['errors']['text_analysis'] = {
-                    'status_code': text_response.status_code,
-                    'message': text_response.text
-                }
-            if image_response.status_code != 200:
-                response_data['errors']['image_analysis'] = {
-                    'status_code': image_response.status_code,
-                    'message': image_response.text
-                }
-            
-            status_code = max(text_response.status_code, image_response.status_code)
-            return jsonify(response_data), status_code
-        
-        return jsonify(response_data), 200
+        try:
+            options = analysis_options(request.form)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        use_cache = request.form.get('no_cache', 'false').lower() != 'true'
+        profile = request.form.get('profile', 'false').lower() == 'true'
+        try:
+            stream = stream_format(request.form.get('stream'), request.accept_mimetypes)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if stream:
+            return stream_analysis(
+                stream,
+                lambda on_event: run_image_analysis(image_data, options, use_cache, profile=profile, on_event=on_event),
+                response_events,
+                dumps=app.json.dumps
+            )
+
+        response_data, status_code = run_image_analysis(image_data, options, use_cache, profile=profile)
+        response = jsonify(response_data)
+        # Tempos das etapas também no cabeçalho padrão Server-Timing (visíveis nas ferramentas do navegador)
+        response.headers['Server-Timing'] = ', '.join(
+            f"{stage};dur={ms}" for stage, ms in response_data.get('timings', {}).items()
+        )
+        return response, status_code
         
+    except RequestEntityTooLarge:
+        # Tratado por request_too_large (413)
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def analyze_batch(items, options=None, use_cache=True, output_dir=BATCH_OUTPUT_DIR,
+                  ocr_workers=BATCH_OCR_WORKERS, concurrency=BATCH_CONCURRENCY, on_result=None):
+    """
+    Analisa várias imagens com OCR em processos paralelos e no máximo `concurrency`
+    imagens em análise no Gemini ao mesmo tempo. Veja batch.run_batch.
+    """
+    options = options or analysis_options()
+    lookup_cached = (lambda data: get_cached_analysis(data, options)) if use_cache else None
+    return run_batch(
+        items,
+        # A busca no cache pelos mesmos bytes já foi feita por lookup_cached
+        lambda data, ocr_result: run_image_analysis(data, options, use_cache, ocr_result, cache_checked=use_cache),
+        lookup_cached=lookup_cached,
+        output_dir=output_dir,
+        ocr_workers=ocr_workers,
+        concurrency=concurrency,
+        on_result=on_result
+    )
+
+@app.route('/analyze-batch', methods=['POST'])
+def analyze_batch_route():
+    """
+    Analisa várias imagens de uma vez.
+
+    Aceita as imagens no form-data (várias chaves "images") ou uma lista de caminhos
+    ("paths" no JSON ou no form-data), relativos a BATCH_BASE_DIR. Com save=true cada resultado é
+    gravado em um diretório próprio da requisição (BATCH_OUTPUT_DIR/<id>), para que um cliente não
+    sobrescreva os resultados de outro. Aceita também 'detailed', 'no_cache', 'text_mode' e 'text_gate'.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        options = {**request.form.to_dict(), **{k: v for k, v in data.items() if k != 'paths'}}
+        try:
+            analysis = analysis_options(options)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        use_cache = str(options.get('no_cache', 'false')).lower() != 'true'
+        save = str(options.get('save', 'false')).lower() == 'true'
+
+        items = [(f.filename, f.read()) for f in request.files.getlist('images') if f.filename]
+        paths = data.get('paths') or request.form.getlist('paths')
+        base_dir = os.path.realpath(BATCH_BASE_DIR)
+        for path in paths:
+            full_path = os.path.realpath(os.path.join(base_dir, path))
+            if os.path.commonpath([base_dir, full_path]) != base_dir or not os.path.isfile(full_path):
+                return jsonify({'error': f'Caminho inválido: {path}'}), 400
+            items.append((path, full_path))
+
+        if not items:
+            return jsonify({'error': 'Nenhuma imagem foi enviada. Use a chave "images" no form-data ou "paths".'}), 400
+
+        output_dir = os.path.join(BATCH_OUTPUT_DIR, uuid.uuid4().hex) if save else None
+        summary, results = analyze_batch(items, analysis, use_cache, output_dir)
+        if output_dir:
+            summary['output_dir'] = output_dir
+        return jsonify({'summary': summary, 'results': results}), 200
+
+    except RequestEntityTooLarge:
+        # Tratado por request_too_large (413)
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Fila de análises assíncronas (POST /jobs, GET /jobs/<id>); veja jobs.py
+job_manager = JobManager(lambda image_data, options, use_cache: run_image_analysis(image_data, options, use_cache))
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Enfileira a análise de uma imagem e responde imediatamente (202) com o id do trabalho.
+
+    Mesmos campos de /analyze-image ('image', 'detailed', 'no_cache', 'text_mode',
+    'text_gate'), mais 'priority' (high, normal ou low) e 'callback_url', que recebe
+    o trabalho concluído via POST (hosts públicos ou listados em JOB_CALLBACK_HOSTS).
+    Com a fila cheia, responde 429; com vários processos sem JOB_QUEUE_DB, 503.
+    """
+    try:
+        if 'image' not in request.files:
+            return jsonify({'error': 'Nenhuma imagem foi enviada. Use a chave "image" no form-data.'}), 400
+
+        image_data = request.files['image'].read()
+
+        if not image_data:
+            return jsonify({'error': 'Arquivo de imagem vazio.'}), 400
+
+        try:
+            options = analysis_options(request.form)
+            job = job_manager.submit(
+                image_data,
+                options,
+                use_cache=request.form.get('no_cache', 'false').lower() != 'true',
+                priority=request.form.get('priority', 'normal').lower(),
+                callback_url=request.form.get('callback_url') or None
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except QueueFullError:
+            response = jsonify({'error': f'Fila de análises cheia ({job_manager.max_depth} trabalhos). Tente novamente mais tarde.'})
+            response.headers['Retry-After'] = '5'
+            return response, 429
+        except JobStoreUnavailableError as e:
+            return jsonify({'error': str(e)}), 503
+
+        job['status_url'] = f"/jobs/{job['job_id']}"
+        response = jsonify(job)
+        response.headers['Location'] = job['status_url']
+        return response, 202
+
+    except RequestEntityTooLarge:
+        # Tratado por request_too_large (413)
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Estado do trabalho: queued (com a posição na fila), running, done ou failed.
+    Concluído, inclui 'result' e 'status_code' (os mesmos de /analyze-image).
+    Trabalhos concluídos expiram após JOB_RETENTION segundos (404).
+    """
+    try:
+        job = job_manager.get(job_id)
+    except JobStoreUnavailableError as e:
+        return jsonify({'error': str(e)}), 503
+    if job is None:
+        return jsonify({'error': 'Trabalho não encontrado ou expirado.'}), 404
+    return jsonify(job), 200
+
+@app.before_request
+def start_request_metrics():
+    metrics_registry.ensure_flusher()
+    g.request_start = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_start' in g:
+        # Rota (ex: /jobs/<job_id>) em vez da URL, para não criar uma série por id
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        method, status, start = request.method, response.status_code, g.request_start
+
+        def record():
+            HTTP_REQUESTS.inc(method=method, endpoint=endpoint, status=status)
+            HTTP_SECONDS.observe(time.perf_counter() - start, method=method, endpoint=endpoint)
+
+        if response.is_streamed:
+            # O corpo do stream só é produzido depois que a view retorna: a requisição termina
+            # quando o servidor fecha a resposta (fim do gerador ou desconexão do cliente)
+            def finish_stream():
+                record()
+                HTTP_IN_FLIGHT.dec()
+            response.call_on_close(finish_stream)
+            g.request_streamed = True
+        else:
+            record()
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc=None):
+    if 'request_start' in g and not g.get('request_streamed'):
+        HTTP_IN_FLIGHT.dec()
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas no formato do Prometheus: etapas, chamadas ao Gemini, cache e requisições (veja metrics.py)"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'Requisição maior que o limite de {MAX_UPLOAD_MB:g} MB (MAX_UPLOAD_MB).'}), 413
+
 @app.route('/health', methods=['GET'])
 def health():
 
-    return jsonify({'status': 'ok'}), 200
+    return jsonify({
+        'status': 'ok',
+        'cache': result_cache.stats(),
+        'gemini': gemini_client.stats(),
+        'near_duplicate_index': {'entries': len(near_duplicate_index)},
+        'jobs': job_manager.stats()
+    }), 200
 
 def cli_mode():
 
@@ -497,13 +1169,59 @@ def cli_mode():
         except Exception as e:
             print(f"\nErro: {str(e)}\n")
 
+def batch_mode(directory, output_dir, options, use_cache, ocr_workers, concurrency):
+
+    paths = list_images(directory)
+    print(f"=== Modo lote: {len(paths)} imagens em {directory} -> {output_dir} ===")
+
+    def progress(name, response_data, status_code, state):
+        status = 'ok' if status_code == 200 else f'erro {status_code}'
+        if response_data.get('cache') == 'hit':
+            status += ' (cache)'
+        print(f"[{state['done']}/{state['total']}] {os.path.basename(name)}: {status}")
+
+    summary, _ = analyze_batch(
+        [(path, path) for path in paths], options, use_cache, output_dir,
+        ocr_workers, concurrency, on_result=progress
+    )
+
+    print(f"\nConcluído em {summary['elapsed_seconds']}s ({summary['images_per_second']} imagens/s)")
+    print(f"Sucesso: {summary['succeeded']} (cache: {summary['cached']})  Falhas: {summary['failed']}")
+    for failure in summary['failures']:
+        print(f"  {failure['image']}: {failure['status_code']} {failure['error']}")
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Servidor Flask para Google Gemini API')
     parser.add_argument('--cli', action='store_true', help='Executa em modo CLI para entrada manual')
+    parser.add_argument('--batch', metavar='DIR', help='Analisa todas as imagens de um diretório e sai')
+    parser.add_argument('--output', default=BATCH_OUTPUT_DIR, help='Diretório dos resultados do modo lote')
+    parser.add_argument('--detailed', action='store_true', help='Inclui a confiança do OCR (modo lote)')
+    parser.add_argument('--text-mode', choices=TEXT_ANALYSIS_MODES, default=TEXT_ANALYSIS_MODE,
+                        help='Análise do texto em duas chamadas ou em uma (modo lote)')
+    parser.add_argument('--no-text-gate', action='store_true',
+                        help='Desativa a avaliação local do texto do OCR (modo lote)')
+    parser.add_argument('--no-cache', action='store_true', help='Ignora o cache de resultados (modo lote)')
+    parser.add_argument('--ocr-workers', type=int, default=BATCH_OCR_WORKERS, help='Processos de OCR (modo lote)')
+    parser.add_argument('--concurrency', type=int, default=BATCH_CONCURRENCY,
+                        help='Imagens em análise no Gemini ao mesmo tempo (modo lote)')
+    parser.add_argument('--dev', action='store_true', help='Usa o servidor de desenvolvimento do Flask')
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'waitress'), default=SERVER_BACKEND,
+                        help='Servidor de produção')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='Processos do servidor (gunicorn)')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='Threads por processo do servidor')
     args = parser.parse_args()
     
     if args.cli:
         cli_mode()
+    elif args.batch:
+        options = analysis_options({
+            'detailed': str(args.detailed),
+            'text_mode': args.text_mode,
+            'text_gate': str(not args.no_text_gate)
+        })
+        batch_mode(args.batch, args.output, options, not args.no_cache, args.ocr_workers, args.concurrency)
+    elif args.dev:
+        app.run(host=SERVER_HOST, port=SERVER_PORT, threaded=True)
     else:
-        app.run(host='0.0.0.0', port=int(SERVER_PORT) | 5000)
+        serve(app, args.server, SERVER_HOST, SERVER_PORT, args.workers, args.threads)
 
@@ -0,0 +1,135 @@
+"""
+Servidor de produção para a aplicação Flask.
+
+- gunicorn (Linux/macOS): vários processos (workers), cada um com um pool de
+  threads (gthread). A aplicação é importada uma vez no processo mestre
+  (preload: OpenCV, numpy e módulos carregados antes do fork) e cada worker
+  carrega os modelos do Tesseract logo após o fork, antes da primeira requisição.
+  SIGTERM encerra de forma graciosa: os workers terminam as requisições em
+  andamento (até SERVER_GRACEFUL_TIMEOUT segundos).
+- waitress (qualquer sistema, inclusive Windows): um processo com várias threads.
+
+Uso direto com o gunicorn: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+import sys
+import signal
+
+
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.getenv('SERVER_PORT') or 5000)
+# 'auto' (gunicorn se disponível, senão waitress), 'gunicorn' ou 'waitress'
+SERVER_BACKEND = os.getenv('SERVER_BACKEND', 'auto').lower()
+# OCR e pré-processamento usam CPU: um processo por núcleo. As chamadas ao Gemini
+# apenas esperam a rede: várias threads por processo
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', '0')) or os.cpu_count() or 1
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', '8'))
+# Deve ser maior que o tempo limite das etapas (STAGE_TIMEOUT_VISION = 90s)
+SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', '120'))
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', '30'))
+SERVER_KEEPALIVE = int(os.getenv('SERVER_KEEPALIVE', '5'))
+# Reinicia cada worker após esse número de requisições (0 = nunca), limitando o crescimento de memória
+SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', '0'))
+# Tamanho máximo do corpo da requisição (imagens enviadas), em MB
+MAX_UPLOAD_MB = float(os.getenv('MAX_UPLOAD_MB', '25'))
+MAX_CONTENT_LENGTH = int(MAX_UPLOAD_MB * 1024 * 1024)
+
+
+def ocr_pool_size(workers):
+    """Engines de OCR por worker: os núcleos divididos entre os workers (OCR_POOL_SIZE tem prioridade)"""
+    if os.getenv('OCR_POOL_SIZE'):
+        return int(os.getenv('OCR_POOL_SIZE'))
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def preload_worker(workers):
+    """Carrega os modelos do Tesseract no processo que vai atender as requisições"""
+    from image_processor import init_ocr_engine
+    init_ocr_engine(pool_size=ocr_pool_size(workers))
+
+
+def post_fork(server, worker):
+    preload_worker(server.cfg.workers)
+
+
+def on_starting(server):
+    # Retratos das métricas de execuções anteriores (METRICS_DIR) não devem ser somados
+    from metrics import registry
+    registry.clear_directory()
+    # Sem JOB_QUEUE_DB, a fila em memória não funciona com vários processos (veja jobs.py)
+    from jobs import set_server_processes
+    set_server_processes(server.cfg.workers)
+
+
+def gunicorn_options(host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS, threads=SERVER_THREADS):
+    return {
+        'bind': f"{host}:{port}",
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'timeout': SERVER_TIMEOUT,
+        'graceful_timeout': SERVER_GRACEFUL_TIMEOUT,
+        'keepalive': SERVER_KEEPALIVE,
+        'max_requests': SERVER_MAX_REQUESTS,
+        'max_requests_jitter': SERVER_MAX_REQUESTS // 10,
+        'post_fork': post_fork,
+        'on_starting': on_starting,
+        'accesslog': '-',
+    }
+
+
+def run_gunicorn(app, host, port, workers, threads):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options(host, port, workers, threads).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Application().run()
+
+
+def run_waitress(app, host, port, threads):
+    import waitress
+
+    preload_worker(1)
+
+    # waitress encerra com KeyboardInterrupt; SIGTERM (ex: docker stop) segue o mesmo caminho
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    waitress.serve(app, host=host, port=port, threads=threads, channel_timeout=SERVER_TIMEOUT,
+                   max_request_body_size=MAX_CONTENT_LENGTH)
+
+
+def serve(app, backend=SERVER_BACKEND, host=SERVER_HOST, port=SERVER_PORT,
+          workers=SERVER_WORKERS, threads=SERVER_THREADS):
+    """
+    Inicia o servidor de produção.
+
+    Args:
+        app: aplicação WSGI
+        backend: 'auto', 'gunicorn' ou 'waitress'
+        workers: processos (apenas gunicorn)
+        threads: threads por processo
+    """
+    if backend == 'auto':
+        try:
+            import gunicorn  # noqa: F401
+            backend = 'gunicorn' if sys.platform != 'win32' else 'waitress'
+        except ImportError:
+            backend = 'waitress'
+
+    print(f"Servidor {backend} em http://{host}:{port} "
+          f"({workers if backend == 'gunicorn' else 1} processos x {threads} threads)")
+    if backend == 'gunicorn':
+        run_gunicorn(app, host, port, workers, threads)
+    elif backend == 'waitress':
+        run_waitress(app, host, port, threads)
+    else:
+        raise ValueError(f"Servidor desconhecido: {backend}")
@@ -0,0 +1,123 @@
+"""
+Respostas em streaming para a análise de imagens: cada parte do resultado é enviada
+assim que fica pronta, em Server-Sent Events (text/event-stream) ou NDJSON (um
+objeto JSON por linha, application/x-ndjson).
+
+A análise roda em uma thread própria e publica os eventos em uma fila; o gerador da
+resposta os repassa ao cliente e, enquanto espera, envia batimentos periódicos para
+que proxies não encerrem a conexão ociosa.
+"""
+import os
+import json
+import queue
+import threading
+
+from flask import Response
+
+
+STREAM_FORMATS = {
+    'sse': 'text/event-stream',
+    'ndjson': 'application/x-ndjson',
+}
+# Intervalo (segundos) entre batimentos enquanto nenhuma etapa termina
+STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', '15'))
+
+_DONE = object()
+
+
+def stream_format(value=None, accept_mimetypes=None):
+    """
+    Escolhe o formato do streaming pelo campo 'stream' (sse, ndjson, false) ou, na
+    falta dele, pelo cabeçalho Accept.
+
+    Returns:
+        str ou None: 'sse', 'ndjson' ou None (resposta JSON única)
+
+    Raises:
+        ValueError: se o valor do campo 'stream' for inválido
+    """
+    if value is not None:
+        value = value.lower()
+        if value in ('', 'false', 'none'):
+            return None
+        if value not in STREAM_FORMATS:
+            raise ValueError(f"stream inválido: {value}. Use {', '.join(STREAM_FORMATS)} ou false.")
+        return value
+    if accept_mimetypes:
+        best = accept_mimetypes.best_match(['application/json', *STREAM_FORMATS.values()])
+        for name, mimetype in STREAM_FORMATS.items():
+            if best == mimetype:
+                return name
+    return None
+
+
+def encode_event(fmt, event, data, dumps=json.dumps):
+    if fmt == 'sse':
+        return f"event: {event}\ndata: {dumps(data)}\n\n"
+    return dumps({'event': event, 'data': data}) + '\n'
+
+
+def _heartbeat(fmt):
+    # Comentário no SSE; no NDJSON, uma linha vazia (os clientes ignoram linhas em branco)
+    return ': keep-alive\n\n' if fmt == 'sse' else '\n'
+
+
+def stream_analysis(fmt, run, final_events, dumps=json.dumps, heartbeat=STREAM_HEARTBEAT):
+    """
+    Resposta em streaming de uma análise.
+
+    Args:
+        fmt: 'sse' ou 'ndjson'
+        run: função chamada como run(on_event) que executa a análise, chama
+            on_event(evento, dados) a cada parte pronta e devolve (resposta, status HTTP)
+        final_events: função que recebe a resposta final e devolve a lista de
+            (evento, dados) esperados; os que não foram emitidos durante a análise
+            (ex: resposta do cache) são enviados antes do evento 'result'
+        dumps: serializador JSON (o mesmo da resposta não-streaming)
+
+    Eventos: as partes emitidas por run, as que faltarem de final_events e, por
+    último, 'result' com a resposta completa, idêntica à resposta JSON única, ou
+    'error' com {'error', 'status_code'} se a análise falhar. Se run devolver um
+    status diferente de 200 (ex: erro do Gemini em um dos ramos), o evento final é
+    'error' e traz também a resposta completa em 'result'.
+    """
+    events = queue.Queue()
+
+    def target():
+        try:
+            events.put((_DONE, run(lambda event, data: events.put((event, data)))))
+        except Exception as e:
+            events.put(('error', {'error': str(e), 'status_code': 500}))
+
+    def generate():
+        threading.Thread(target=target, name='analysis-stream', daemon=True).start()
+        emitted = set()
+        while True:
+            try:
+                event, data = events.get(timeout=heartbeat)
+            except queue.Empty:
+                yield _heartbeat(fmt)
+                continue
+            if event is _DONE:
+                response_data, status_code = data
+                if status_code != 200:
+                    errors = response_data.get('errors') or {}
+                    message = '; '.join(f"{name}: HTTP {error.get('status_code')}" for name, error in errors.items())
+                    yield encode_event(fmt, 'error', {'error': f"Falha na análise ({message or status_code})",
+                                                      'status_code': status_code, 'result': response_data}, dumps)
+                    return
+                for name, payload in final_events(response_data):
+                    if name not in emitted:
+                        yield encode_event(fmt, name, payload, dumps)
+                yield encode_event(fmt, 'result', response_data, dumps)
+                return
+            emitted.add(event)
+            yield encode_event(fmt, event, data, dumps)
+            if event == 'error':
+                return
+
+    return Response(generate(), mimetype=STREAM_FORMATS[fmt], headers={
+        'Cache-Control': 'no-cache',
+        # Desativa o buffer de proxies como o nginx, que atrasaria os eventos
+        'X-Accel-Buffering': 'no',
+    })
@@ -0,0 +1,39 @@
+import io
+import os
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def calls(monkeypatch, tmp_path):
+    recorded = []
+
+    def fake_analyze_batch(items, options, use_cache, output_dir):
+        recorded.append(output_dir)
+        return {'total': len(items), 'succeeded': len(items), 'failed': 0}, []
+
+    monkeypatch.setattr(server, 'analyze_batch', fake_analyze_batch)
+    monkeypatch.setattr(server, 'BATCH_OUTPUT_DIR', str(tmp_path))
+    return recorded
+
+
+def post_batch(**form):
+    data = {**form, 'images': (io.BytesIO(b'png'), 'meme-2012.png')}
+    return server.app.test_client().post('/analyze-batch', data=data, content_type='multipart/form-data')
+
+
+def test_http_batch_does_not_save_by_default(calls):
+    response = post_batch()
+    assert response.status_code == 200
+    assert calls == [None]
+    assert 'output_dir' not in response.get_json()['summary']
+
+
+def test_http_batch_saves_to_a_directory_per_request(calls, tmp_path):
+    first = post_batch(save='true').get_json()['summary']['output_dir']
+    second = post_batch(save='true').get_json()['summary']['output_dir']
+    assert calls == [first, second]
+    assert first != second
+    assert os.path.dirname(first) == str(tmp_path)
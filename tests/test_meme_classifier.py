@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+import pytest
+
+import meme_classifier
+
+
+class FakeNet:
+    def __init__(self, output):
+        self.output = np.array(output, dtype=np.float32)
+        self.inputs = []
+
+    def setInput(self, blob):
+        self.inputs.append(blob.shape)
+
+    def forward(self):
+        return self.output
+
+
+@pytest.fixture
+def onnx_model(monkeypatch):
+    """LOCAL_VISION_MODEL definido, com cv2.dnn.readNetFromONNX substituído por uma rede falsa"""
+    loads = []
+
+    def read_net(path):
+        loads.append(path)
+        return FakeNet([[0.5, 2.5]])
+
+    monkeypatch.setattr(meme_classifier, 'LOCAL_VISION_MODEL', 'modelo.onnx')
+    monkeypatch.setattr(meme_classifier, '_model', None)
+    monkeypatch.setattr(meme_classifier.cv2.dnn, 'readNetFromONNX', read_net)
+    return loads
+
+
+def run_with_timeout(func, timeout=5):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('value', func()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'a chamada não terminou (deadlock?)'
+    return result['value']
+
+
+def test_model_path_classifies_without_deadlock(onnx_model):
+    gray = np.full((300, 400), 128, np.uint8)
+    result = run_with_timeout(lambda: meme_classifier.classify(gray, threshold=80))
+    # softmax([0.5, 2.5])[1] = 88.08%
+    assert result['method'] == 'model'
+    assert result['probability'] == pytest.approx(88.08, abs=0.01)
+    assert result['decision'] == 'skip'
+    assert meme_classifier._model.inputs == [(1, 3, 224, 224)]
+
+
+def test_model_is_loaded_once_across_threads(onnx_model):
+    gray = np.zeros((64, 64), np.uint8)
+    threads = [threading.Thread(target=meme_classifier.model_probability, args=(gray,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert onnx_model == ['modelo.onnx']
+    assert len(meme_classifier._model.inputs) == 8
+
+
+def test_single_logit_output(onnx_model, monkeypatch):
+    monkeypatch.setattr(meme_classifier, '_model', FakeNet([0.0]))
+    assert meme_classifier.model_probability(np.zeros((32, 32), np.uint8)) == pytest.approx(50.0)
@@ -0,0 +1,47 @@
+import numpy as np
+
+import image_processor
+from preprocessing import PreprocessingPipeline
+
+
+class FakeEngine:
+    """Backend de OCR que devolve uma palavra e registra o tamanho de cada imagem recebida"""
+
+    name = 'fake'
+
+    def __init__(self):
+        self.calls = []
+
+    def image_to_data(self, image):
+        self.calls.append(np.asarray(image).shape[:2])
+        height, width = np.asarray(image).shape[:2]
+        return {'text': ['LEGENDA'], 'conf': [90], 'left': [0], 'top': [0], 'width': [width],
+                'height': [height], 'block_num': [1], 'par_num': [1], 'line_num': [1], 'word_num': [1]}
+
+
+def test_no_detected_regions_falls_back_to_full_image(monkeypatch):
+    monkeypatch.setattr(image_processor, 'detect_text_regions', lambda image, method: [])
+    engine = FakeEngine()
+    image = np.full((120, 200), 200, np.uint8)
+
+    result = image_processor.ocr_image(image, engine=engine, preprocessing=PreprocessingPipeline(),
+                                       regions='gradient')
+
+    assert engine.calls == [(120, 200)]
+    assert result['text'] == 'LEGENDA'
+    assert result['region_detection']['count'] == 0
+    assert result['region_detection']['fallback'] == 'no_regions'
+
+
+def test_detected_regions_are_read_separately(monkeypatch):
+    monkeypatch.setattr(image_processor, 'detect_text_regions',
+                        lambda image, method: [[10, 5, 100, 20], [10, 80, 120, 25]])
+    engine = FakeEngine()
+    image = np.full((120, 200), 200, np.uint8)
+
+    result = image_processor.ocr_image(image, engine=engine, preprocessing=PreprocessingPipeline(),
+                                       regions='gradient')
+
+    assert sorted(engine.calls) == [(20, 100), (25, 120)]
+    assert result['region_detection']['fallback'] is None
+    assert len(result['regions']) == 2
@@ -0,0 +1,35 @@
+import time
+
+from pipeline import Stage, run_pipeline
+
+
+def test_failed_stage_with_fallback_does_not_stop_dependents():
+    def broken():
+        raise RuntimeError('falhou')
+
+    stages = [
+        Stage('optional', broken, fallback=lambda error: {'error': str(error)}),
+        Stage('final', lambda optional: optional['error'], depends_on=['optional']),
+    ]
+    results, _, errors = run_pipeline(stages)
+    assert errors == {}
+    assert results['final'] == 'falhou'
+
+
+def test_timed_out_stage_with_fallback_uses_fallback():
+    stages = [
+        Stage('slow', lambda: time.sleep(1), timeout=0.05, fallback=lambda error: 'fallback'),
+        Stage('final', lambda slow: slow, depends_on=['slow']),
+    ]
+    results, _, errors = run_pipeline(stages)
+    assert errors == {}
+    assert results['final'] == 'fallback'
+
+
+def test_failed_stage_without_fallback_is_an_error():
+    def broken():
+        raise RuntimeError('falhou')
+
+    results, _, errors = run_pipeline([Stage('a', broken), Stage('b', lambda a: a, depends_on=['a'])])
+    assert set(errors) == {'a', 'b'}
+    assert results == {}
@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+from rate_limiter import RateLimiter, RateLimitTimeoutError, OUTPUT_TOKENS_ESTIMATE, IMAGE_TOKENS
+
+
+def test_rpm_1_allows_one_request_per_window():
+    limiter = RateLimiter(rpm=1, max_wait=0.5)
+    start = time.monotonic()
+    assert limiter.acquire(10) == pytest.approx(0.0, abs=0.01)
+    assert time.monotonic() - start < 0.1
+    # A próxima só cabe depois de um período inteiro
+    with pytest.raises(RateLimitTimeoutError):
+        limiter.acquire(10)
+
+
+def test_tpm_below_one_call_still_allows_a_call():
+    limiter = RateLimiter(tpm=OUTPUT_TOKENS_ESTIMATE, max_wait=0.5)
+    assert limiter.acquire(OUTPUT_TOKENS_ESTIMATE + IMAGE_TOKENS) == pytest.approx(0.0, abs=0.01)
+
+
+def test_small_limits_never_exceed_the_quota_in_one_period():
+    for rpm in (1, 2, 3, 10, 60):
+        limiter = RateLimiter(rpm=rpm)
+        requests_capacity = limiter._capacity[0]
+        assert requests_capacity >= 1
+        # Rajada + reabastecimento de um período
+        assert requests_capacity + limiter._rate[0] * limiter.period <= max(rpm, 1.5)
+
+
+def test_refill_lets_the_next_request_through():
+    limiter = RateLimiter(rpm=60, burst=0.0, period=1.0, max_wait=2.0)
+    limiter.acquire(10)
+    waited = limiter.acquire(10)
+    assert 0.0 < waited < 1.0
@@ -0,0 +1,36 @@
+import io
+
+from flask import Response
+
+import server
+from metrics import HTTP_IN_FLIGHT, HTTP_SECONDS
+
+
+def in_flight():
+    return sum(HTTP_IN_FLIGHT.snapshot().values())
+
+
+def duration_count():
+    return sum(entry[2] for key, entry in HTTP_SECONDS.snapshot().items() if key[1] == '/analyze-image')
+
+
+def test_streamed_response_stays_in_flight_until_the_stream_ends(monkeypatch):
+    seen = []
+
+    def fake_stream_analysis(fmt, run, final_events, dumps):
+        def generate():
+            seen.append((in_flight(), duration_count()))
+            yield 'data: {}\n\n'
+        return Response(generate(), content_type='text/event-stream')
+
+    monkeypatch.setattr(server, 'stream_analysis', fake_stream_analysis)
+    before = (in_flight(), duration_count())
+    response = server.app.test_client().post(
+        '/analyze-image', data={'image': (io.BytesIO(b'png'), 'meme.png'), 'stream': 'sse'},
+        content_type='multipart/form-data', buffered=False)
+    assert response.status_code == 200
+    response.get_data()
+    # Durante o stream a requisição ainda está em andamento e sem duração registrada
+    assert seen == [(before[0] + 1, before[1])]
+    response.close()
+    assert (in_flight(), duration_count()) == (before[0], before[1] + 1)
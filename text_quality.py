@@ -0,0 +1,149 @@
+"""
+Avaliação local da qualidade do texto extraído pelo OCR.
+
+Decide, antes de chamar o Gemini, se o texto merece análise:
+- 'skip': não há texto significativo (ex: meme puramente visual, só ruído do OCR);
+  o ramo de texto não chama o Gemini
+- 'local_cleanup': as linhas boas estão limpas e o resto é ruído evidente; o texto
+  é limpo localmente (descartando as linhas ruins) e a chamada de limpeza é dispensada
+- 'gemini_cleanup': texto ambíguo; segue o fluxo normal com limpeza pelo Gemini
+"""
+import os
+import re
+
+
+# Linhas com confiança média do OCR abaixo disso são consideradas ruído
+LINE_MIN_CONFIDENCE = float(os.getenv('TEXT_GATE_LINE_MIN_CONFIDENCE', '50'))
+# Mínimo de palavras reconhecíveis para o texto ser analisado
+MIN_WORDS = int(os.getenv('TEXT_GATE_MIN_WORDS', '2'))
+
+# Fração mínima de tokens válidos para uma linha ser considerada limpa / abaixo da qual é ruído
+CLEAN_LINE_RATIO = 0.75
+NOISE_LINE_RATIO = 0.3
+
+COMMON_WORDS = frozenset("""
+a o e é de do da dos das em no na nos nas um uma uns umas para pra com sem não sim que
+os as ao aos por mais se eu tu ele ela nós vocês eles elas você meu minha seu sua isso
+isto aquilo quando como porque mas ou já só também muito pouco todo toda todos tudo nada
+ser estar ter fazer ir vai vou foi era está estou tem tenho ver olha quem onde aqui ali
+the an and of to in is it you that he she was for on are with as i his her they be at
+one have has this from or had by not but what all were we when your can said there use
+each which do how their if will up other about out many then them these so some would
+me my no yes oh ok lol why who him its than now like just get got
+""".split())
+
+VOWELS = set('aeiouyáéíóúâêôãõàü')
+_TOKEN_RE = re.compile(r"[^\W_]+(?:['’-][^\W_]+)*", re.UNICODE)
+_CONSONANT_RUN_RE = re.compile(r"[^aeiouyáéíóúâêôãõàü]{6,}")
+_ALLOWED_PUNCTUATION = set(".,!?;:'\"’“”-()%$@#&/*…")
+_STRIP_CHARS = ' *_|~^`=+<>[]{}\\'
+
+
+def _token_is_valid(token):
+    """Palavra plausível em português/inglês ou número"""
+    if token.isdigit():
+        return True
+    lower = token.lower()
+    if lower in COMMON_WORDS:
+        return True
+    if len(token) < 3 or not token.isalpha():
+        return False
+    if not any(char in VOWELS for char in lower) or _CONSONANT_RUN_RE.search(lower):
+        return False
+    # Maiúsculas no meio de palavras minúsculas (ex: "aL", "tEst") são típicas de ruído do OCR
+    if not (token.islower() or token.isupper() or token.istitle()):
+        return False
+    return True
+
+
+def _charset_ratio(text):
+    chars = [char for char in text if not char.isspace()]
+    if not chars:
+        return 0.0
+    allowed = sum(1 for char in chars if char.isalnum() or char in _ALLOWED_PUNCTUATION)
+    return allowed / len(chars)
+
+
+def _line_stats(text, confidence=None):
+    tokens = _TOKEN_RE.findall(text)
+    valid = [token for token in tokens if _token_is_valid(token)]
+    # Caracteres que não formam nenhum token (ex: "§ ; ; /") contam como ruído
+    symbols = len(re.sub(r"[^\W_]|\s", '', text))
+    total = len(tokens) + symbols // 2
+    return {
+        'text': text,
+        'confidence': confidence,
+        'tokens': len(tokens),
+        'valid_tokens': len(valid),
+        # Linhas só com tokens curtos (ex: "_. OH") não bastam como texto
+        'substantial': any(token.isdigit() or len(token) >= 3 for token in valid),
+        'words': sum(1 for token in valid if not token.isdigit()),
+        'valid_ratio': len(valid) / total if total else 0.0,
+        'charset_ratio': _charset_ratio(text),
+    }
+
+
+def _is_clean(line):
+    if line['confidence'] is not None and line['confidence'] < LINE_MIN_CONFIDENCE:
+        return False
+    return line['substantial'] and line['valid_ratio'] >= CLEAN_LINE_RATIO and line['charset_ratio'] >= 0.9
+
+
+def _is_noise(line):
+    if line['confidence'] is not None and line['confidence'] < LINE_MIN_CONFIDENCE:
+        return True
+    return line['valid_ratio'] < NOISE_LINE_RATIO or not line['substantial']
+
+
+def evaluate_text_quality(ocr_result):
+    """
+    Avalia o texto do OCR.
+
+    Args:
+        ocr_result: saída de image_processor.ocr_image (usa as confianças por linha),
+            ou apenas o texto extraído (str)
+
+    Returns:
+        dict: {
+            'decision': 'skip', 'local_cleanup' ou 'gemini_cleanup',
+            'clean_text': texto com as linhas ruidosas removidas,
+            'words', 'clean_lines', 'noise_lines', 'valid_ratio', 'charset_ratio', 'mean_confidence'
+        }
+    """
+    if isinstance(ocr_result, str):
+        lines = [_line_stats(line) for line in ocr_result.split('\n') if line.strip()]
+        mean_confidence = None
+    else:
+        lines = [_line_stats(line['text'], line['confidence']) for line in ocr_result.get('lines', [])]
+        if not lines and ocr_result.get('text'):
+            lines = [_line_stats(line) for line in ocr_result['text'].split('\n') if line.strip()]
+        mean_confidence = ocr_result.get('confidence')
+
+    clean = [line for line in lines if _is_clean(line)]
+    noise = [line for line in lines if _is_noise(line)]
+    ambiguous = len(lines) - len(clean) - len(noise)
+
+    tokens = sum(line['tokens'] for line in lines)
+    words = sum(line['words'] for line in lines if not _is_noise(line))
+    all_text = ' '.join(line['text'] for line in lines)
+
+    clean_text = '\n'.join(line['text'].strip(_STRIP_CHARS) for line in clean)
+    clean_words = sum(line['words'] for line in clean)
+
+    if words < MIN_WORDS:
+        decision = 'skip'
+    elif ambiguous == 0 and clean_words >= MIN_WORDS:
+        decision = 'local_cleanup'
+    else:
+        decision = 'gemini_cleanup'
+
+    return {
+        'decision': decision,
+        'clean_text': clean_text,
+        'words': words,
+        'clean_lines': len(clean),
+        'noise_lines': len(noise),
+        'valid_ratio': round(sum(line['valid_tokens'] for line in lines) / tokens, 3) if tokens else 0.0,
+        'charset_ratio': round(_charset_ratio(all_text), 3),
+        'mean_confidence': mean_confidence,
+    }
@@ -0,0 +1,165 @@
+"""
+Localização de regiões de texto com OpenCV, para que o Tesseract processe apenas
+os recortes com texto em vez da imagem inteira (fotos e ilustrações dos memes
+são lentas de processar e geram as linhas de lixo do OCR).
+
+Dois detectores, ambos em CPU e sem modelos externos:
+- 'gradient': gradiente morfológico + limiar de Otsu; letras têm bordas fortes e densas
+- 'mser': regiões extremamente estáveis (MSER) com formato de caractere
+Em ambos, os candidatos são unidos na horizontal em faixas de texto, filtrados
+por tamanho/densidade e agrupados em blocos.
+"""
+import os
+
+import cv2
+import numpy as np
+
+
+# Detector usado pelo OCR: 'off' (imagem inteira), 'gradient' ou 'mser'
+OCR_REGIONS = os.getenv('OCR_REGIONS', 'off').lower()
+# Se as regiões cobrirem mais que esta fração da imagem, o OCR da imagem inteira é mais barato
+MAX_REGION_COVERAGE = float(os.getenv('OCR_REGIONS_MAX_COVERAGE', '0.6'))
+# Acima deste número de regiões a imagem provavelmente é uma foto com muita textura
+MAX_REGIONS = int(os.getenv('OCR_REGIONS_MAX', '40'))
+
+DETECTION_MAX_SIDE = 1000
+
+
+def _gradient_mask(small):
+    gradient = cv2.morphologyEx(small, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    return mask
+
+
+def _mser_mask(small):
+    mser = cv2.MSER_create()
+    mser.setMinArea(12)
+    mser.setMaxArea(max(60, small.shape[0] * small.shape[1] // 50))
+    _, boxes = mser.detectRegions(small)
+    mask = np.zeros_like(small)
+    for x, y, w, h in boxes:
+        # Formato de caractere: nem muito achatado nem muito alongado
+        if 0.1 <= w / h <= 4 and 6 <= h <= small.shape[0] // 4:
+            mask[y:y + h, x:x + w] = 255
+    return mask
+
+
+_DETECTORS = {
+    'gradient': _gradient_mask,
+    'mser': _mser_mask,
+}
+
+
+def _merge_boxes(boxes, margin):
+    """Une caixas que se sobrepõem depois de expandidas por margin (x, y)"""
+    boxes = [list(box) for box in boxes]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        while boxes:
+            x, y, w, h = boxes.pop()
+            changed = True
+            while changed:
+                changed = False
+                for other in list(boxes):
+                    ox, oy, ow, oh = other
+                    if (x - margin[0] < ox + ow and ox < x + w + margin[0]
+                            and y - margin[1] < oy + oh and oy < y + h + margin[1]):
+                        boxes.remove(other)
+                        right, bottom = max(x + w, ox + ow), max(y + h, oy + oh)
+                        x, y = min(x, ox), min(y, oy)
+                        w, h = right - x, bottom - y
+                        changed = merged = True
+            result.append([x, y, w, h])
+        boxes = result
+    return boxes
+
+
+def reading_order(boxes):
+    """
+    Ordena caixas [x, y, w, h] em ordem de leitura: de cima para baixo e, entre
+    caixas na mesma faixa horizontal (sobreposição vertical de mais da metade da
+    menor altura), da esquerda para a direita.
+    """
+    rows = []
+    for box in sorted(boxes, key=lambda box: box[1]):
+        for row in rows:
+            top = min(other[1] for other in row)
+            bottom = max(other[1] + other[3] for other in row)
+            overlap = min(bottom, box[1] + box[3]) - max(top, box[1])
+            if overlap > min(box[3], bottom - top) / 2:
+                row.append(box)
+                break
+        else:
+            rows.append([box])
+    return [box for row in rows for box in sorted(row, key=lambda box: box[0])]
+
+
+def detect_text_regions(gray, method='gradient', min_height=8):
+    """
+    Encontra blocos de texto candidatos.
+
+    Args:
+        gray: imagem uint8 em escala de cinza
+        method: 'gradient' ou 'mser'
+        min_height: altura mínima de uma linha de texto, em pixels da imagem original
+
+    Returns:
+        list: caixas [x, y, w, h] em ordem de leitura, com margem para o OCR
+    """
+    if method not in _DETECTORS:
+        raise ValueError(f"Detector de texto desconhecido: {method}. Disponíveis: {', '.join(_DETECTORS)}")
+
+    height, width = gray.shape[:2]
+    factor = min(1.0, DETECTION_MAX_SIDE / max(height, width))
+    small = cv2.resize(gray, (max(1, round(width * factor)), max(1, round(height * factor))),
+                       interpolation=cv2.INTER_AREA) if factor < 1 else gray
+
+    mask = _DETECTORS[method](small)
+    # Une as letras de uma mesma linha em uma faixa
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, small.shape[1] // 60), 1))
+    lines_mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(lines_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    candidates = []
+    small_min_height = max(4, min_height * factor)
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if h < small_min_height or w < h * 0.8 or h > small.shape[0] * 0.5:
+            continue
+        # Texto tem muitas bordas: fração de pixels marcados na faixa
+        density = cv2.countNonZero(mask[y:y + h, x:x + w]) / (w * h)
+        if density < 0.2:
+            continue
+        candidates.append([x, y, w, h])
+
+    if not candidates:
+        return []
+
+    # Altura típica das linhas: mediana ponderada pela largura, para que as muitas
+    # manchas pequenas de textura não dominem
+    heights = np.array([box[3] for box in candidates], dtype=np.float64)
+    order = np.argsort(heights)
+    cumulative = np.cumsum(np.array([box[2] for box in candidates], dtype=np.float64)[order])
+    line_height = float(heights[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+    blocks = _merge_boxes(candidates, (line_height, line_height * 0.6))
+
+    regions = []
+    for x, y, w, h in blocks:
+        # Blocos bem menores que a linha típica ou quase quadrados costumam ser textura
+        if h < line_height * 0.4 or (w < h * 1.5 and h < line_height * 1.5):
+            continue
+        pad = max(4, round(min(h, line_height) * 0.3))
+        x0 = max(0, round((x - pad) / factor))
+        y0 = max(0, round((y - pad) / factor))
+        x1 = min(width, round((x + w + pad) / factor))
+        y1 = min(height, round((y + h + pad) / factor))
+        regions.append([x0, y0, x1 - x0, y1 - y0])
+    return reading_order(regions)
+
+
+def region_coverage(regions, shape):
+    """Fração da área da imagem coberta pelas regiões (podem se sobrepor pouco; é uma estimativa)"""
+    area = shape[0] * shape[1]
+    return min(1.0, sum(w * h for _, _, w, h in regions) / area) if area else 0.0
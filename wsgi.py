@@ -0,0 +1,6 @@
+"""
+Ponto de entrada WSGI para servidores externos, ex:
+    gunicorn -c gunicorn.conf.py wsgi:app
+    waitress-serve --port=5000 wsgi:app
+"""
+from server import app  # noqa: F401